@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.main import build_eval_report
+from app.services.kb_store import kb_dir, load_kb
+from app.services.vector_store import search_top_k_with_scores
+from app.services.reranker import rerank_docs_with_scores
+from app.services.prompting import build_context_with_citations
+from app.services.gemini_llm import generate_answer_gemini
+from app.services.quality_gate import quality_gate_decision
+from app.services.retrieval_gate import load_gate_config, retrieval_gate_decision
+
+# ------------------------------------------------------------
+# Paths
+# ------------------------------------------------------------
+PROJECT_ROOT = Path(__file__).resolve().parents[3]  # .../rag-knowledge-base
+DEFAULT_STORAGE_DIR = str(PROJECT_ROOT / "storage")
+EVAL_CASES_PATH = Path(__file__).resolve().parent / "eval_cases.json"
+EVAL_OUT_DIR = Path(DEFAULT_STORAGE_DIR) / "eval_results"
+EVAL_OUT_DIR.mkdir(parents=True, exist_ok=True)
+
+# min_rerank_score values to sweep (what-if, no extra LLM calls)
+SWEEP_MIN_RERANK_SCORES = [0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2]
+
+
+def get_base_dir() -> str:
+    return os.getenv("KB_STORAGE_DIR", DEFAULT_STORAGE_DIR)
+
+
+def load_cases() -> List[Dict[str, Any]]:
+    if not EVAL_CASES_PATH.exists():
+        raise FileNotFoundError(f"Missing eval cases: {EVAL_CASES_PATH}")
+    return json.loads(EVAL_CASES_PATH.read_text(encoding="utf-8"))
+
+
+def run_one_case(case: Dict[str, Any], base_dir: str) -> Dict[str, Any]:
+    """
+    Run retrieval + the pre-generation gate, and ALWAYS call the LLM as well,
+    so we can see what the post-generation quality gate would have decided.
+    """
+    kb_id = case["kb_id"]
+    query = case["query"]
+
+    vs = load_kb(kb_id=kb_id, base_dir=base_dir)
+    scored = search_top_k_with_scores(vs, query=query, k=12)
+    reranked = rerank_docs_with_scores(query=query, docs=[d for d, _ in scored], top_k=3)
+    results = [d for d, _ in reranked]
+
+    config = load_gate_config(kb_dir(base_dir, kb_id))
+    pre_gate = retrieval_gate_decision(
+        rerank_scores=[s for _, s in reranked],
+        distances=[dist for _, dist in scored],
+        config=config,
+    )
+
+    context, _, source_map = build_context_with_citations(results)
+    answer = generate_answer_gemini(query=query, context=context)
+    report = build_eval_report(answer=answer, source_map=source_map, retrieved_docs=results)
+    post_gate = quality_gate_decision(report)
+
+    return {
+        "id": case["id"],
+        "kb_id": kb_id,
+        "query": query,
+        "gate_config": config,
+        "retrieval_gate": pre_gate,
+        "quality_gate": post_gate,
+        "llm_skipped": pre_gate["decision"] != "generate",
+        # the only bad outcome: we would have skipped an answer that gets accepted
+        "accepted_lost": pre_gate["decision"] != "generate" and post_gate["decision"] == "accept",
+    }
+
+
+def _what_if(reports: List[Dict[str, Any]], min_rerank_score: float) -> Dict[str, Any]:
+    skipped = 0
+    lost = 0
+    for r in reports:
+        best: Optional[float] = r["retrieval_gate"].get("best_rerank_score")
+        distance: Optional[float] = r["retrieval_gate"].get("best_vector_distance")
+        max_distance = r["gate_config"].get("max_vector_distance")
+        would_skip = (
+            best is None
+            or best < min_rerank_score
+            or (max_distance is not None and distance is not None and distance > float(max_distance))
+        )
+        if would_skip:
+            skipped += 1
+            if r["quality_gate"]["decision"] == "accept":
+                lost += 1
+    return {"min_rerank_score": min_rerank_score, "llm_calls_saved": skipped, "accepted_lost": lost}
+
+
+def summarize(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    total = len(reports)
+    if total == 0:
+        return {"total": 0}
+
+    saved = sum(1 for r in reports if r["llm_skipped"])
+    accepted_without_gate = sum(1 for r in reports if r["quality_gate"]["decision"] == "accept")
+    accepted_with_gate = sum(
+        1 for r in reports
+        if not r["llm_skipped"] and r["quality_gate"]["decision"] == "accept"
+    )
+
+    return {
+        "total": total,
+        "llm_calls_without_gate": total,
+        "llm_calls_with_gate": total - saved,
+        "llm_calls_saved": saved,
+        "llm_calls_saved_rate": saved / total,
+        "accept_rate_without_gate": accepted_without_gate / total,
+        "accept_rate_with_gate": accepted_with_gate / total,
+        "accepted_lost": [r["id"] for r in reports if r["accepted_lost"]],
+        "sweep": [_what_if(reports, t) for t in SWEEP_MIN_RERANK_SCORES],
+    }
+
+
+def main() -> None:
+    base_dir = get_base_dir()
+    reports = [run_one_case(case, base_dir=base_dir) for case in load_cases()]
+
+    out = {
+        "summary": summarize(reports),
+        "cases": reports,
+    }
+
+    out_path = EVAL_OUT_DIR / "retrieval_gate_eval.json"
+    out_path.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[OK] Wrote retrieval gate report: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,134 @@
 from __future__ import annotations
 
-import json, os, tempfile, time
+import asyncio, json, os, shutil, tempfile, time
 from pathlib import Path
-from typing import Any, Dict, Generator, List, Optional
+from typing import Any, Dict, Generator, List, Literal, Optional, Tuple
 
 from fastapi import FastAPI, UploadFile, File, Query, HTTPException
-from fastapi import FastAPI, UploadFile, File, Query, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 import traceback
+from contextlib import aclosing
 from pydantic import BaseModel
 from sse_starlette.sse import EventSourceResponse, ServerSentEvent
 
 from langchain_core.documents import Document
 
 from app.services.gemini_llm import generate_answer_gemini, stream_answer_gemini
-from app.services.ingestion import load_and_chunk_pdf
-from app.services.kb_store import kb_dir, kb_exists, load_kb, save_kb
-from app.services.manifest_store import file_sha256, has_sha256, load_manifest, upsert_file_record
+from app.services.ingestion import (
+    get_chunk_profile,
+    get_chunk_profiles,
+    get_default_chunk_profile,
+    kb_chunk_profile,
+    load_and_chunk_pdf,
+)
+from app.services.page_cache import page_cache_dir
+from app.services.rechunk import PagesNotCached, rechunk_kb
+from app.services.bulk_ingest import bulk_ingest, extract_zip
+from app.services.kb_store import (
+    get_resident_kb,
+    get_resident_kb_versioned,
+    kb_changed,
+    kb_dir,
+    kb_exists,
+    load_kb,
+    refresh_filters,
+    resident_kbs,
+    served_kb_version,
+    start_kb_watcher,
+    write_chunks,
+)
+from app.services.manifest_store import (
+    file_sha256,
+    has_sha256,
+    kb_generation,
+    load_manifest,
+    upsert_file_record,
+)
 from app.services.prompting import build_context_with_citations
-from app.services.reranker import rerank_docs
-from app.services.vector_store import build_faiss_index, search_top_k
-from app.services.chunk_store import save_chunks, load_chunk
-from app.services.citation_utils import validate_citations
+from app.services.reranker import rerank_docs, rerank_docs_with_scores
+from app.services.vector_store import build_faiss_index, embeddings, search_top_k, search_top_k_with_scores
+from app.services.chunk_store import load_chunk
+from app.services.citation_utils import StreamingCitationParser, validate_citations
 from app.services.eval_retrieval import evaluate_retrieval
 from app.services.quality_gate import quality_gate_decision, build_fallback_answer
 from app.services.kb_lookup import find_chunk_by_id
-from app.services.metrics import emit_quality_metrics
+from app.services.metrics import emit_quality_metrics, metrics_snapshot
+from app.services.index_io import index_mmap_enabled
+from app.services.llm_backend import aiter_deltas
+from app.services.json_codec import FastJSONResponse, dumps_str, shape_payload
+from app.services.sse_frames import MAX_FLUSH_MS, FrameStats, coalesce_tokens
+from app.services.proc_memory import process_memory
+from app.services.profiler import PROFILE_HEADER, is_truthy, list_profiles, profile_path, profile_request
+from app.services.retrieval_gate import load_gate_config, retrieval_gate_decision
+from app.services.deadline import Deadline, LLM_ERROR, LLM_TIMEOUT, is_timeout_error
+from app.services.error_taxonomy import DEADLINE_EXCEEDED, MODEL_ERROR, NODE_UNAVAILABLE
+from app.services.semantic_cache import cached_answer, cited_chunk_ids, get_semantic_cache
+from app.services.singleflight import SingleFlight, StreamSingleFlight, normalize_query
+from app.services.embedding_store import (
+    backfill_kb_embeddings,
+    embed_documents_cached,
+    load_kb_embeddings,
+    rebuild_kb_index,
+)
+from app.services.filter_index import build_filter_index, get_filter_index, save_filter_index
+from app.services.shard_search import ShardedKB, get_shard_pool, is_sharded, open_sharded_kb
+from app.services.shard_store import reshard_kb
+from app.services.remote_kb import (
+    NodesUnavailable, RemoteKB, get_retrieval_nodes, retrieval_node_enabled, serialize_hits,
+)
+from app.services.ephemeral_index import DocTokenNotFound, EphemeralIndex, get_ephemeral_cache
+from app.services.admission import (
+    API_KEY_HEADER,
+    PRIORITY_HEADER,
+    AdmissionRejected,
+    get_admission_controller,
+    request_priority,
+    request_tenant,
+)
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]  # .../rag-knowledge-base
 DEFAULT_STORAGE_DIR = str(PROJECT_ROOT / "storage")
 app = FastAPI(title="RAG Knowledge Base API")
+_ask_flight = SingleFlight("ask_kb")
+_stream_flight = StreamSingleFlight("ask_kb_stream")
+class SearchFilters(BaseModel):
+    # AND across fields, OR within a list
+    filenames: Optional[List[str]] = None
+    file_sha256: Optional[List[str]] = None
+    page_min: Optional[int] = None          # 0-based `page` metadata, inclusive
+    page_max: Optional[int] = None
+    ingested_after: Optional[float] = None  # unix seconds, manifest ingested_at
+    ingested_before: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return self.model_dump(exclude_none=True)
+
+
 class AskRequest(BaseModel):
     kb_id: str
     query: str
     fetch_k: int = 12
     top_k: int = 3
+    # latency budget for the whole pipeline; falls back to ASK_DEADLINE_MS
+    deadline_ms: Optional[int] = None
+    # restrict retrieval to matching chunks (applied inside the FAISS search)
+    filters: Optional[SearchFilters] = None
+    # compact: answer + source/chunk ids only; `fields` opts debug blocks back in
+    verbosity: Literal["compact", "full"] = "full"
+    fields: Optional[List[str]] = None
+
+    def filters_key(self) -> str:
+        return json.dumps(self.filters.as_dict(), sort_keys=True) if self.filters else ""
+
+    def shape_key(self) -> Tuple[str, Tuple[str, ...]]:
+        return self.verbosity, tuple(sorted(self.fields or ()))
+
+class NodeSearchRequest(BaseModel):
+    kb_id: str
+    vector: List[float]                     # query embedding, computed by the coordinator
+    k: int = 12
+    filters: Optional[SearchFilters] = None
 
 def build_eval_report(
     answer: str,
@@ -64,6 +158,77 @@ def build_eval_report(
 def get_base_dir() -> str:
     return os.getenv("KB_STORAGE_DIR", DEFAULT_STORAGE_DIR)
 
+
+def open_kb(kb_id: str, base_dir: str):
+    """The KB to search: on retrieval nodes when RETRIEVAL_NODES lists any for it, else local."""
+    return open_kb_versioned(kb_id, base_dir)[0]
+
+
+def open_kb_versioned(kb_id: str, base_dir: str):
+    """
+    open_kb plus the version of the snapshot it returns (what caches must be keyed on).
+    A remote KB has no local copy to version: None here, RemoteKB.version() asks the nodes.
+    """
+    nodes = get_retrieval_nodes(kb_id)
+    if nodes:
+        return RemoteKB(kb_id, nodes), None
+    # ✅ 查询路径用常驻（可 mmap）的 KB；ingest 仍用 load_kb 拿可写副本
+    return get_resident_kb_versioned(kb_id=kb_id, base_dir=base_dir)
+
+
+def cache_kb_version(kb_id: str, base_dir: str, deadline: Optional[Deadline] = None) -> Optional[str]:
+    """Version answer caches are keyed on: the served snapshot, or the nodes' generations (None: unknown, don't cache)."""
+    nodes = get_retrieval_nodes(kb_id)
+    if nodes:
+        return RemoteKB(kb_id, nodes).version(deadline)
+    return served_kb_version(kb_id, base_dir)
+
+
+def kb_id_filter(vs, kb_id: str, base_dir: str, filters: Optional[SearchFilters]):
+    """id_filter for search_top_k_with_scores: a row bitmap, or the filters dict for sharded/remote KBs."""
+    if filters is None or not filters.as_dict():
+        return None
+    if isinstance(vs, (ShardedKB, RemoteKB)):
+        return filters.as_dict()                # evaluated next to the rows (per shard / per node)
+    return get_filter_index(vs, kb_dir(base_dir, kb_id)).mask(filters.as_dict())
+
+
+def throttled_response(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(e), "reason": e.reason, "retry_after_s": e.retry_after_s},
+        headers={"Retry-After": str(e.retry_after_s)},
+    )
+
+
+async def admit(request: Request, kb_id: str):
+    """Wait for an admission slot; returns a Ticket (or None when admission control is off)."""
+    controller = get_admission_controller()
+    if controller is None:
+        return None
+    return await controller.acquire(
+        tenant=request_tenant(request.headers.get(API_KEY_HEADER), kb_id),
+        priority=request_priority(request.headers.get(PRIORITY_HEADER)),
+    )
+
+
+def get_stream_max_uncited_chars() -> int:
+    """
+    Opt-in: /ask-kb-stream aborts generation once this many chars arrive without
+    any [S#] citation. Default 0 (off): valid answers often cite at the end of a
+    long paragraph. An unknown S# always aborts unless STREAM_EARLY_ABORT=0.
+    """
+    try:
+        return int(os.getenv("STREAM_MAX_UNCITED_CHARS", "0"))
+    except ValueError:
+        return 0
+
+@app.on_event("startup")
+def start_background_tasks():
+    # per worker process (after the pre-fork parent forked it)
+    start_kb_watcher()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -83,119 +248,133 @@ async def upload_pdf(file: UploadFile = File(...), kb_id: str = "default"):
         os.remove(tmp_path)
 
 
-@app.post("/index-and-search")
-async def index_and_search(file: UploadFile = File(...), query: str = "What is the main topic?"):
+async def resolve_upload(file: Optional[UploadFile], doc_token: Optional[str]) -> Tuple[EphemeralIndex, bool]:
     """
-    Upload a PDF, build a FAISS index, then run semantic search.
+    Index for the upload-and-ask endpoints: a (re-)uploaded file is looked up by
+    its SHA-256 and only parsed + embedded on a miss; a doc_token from an earlier
+    response skips the upload entirely.
     """
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
+    cache = get_ephemeral_cache()
+    if file is not None:
+        data = await file.read()
+        try:
+            return await asyncio.to_thread(cache.get_or_build, data, file.filename or "")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if doc_token:
+        try:
+            return cache.require(doc_token), True
+        except DocTokenNotFound:
+            raise HTTPException(status_code=404, detail="doc_token is unknown or expired; upload the file again.")
+    raise HTTPException(status_code=400, detail="Provide a PDF file or a doc_token.")
 
-    try:
-        file_hash = file_sha256(tmp_path)
-        chunks = load_and_chunk_pdf(tmp_path,kb_id=kb_id,filename=file.filename,file_sha256=file_hash)
-        vector_store = build_faiss_index(chunks)
-        results = search_top_k(vector_store, query=query, k=3)
 
-        return {
-            "filename": file.filename,
-            "query": query,
-            "num_chunks": len(chunks),
-            "top_k": 3,
-            "results_preview": [
-                {
-                    "content_preview": r.page_content[:200],
-                    "metadata": r.metadata
-                }
-                for r in results
-            ]
-        }
-    finally:
-        os.remove(tmp_path)
+@app.post("/index-and-search")
+async def index_and_search(
+    file: Optional[UploadFile] = File(None),
+    query: str = "What is the main topic?",
+    doc_token: Optional[str] = None,
+):
+    """
+    Upload a PDF (or pass doc_token), build/reuse a FAISS index, then run semantic search.
+    """
+    index, cached = await resolve_upload(file, doc_token)
+    results = search_top_k(index.vector_store, query=query, k=3)
+
+    return {
+        "filename": index.filename,
+        "doc_token": index.doc_token,
+        "index_cached": cached,
+        "query": query,
+        "num_chunks": len(index.chunks),
+        "top_k": 3,
+        "results_preview": [
+            {
+                "content_preview": r.page_content[:200],
+                "metadata": r.metadata
+            }
+            for r in results
+        ]
+    }
 
 @app.post("/ask")
-async def ask(file: UploadFile = File(...), query: str = "What is the main topic?"):
+async def ask(
+    file: Optional[UploadFile] = File(None),
+    query: str = "What is the main topic?",
+    doc_token: Optional[str] = None,
+):
     """
     Day6: Retrieval + Rerank + Better Citations (non-streaming)
     """
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
+    index, cached = await resolve_upload(file, doc_token)
 
-    try:
-        file_hash = file_sha256(tmp_path)
-        chunks = load_and_chunk_pdf(tmp_path,kb_id=kb_id,filename=file.filename,file_sha256=file_hash)
-        vector_store = build_faiss_index(chunks)
+    # 1) recall more candidates
+    fetch_k = 12
+    candidates = search_top_k(index.vector_store, query=query, k=fetch_k)
 
-        # 1) recall more candidates
-        fetch_k = 12
-        candidates = search_top_k(vector_store, query=query, k=fetch_k)
+    # 2) rerank to top_k
+    top_k = 3
+    results = rerank_docs(query=query, docs=candidates, top_k=top_k)
 
-        # 2) rerank to top_k
-        top_k = 3
-        results = rerank_docs(query=query, docs=candidates, top_k=top_k)
+    # 3) build cited context
+    context, sources, source_map = build_context_with_citations(results)
 
-        # 3) build cited context
-        context, sources = build_context_with_citations(results)
+    # 4) generate grounded answer (must cite [S#])
+    answer = generate_answer_gemini(query=query, context=context)
 
-        # 4) generate grounded answer (must cite [S#])
-        answer = generate_answer_gemini(query=query, context=context)
-
-        return {
-            "filename": file.filename,
-            "query": query,
-            "num_chunks": len(chunks),
-            "fetch_k": fetch_k,
-            "top_k": top_k,
-            "answer": answer,
-            "context_preview": context[:600],
-            "sources": sources,
-        }
-    finally:
-        os.remove(tmp_path)
+    return {
+        "filename": index.filename,
+        "doc_token": index.doc_token,
+        "index_cached": cached,
+        "query": query,
+        "num_chunks": len(index.chunks),
+        "fetch_k": fetch_k,
+        "top_k": top_k,
+        "answer": answer,
+        "context_preview": context[:600],
+        "sources": sources,
+        "source_map": source_map,
+    }
 
 def sse(event: str, data: dict) -> str:
-    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\ndata: {dumps_str(data)}\n\n"
 
 @app.post("/ask-stream")
-async def ask_stream(file: UploadFile = File(...), query: str = "What is the main topic?"):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(await file.read())
-        tmp_path = tmp.name
+async def ask_stream(
+    file: Optional[UploadFile] = File(None),
+    query: str = "What is the main topic?",
+    doc_token: Optional[str] = None,
+):
+    index, cached = await resolve_upload(file, doc_token)
 
     def event_generator() -> Generator[str, None, None]:
         token_count = 0
         try:
             yield sse("debug", {"step": "start"})
-
-            file_hash = file_sha256(tmp_path)
-            chunks = load_and_chunk_pdf(tmp_path,kb_id=kb_id,filename=file.filename,file_sha256=file_hash)
-            yield sse("debug", {"step": "chunked", "num_chunks": len(chunks)})
-
-            vector_store = build_faiss_index(chunks)
-            yield sse("debug", {"step": "faiss_built"})
+            yield sse("debug", {"step": "indexed", "num_chunks": len(index.chunks), "index_cached": cached})
 
             fetch_k = 12
-            candidates = search_top_k(vector_store, query=query, k=fetch_k)
+            candidates = search_top_k(index.vector_store, query=query, k=fetch_k)
             yield sse("debug", {"step": "retrieved", "fetch_k": fetch_k, "got": len(candidates)})
 
             top_k = 3
             results = rerank_docs(query=query, docs=candidates, top_k=top_k)
             yield sse("debug", {"step": "reranked", "top_k": top_k, "got": len(results)})
 
-            context, sources = build_context_with_citations(results)
+            context, sources, source_map = build_context_with_citations(results)
             yield sse("debug", {"step": "context_built", "context_len": len(context)})
 
             # 先发 meta（前端可先显示引用卡片）
             yield sse("meta", {
                 "type": "meta",
-                "filename": file.filename,
+                "filename": index.filename,
+                "doc_token": index.doc_token,
                 "query": query,
-                "num_chunks": len(chunks),
+                "num_chunks": len(index.chunks),
                 "fetch_k": fetch_k,
                 "top_k": top_k,
                 "sources": sources,
+                "source_map": source_map,
             })
 
             yield sse("ping", {"t": time.time(), "msg": "before_gemini_stream"})
@@ -208,10 +387,6 @@ async def ask_stream(file: UploadFile = File(...), query: str = "What is the mai
             yield sse("error", {"type": "error", "message": str(e)})
         finally:
             yield sse("done", {"type": "done", "token_count": token_count})
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -220,6 +395,7 @@ async def ingest(
     file: UploadFile = File(...),
     kb_id: str = "default",
     mode: str = Query(default="overwrite", pattern="^(overwrite|append)$"),
+    profile: Optional[str] = Query(default=None, description="chunk profile (default: the KB's, else CHUNK_PROFILE)"),
 ):
     """
     Day7: Ingest PDF into a persistent KB (FAISS saved on disk).
@@ -235,11 +411,19 @@ async def ingest(
 
     try:
         file_hash = file_sha256(tmp_path)
-        chunks = load_and_chunk_pdf(tmp_path,kb_id=kb_id,filename=file.filename,file_sha256=file_hash)
+        saved_kb_dir = kb_dir(base_dir, kb_id)  # <base_dir>/kb/<kb_id>
+        profile = kb_chunk_profile(saved_kb_dir, profile, mode)
+        try:
+            get_chunk_profile(profile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # ✅ page text is cached per sha256, so re-chunking never needs the PDF again
+        chunks = load_and_chunk_pdf(
+            tmp_path, kb_id=kb_id, filename=file.filename, file_sha256=file_hash,
+            page_cache_dir=page_cache_dir(base_dir), profile=profile,
+        )
 
         # ✅ 1) append 去重：同一个 PDF 内容（sha256）已经 ingest 过就直接跳过
-        saved_kb_dir = kb_dir(base_dir, kb_id)  # <base_dir>/kb/<kb_id>
-        file_hash = file_sha256(tmp_path)
 
         # 只有当 KB 目录存在时才有“历史记录可去重”
         if mode == "append" and os.path.isdir(saved_kb_dir):
@@ -261,25 +445,23 @@ async def ingest(
                 }
 
         # ✅ 2) 正常 ingest：append -> load + add；overwrite -> rebuild
-        if mode == "append" and kb_exists(base_dir, kb_id):
-            vs = load_kb(kb_id=kb_id, base_dir=base_dir)
-            vs.add_documents(chunks)
-            saved_path = save_kb(vector_store=vs, kb_id=kb_id, base_dir=base_dir)
-            saved_chunks = save_chunks(kb_dir=saved_path, docs=chunks)
-        else:
-            vs = build_faiss_index(chunks)
-            saved_path = save_kb(vector_store=vs, kb_id=kb_id, base_dir=base_dir)
-            saved_chunks = save_chunks(kb_dir=saved_path, docs=chunks)
+        # ✅ vectors come from the shared content-hash cache; only new text is embedded
+        vectors = embed_documents_cached(chunks, base_dir=base_dir)
+        saved_path, saved_chunks, vs, touched_shards = write_chunks(kb_id, base_dir, chunks, vectors, mode)
 
         # ✅ 3) 更新 manifest（只在真正写入时更新）
-        os.makedirs(saved_path, exist_ok=True)
         manifest = upsert_file_record(
             kb_dir=saved_path,
             filename=file.filename,
             file_path=tmp_path,
             num_chunks=len(chunks),
             mode=mode,
+            chunk_profile=profile,
         )
+        # ✅ metadata filter bitmaps (needs manifest ingested_at)
+        refresh_filters(saved_path, vs, touched_shards)
+        # ✅ 4) 全部写完后才发布新 generation：其他 worker / 副本后台热加载
+        generation = kb_changed(kb_id, base_dir)
 
         return {
             "kb_id": kb_id,
@@ -288,6 +470,7 @@ async def ingest(
             "num_chunks": len(chunks),
             "saved_path": saved_path,
             "saved_chunks": saved_chunks,
+            "generation": generation,
             "manifest": {
                 "total_files": manifest["total_files"],
                 "total_chunks": manifest["total_chunks"],
@@ -301,6 +484,95 @@ async def ingest(
             pass
 
 
+@app.post("/ingest/bulk")
+async def ingest_bulk(
+    files: List[UploadFile] = File(...),
+    kb_id: str = "default",
+    mode: str = Query(default="append", pattern="^(overwrite|append)$"),
+    profile: Optional[str] = Query(default=None, description="chunk profile (default: the KB's, else CHUNK_PROFILE)"),
+):
+    """
+    Ingest many PDFs (and/or .zip archives of PDFs) with one index update:
+    parallel parsing, one embedding batch, index/chunks/manifest written once.
+    Files already in the KB (same sha256) are skipped.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="bulk_ingest_")
+    try:
+        sources: List[Tuple[str, str]] = []
+        for i, upload in enumerate(files):
+            name = upload.filename or f"upload_{i}.pdf"
+            path = os.path.join(tmp_dir, f"{i:06d}_{os.path.basename(name)}")
+            with open(path, "wb") as f:
+                shutil.copyfileobj(upload.file, f)
+            if name.lower().endswith(".zip"):
+                sources.extend(await asyncio.to_thread(extract_zip, path, path + ".d"))
+            elif name.lower().endswith(".pdf"):
+                sources.append((path, name))
+            else:
+                raise HTTPException(status_code=400, detail=f"not a PDF or zip archive: {name}")
+        # ✅ parse / embed / write 都是阻塞的，放到线程里，不占事件循环
+        return await asyncio.to_thread(bulk_ingest, kb_id, get_base_dir(), sources, mode, None, profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@app.post("/kb/{kb_id}/rechunk")
+async def rechunk(
+    kb_id: str,
+    profile: Optional[str] = Query(default=None, description="chunk profile (default: the KB's current one)"),
+):
+    """
+    Re-chunk + re-index a KB from its cached page text (no re-upload, no PDF
+    parsing) with another chunk profile; only new chunk text is embedded.
+    """
+    try:
+        return await asyncio.to_thread(rechunk_kb, kb_id, get_base_dir(), profile)
+    except PagesNotCached as e:
+        return JSONResponse(status_code=409, content={"error": str(e), "files": e.files})
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"KB not found: {kb_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/chunk-profiles")
+def chunk_profiles():
+    return {"default": get_default_chunk_profile(), "profiles": get_chunk_profiles()}
+
+
+@app.post("/kb/{kb_id}/reindex")
+def reindex_kb(
+    kb_id: str,
+    storage: Optional[str] = Query(default=None, pattern="^(flat|fp16|sq8|binary)$"),
+    shards: Optional[int] = Query(default=None, ge=1, le=64),
+):
+    """
+    Rebuild the FAISS index from the persisted embedding matrix + chunk store
+    (no embedding model calls unless chunk text changed).
+    storage converts the KB to another vector storage (flat / fp16 / sq8 / binary).
+    shards re-partitions it (1 = single index); sharded KBs are always rebuilt per shard.
+    """
+    base_dir = get_base_dir()
+    path = kb_dir(base_dir, kb_id)
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail=f"KB not found: {kb_id}")
+    try:
+        if not is_sharded(path) and load_kb_embeddings(path) is None:
+            # KB from before vectors were persisted: read them back from the index once
+            backfill_kb_embeddings(path, load_kb(kb_id=kb_id, base_dir=base_dir), base_dir=base_dir)
+        if shards is not None or is_sharded(path):
+            result = reshard_kb(path, base_dir=base_dir, num_shards=shards, storage=storage)
+        else:
+            result = rebuild_kb_index(path, base_dir=base_dir, storage=storage)
+        if not is_sharded(path):
+            save_filter_index(path, build_filter_index(load_kb(kb_id=kb_id, base_dir=base_dir), path))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"kb_id": kb_id, **result, "generation": kb_changed(kb_id, base_dir)}
+
+
 # Deprecated: use /kb/{kb_id}/chunk/{chunk_id}
 @app.get("/kb/chunk-legacy")
 async def get_chunk_legacy(
@@ -328,23 +600,128 @@ def get_chunk_rest(kb_id: str, chunk_id: str):
 
 
 @app.post("/ask-kb")
-async def ask_kb(req: AskRequest):
+async def ask_kb(req: AskRequest, request: Request, profile: bool = Query(False)):
+    # the budget starts on arrival: time queued for admission / a shared run counts against it
+    deadline = Deadline.from_request(req.deadline_ms)
+    try:
+        # profile=true / X-Profile: 1 -> always store; PROFILE_SLOW_MS -> store slow ones
+        forced = profile or is_truthy(request.headers.get(PROFILE_HEADER))
+        if forced:
+            # an explicitly profiled request runs (and is measured) on its own
+            return await _admitted(request, req.kb_id, lambda: asyncio.to_thread(_ask_kb_profiled, req, True, deadline))
+
+        # ✅ identical concurrent questions share one pipeline run; only that run takes an admission slot
+        base_dir = get_base_dir()
+        key = (req.kb_id, served_kb_version(req.kb_id, base_dir), normalize_query(req.query), req.fetch_k, req.top_k, req.deadline_ms, req.filters_key(), req.shape_key())
+        response, _ = await _ask_flight.do(
+            key, lambda: _admitted(request, req.kb_id, lambda: asyncio.to_thread(_ask_kb_profiled, req, False, deadline)),
+        )
+        return response
+    except AdmissionRejected as e:
+        # a rejected leader rejects its followers too: nobody ran the pipeline
+        return throttled_response(e)
+
+
+async def _admitted(request: Request, kb_id: str, fn):
+    # ✅ admission control: per-tenant limits, interactive before batch, fast 429
+    ticket = await admit(request, kb_id)
+    try:
+        return await fn()
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+def _ask_kb_profiled(req: AskRequest, forced: bool, deadline: Optional[Deadline] = None):
+    # runs in a worker thread; the profiler samples the thread it was started on
+    with profile_request(base_dir=get_base_dir(), kb_id=req.kb_id, query=req.query, forced=forced):
+        return _ask_kb(req, deadline)
+
+
+def _ask_kb_response(req: AskRequest, payload: Dict[str, Any]) -> FastJSONResponse:
+    return FastJSONResponse(shape_payload(payload, req.verbosity, req.fields), metric="ask_kb")
+
+
+def _ask_kb(req: AskRequest, deadline: Optional[Deadline] = None):
     try:
         kb_id = req.kb_id
         query = req.query
         fetch_k = req.fetch_k
         top_k = req.top_k
         base_dir = get_base_dir()
-
-        vs = load_kb(kb_id=kb_id, base_dir=base_dir)
-        candidates = search_top_k(vs, query=query, k=fetch_k)
-        results = rerank_docs(query=query, docs=candidates, top_k=top_k)
+        if deadline is None:
+            deadline = Deadline.from_request(req.deadline_ms)
+
+        # ✅ semantic cache: paraphrases of an accepted question reuse its answer
+        cache = get_semantic_cache()
+        cache_hit = None
+        query_vector = None
+        version = None
+        if cache is not None:
+            # the snapshot being served: during a reload that is still the previous generation
+            version = cache_kb_version(kb_id, base_dir, deadline)
+            query_vector = embeddings.embed_query(query)
+            if version is not None:
+                cache_hit = cache.lookup(kb_id, version, query_vector, params=(fetch_k, top_k, req.filters_key()))
+            if cache_hit and not cache.should_audit():
+                entry, similarity = cache_hit
+                return _ask_kb_response(req, cached_answer(entry, query, similarity))
+
+        # ✅ coordinator mode: vector search fans out to retrieval nodes, rerank + LLM stay here
+        vs, snapshot_version = open_kb_versioned(kb_id=kb_id, base_dir=base_dir)
+        if isinstance(vs, RemoteKB):
+            snapshot_version = version          # read from the nodes above; None = not cacheable
+        # ✅ metadata filters -> row bitmap, applied inside the FAISS search
+        id_filter = kb_id_filter(vs, kb_id, base_dir, req.filters)
+        # ✅ deadline-aware stages: smaller recall / partial rerank when time is short
+        scored = search_top_k_with_scores(
+            vs, query=query, k=fetch_k, embedding=query_vector, deadline=deadline, min_k=top_k, id_filter=id_filter,
+        )
+        candidates = [d for d, _ in scored]
+        reranked = rerank_docs_with_scores(query=query, docs=candidates, top_k=top_k, deadline=deadline)
+        results = [d for d, _ in reranked]
+
+        if cache_hit:
+            # audited hit: the cached answer is only valid if its evidence is still retrieved
+            entry, similarity = cache_hit
+            fresh_ids = {(d.metadata or {}).get("chunk_id") for d in results}
+            audit_ok = set(cited_chunk_ids(entry.payload)) <= fresh_ids
+            cache.record_audit(kb_id, entry, query, similarity, ok=audit_ok)
+            if audit_ok:
+                payload = cached_answer(entry, query, similarity)
+                payload["cache"]["audited"] = True
+                return _ask_kb_response(req, payload)
+
+        # ✅ pre-generation gate: weak retrieval never reaches the LLM
+        retrieval_gate = retrieval_gate_decision(
+            rerank_scores=[score for _, score in reranked],
+            distances=[dist for _, dist in scored],
+            config=load_gate_config(kb_dir(base_dir, kb_id)),
+        )
+        llm_called = retrieval_gate["decision"] == "generate" and deadline.llm_allowed()
+        gate_override = None
+        if retrieval_gate["decision"] != "generate":
+            gate_override = {"decision": retrieval_gate["decision"], "reason": retrieval_gate["reason"]}
+        elif not llm_called:
+            gate_override = {"decision": "fallback", "reason": DEADLINE_EXCEEDED}
 
         context, sources, source_map = build_context_with_citations(results)
-        answer = generate_answer_gemini(query=query, context=context)
+        answer = ""
+        if llm_called:
+            try:
+                answer = generate_answer_gemini(query=query, context=context, timeout_ms=deadline.llm_timeout_ms())
+            except Exception as e:
+                if not deadline.bounded:
+                    raise
+                # out of time, or an upstream error under a budget: degrade to the grounded fallback
+                traceback.print_exc()
+                deadline.degrade(LLM_TIMEOUT if is_timeout_error(e) else LLM_ERROR)
+                gate_override = {"decision": "fallback", "reason": MODEL_ERROR}
 
         report = build_eval_report(answer=answer, source_map=source_map, retrieved_docs=results)
         gate = quality_gate_decision(report)
+        if gate_override:
+            gate = gate_override
         final_answer = answer
         final_sources = sources
         final_source_map = source_map
@@ -370,7 +747,8 @@ async def ask_kb(req: AskRequest):
                 source_map=final_source_map,
                 retrieved_docs=results,
             )
-            gate["decision"] = "fallback"  # update decision to reflect fallback usage
+            # update decision to reflect fallback usage (a pre-generation reject stays reject)
+            gate["decision"] = "reject" if retrieval_gate["decision"] == "reject" else "fallback"
 
         # ✅ metrics for observability
         try:
@@ -379,6 +757,7 @@ async def ask_kb(req: AskRequest):
                 "citation_missing": len(final_report.get("citation", {}).get("missing", []) or []),
                 "retrieval_used_chunks": len(final_report.get("retrieval", {}).get("used_chunk_ids", []) or []),
                 "evidence_hit": final_report.get("evidence_hit"),
+                "llm_called": llm_called,
             }
             # Day 21: Emit logs for observability
             emit_quality_metrics(
@@ -391,7 +770,7 @@ async def ask_kb(req: AskRequest):
             print(f"Metrics calculation error: {e}")
             metrics = {}
 
-        return {
+        payload = {
             "kb_id": kb_id,
             "query": query,
             "fetch_k": fetch_k,
@@ -406,90 +785,229 @@ async def ask_kb(req: AskRequest):
             # ✅ debug: why model output was rejected
             "evaluation": report,
             "quality_gate": gate,
+            "retrieval_gate": retrieval_gate,
             "fallback_used": fallback_used,
             "metrics": metrics,
+            "deadline": deadline.report(),
+            "filters": req.filters.as_dict() if req.filters else None,
+            "retrieval_nodes": vs.last_report if isinstance(vs, RemoteKB) else None,
 
             # ✅ optional: evaluation of the final returned answer
             "final_evaluation": final_report,
         }
+        if cache is not None and snapshot_version is not None and not deadline.degradations:
+            # filed under the snapshot actually searched, never a newer generation it doesn't contain
+            cache.store(kb_id, snapshot_version, query, query_vector, params=(fetch_k, top_k, req.filters_key()), payload=payload)
+
+        # the cache keeps the full payload; trimming is per request.
+        # The response renders in __init__, so serialization shows up in profiles too
+        return _ask_kb_response(req, payload)
+    except NodesUnavailable as e:
+        return JSONResponse(
+            status_code=503,
+            content={"error": str(e), "reason": NODE_UNAVAILABLE, "retrieval_nodes": e.report},
+        )
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e), "traceback": traceback.format_exc()})
 
-@app.post("/ask-kb-stream")
-async def ask_kb_stream(kb_id: str, query: str = "What is the main topic?"):
-    base_dir = get_base_dir()
+async def _admitted_stream_events(request: Request, kb_id: str, query: str, base_dir: str, admission: "asyncio.Future[None]"):
+    """_ask_kb_stream_events behind an admission slot; `admission` resolves (or fails) once it is decided."""
+    try:
+        ticket = await admit(request, kb_id)
+    except AdmissionRejected as e:
+        admission.set_exception(e)
+        return
+    except BaseException:
+        admission.cancel()
+        raise
+    admission.set_result(None)
+    try:
+        async for item in _ask_kb_stream_events(kb_id, query, base_dir):
+            yield item
+    finally:
+        if ticket is not None:
+            ticket.release()
 
-    async def event_generator():
-        token_count = 0
-        final_text_parts = []
-        source_map = {}
-        sources = []
-        results = []
 
-        try:
-            yield ServerSentEvent(event="debug", data=json.dumps({"step": "start", "kb_id": kb_id}, ensure_ascii=False))
+def _ask_kb_stream_key(kb_id: str, query: str, fetch_k: int, top_k: int, base_dir: str):
+    return (kb_id, served_kb_version(kb_id, base_dir), normalize_query(query), fetch_k, top_k)
 
-            vs = load_kb(kb_id=kb_id, base_dir=base_dir)
-            yield ServerSentEvent(event="debug", data=json.dumps({"step": "kb_loaded"}, ensure_ascii=False))
 
-            fetch_k = 12
-            candidates = search_top_k(vs, query=query, k=fetch_k)
-            yield ServerSentEvent(event="debug", data=json.dumps({"step": "retrieved", "fetch_k": fetch_k, "got": len(candidates)}, ensure_ascii=False))
+async def _ask_kb_stream_events(kb_id: str, query: str, base_dir: str):
+    """
+    Producer for /ask-kb-stream: yields (event, data) pairs. Blocking work runs
+    in worker threads so one stream doesn't stall the event loop, and the
+    pairs can be fanned out to coalesced followers.
+    """
+    token_count = 0
+    final_text_parts = []
+    source_map = {}
+    sources = []
+    results = []
+    retrieval_gate = None
+    abort_reason = None
 
-            top_k = 3
-            results = rerank_docs(query=query, docs=candidates, top_k=top_k)
-            yield ServerSentEvent(event="debug", data=json.dumps({"step": "reranked", "top_k": top_k, "got": len(results)}, ensure_ascii=False))
+    try:
+        yield "debug", {"step": "start", "kb_id": kb_id}
 
-            context, sources, source_map = build_context_with_citations(results)
-            yield ServerSentEvent(event="debug", data=json.dumps({"step": "context_built", "context_len": len(context)}, ensure_ascii=False))
+        vs = await asyncio.to_thread(open_kb, kb_id=kb_id, base_dir=base_dir)
+        yield "debug", {"step": "kb_loaded"}
 
-            meta = {
-                "type": "meta",
-                "kb_id": kb_id,
-                "query": query,
-                "fetch_k": fetch_k,
-                "top_k": top_k,
-                "sources": sources,
-                "source_map": source_map,
-            }
-            yield ServerSentEvent(event="meta", data=json.dumps(meta, ensure_ascii=False))
+        fetch_k = 12
+        scored = await asyncio.to_thread(search_top_k_with_scores, vs, query=query, k=fetch_k)
+        candidates = [d for d, _ in scored]
+        yield "debug", {"step": "retrieved", "fetch_k": fetch_k, "got": len(candidates)}
 
-            yield ServerSentEvent(event="ping", data=json.dumps({"t": time.time(), "msg": "before_gemini_stream"}, ensure_ascii=False))
+        top_k = 3
+        reranked = await asyncio.to_thread(rerank_docs_with_scores, query=query, docs=candidates, top_k=top_k)
+        results = [d for d, _ in reranked]
+        yield "debug", {"step": "reranked", "top_k": top_k, "got": len(results)}
+
+        retrieval_gate = retrieval_gate_decision(
+            rerank_scores=[score for _, score in reranked],
+            distances=[dist for _, dist in scored],
+            config=load_gate_config(kb_dir(base_dir, kb_id)),
+        )
+        yield "debug", {"step": "retrieval_gate", **retrieval_gate}
 
-            for delta in stream_answer_gemini(query=query, context=context):
-                token_count += 1
-                final_text_parts.append(delta)
-                yield ServerSentEvent(event="token", data=json.dumps({"type": "token", "delta": delta}, ensure_ascii=False))
+        context, sources, source_map = build_context_with_citations(results)
+        yield "debug", {"step": "context_built", "context_len": len(context)}
 
-        except FileNotFoundError:
-            yield ServerSentEvent(event="error", data=json.dumps({"type": "error", "message": f"KB '{kb_id}' not found in {base_dir}"}, ensure_ascii=False))
-        except Exception as e:
-            yield ServerSentEvent(event="error", data=json.dumps({"type": "error", "message": str(e)}, ensure_ascii=False))
+        yield "meta", {
+            "type": "meta",
+            "kb_id": kb_id,
+            "query": query,
+            "fetch_k": fetch_k,
+            "top_k": top_k,
+            "sources": sources,
+            "source_map": source_map,
+        }
+
+        if retrieval_gate["decision"] == "generate":
+            yield "ping", {"t": time.time(), "msg": "before_gemini_stream"}
+
+            early_abort = is_truthy(os.getenv("STREAM_EARLY_ABORT", "1"))
+            max_uncited = get_stream_max_uncited_chars()
+            parser = StreamingCitationParser(source_map)
+            # closing the delta iterator (abort, cancellation) stops the upstream generation:
+            # no more tokens billed, and never a close() racing a next() in the worker thread
+            async with aclosing(aiter_deltas(stream_answer_gemini(query=query, context=context))) as deltas:
+                async for delta in deltas:
+                    token_count += 1
+                    final_text_parts.append(delta)
+                    yield "token", {"type": "token", "delta": delta}
+
+                    # ✅ validate citations while streaming, not after the fact
+                    for c in parser.feed(delta):
+                        yield "citation", {"type": "citation", **c}
+
+                    abort_reason = parser.violation(max_uncited_chars=max_uncited) if early_abort else None
+                    if abort_reason:
+                        yield "abort", {"type": "abort", "reason": abort_reason, "at_char": len(parser.text)}
+                        break
+
+    except asyncio.CancelledError:
+        # everybody hung up: no error / done events into a buffer that resuming clients replay
+        raise
+    except FileNotFoundError:
+        yield "error", {"type": "error", "message": f"KB '{kb_id}' not found in {base_dir}"}
+    except Exception as e:
+        yield "error", {"type": "error", "message": str(e)}
+
+    final_answer = "".join(final_text_parts).strip()
+
+    report = build_eval_report(answer=final_answer, source_map=source_map, retrieved_docs=results)
+    gate = quality_gate_decision(report)
+    if retrieval_gate and retrieval_gate["decision"] != "generate":
+        gate = {"decision": retrieval_gate["decision"], "reason": retrieval_gate["reason"]}
+    elif abort_reason:
+        gate = {"decision": "fallback", "reason": abort_reason}
+
+    fallback_used = gate["decision"] in ("reject", "fallback")
+    if fallback_used:
+        final_answer = build_fallback_answer(sources)
+
+    yield "done", {
+        "type": "done",
+        "token_count": token_count,
+        "final_answer": final_answer,
+        "evaluation": report,
+        "quality_gate": gate,
+        "retrieval_gate": retrieval_gate,
+        "fallback_used": fallback_used,
+        "aborted": abort_reason is not None,
+    }
+
+
+def _parse_event_id(event_id: Optional[str]) -> Optional[Tuple[str, int]]:
+    # SSE ids are "<stream_id>:<event index>"
+    sid, _, idx = (event_id or "").strip().rpartition(":")
+    if not sid or not idx.isdigit():
+        return None
+    return sid, int(idx)
+
+
+@app.post("/ask-kb-stream")
+async def ask_kb_stream(
+    request: Request,
+    kb_id: str,
+    query: str = "What is the main topic?",
+    granularity: Literal["token", "frame"] = Query("frame", description="token: one frame per model delta"),
+    flush_ms: Optional[int] = Query(None, ge=0, le=MAX_FLUSH_MS, description="frame window (default STREAM_FLUSH_MS)"),
+    last_event_id: Optional[str] = Query(None, description="resume after this event id (same as the Last-Event-ID header)"),
+):
+    base_dir = get_base_dir()
+
+    # ✅ reconnect with Last-Event-ID: replay the buffered stream, no second pipeline run
+    resume_from = _parse_event_id(request.headers.get("last-event-id") or last_event_id)
+    broadcast = _stream_flight.resume(resume_from[0]) if resume_from else None
+    # an abandoned stream was cancelled mid-answer: replaying it would end without done/error
+    if broadcast is not None and not broadcast.abandoned and broadcast.key[0] == kb_id and broadcast.key[2] == normalize_query(query):
+        start, shared, resumed = resume_from[1] + 1, True, True
+    else:
+        # ✅ identical concurrent questions share one retrieval + generation
+        key = _ask_kb_stream_key(kb_id, query, fetch_k=12, top_k=3, base_dir=base_dir)
+        admission = asyncio.get_running_loop().create_future()
+        broadcast, shared = _stream_flight.join(
+            key, lambda: _admitted_stream_events(request, kb_id, query, base_dir, admission),
+        )
+        if not shared:
+            broadcast.ready = admission
+        start, resumed = 0, False
+
+    # only the producer holds an admission slot (released when generation ends), so
+    # followers, replays and slow readers are never charged; a rejected run is a 429 for all
+    if broadcast.ready is not None:
+        try:
+            await asyncio.shield(broadcast.ready)
+        except AdmissionRejected as e:
+            return throttled_response(e)
+
+    async def event_generator():
+        stats = FrameStats()
+        try:
+            if resumed:
+                yield ServerSentEvent(event="debug", data=dumps_str({"step": "resumed", "from_event": start}))
+            elif shared:
+                yield ServerSentEvent(event="debug", data=dumps_str({"step": "coalesced"}))
+            if resume_from and not resumed:
+                yield ServerSentEvent(event="debug", data=dumps_str({"step": "resume_miss"}))
+            events = broadcast.subscribe(start)
+            # ✅ token deltas are merged per flush window: fewer frames / writes per answer
+            if granularity == "frame":
+                events = coalesce_tokens(events, flush_ms=flush_ms)
+            async for i, (event, data) in events:
+                t0 = time.thread_time()
+                if event == "done":
+                    data = {**data, "stream": stats.report()}
+                frame = ServerSentEvent(event=event, data=dumps_str(data), id=f"{broadcast.stream_id}:{i}").encode()
+                stats.count(event, data, time.thread_time() - t0)
+                yield frame
         finally:
-            final_answer = "".join(final_text_parts).strip()
-
-            report = build_eval_report(answer=final_answer, source_map=source_map, retrieved_docs=results)
-            gate = quality_gate_decision(report)
-
-            if gate["decision"] == "reject":
-                final_answer = build_fallback_answer(sources)
-
-            yield ServerSentEvent(
-                event="done",
-                data=json.dumps(
-                    {
-                        "type": "done",
-                        "token_count": token_count,
-                        "final_answer": final_answer,
-                        "evaluation": report,
-                        "quality_gate": gate,
-                    },
-                    ensure_ascii=False,
-                ),
-            )
+            stats.emit("ask_kb_stream")
 
-    return EventSourceResponse(event_generator())
+    return EventSourceResponse(event_generator(), headers={"X-Stream-Id": broadcast.stream_id})
 
 @app.get("/kb/chunk")
 def get_chunk(
@@ -498,7 +1016,7 @@ def get_chunk(
     include_content: bool = Query(True),
 ):
     base_dir = get_base_dir()
-    vs = load_kb(kb_id=kb_id, base_dir=base_dir)
+    vs = open_kb(kb_id=kb_id, base_dir=base_dir)
 
     doc = find_chunk_by_id(vs, chunk_id=chunk_id)
     if doc is None:
@@ -519,3 +1037,136 @@ def get_chunk(
     return payload
 
 
+@app.get("/profiles")
+def get_profiles(kb_id: Optional[str] = Query(None)):
+    return {"profiles": list_profiles(get_base_dir(), kb_id=kb_id)}
+
+
+@app.get("/profiles/{kb_id}/{name}")
+def download_profile(kb_id: str, name: str):
+    try:
+        path = profile_path(get_base_dir(), kb_id=kb_id, name=name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"profile not found: {kb_id}/{name}")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+
+@app.get("/metrics")
+def get_metrics():
+    return metrics_snapshot()
+
+
+@app.get("/memory")
+def get_memory():
+    """This worker's memory split into private (USS) and shared pages; see app.prefork."""
+    return {
+        "pid": os.getpid(),
+        "memory": process_memory(),
+        "resident_kbs": resident_kbs(),
+        "index_mmap": index_mmap_enabled(),
+    }
+
+
+@app.get("/cache/semantic")
+def get_semantic_cache_stats():
+    cache = get_semantic_cache()
+    if cache is None:
+        return {"enabled": False}
+
+    counters = metrics_snapshot()["counters"]
+    lookups = counters.get("semantic_cache.lookup", 0)
+    hits = counters.get("semantic_cache.hit", 0)
+    audits = counters.get("semantic_cache.audit", 0)
+    false_hits = counters.get("semantic_cache.false_hit", 0)
+    return {
+        "enabled": True,
+        **cache.stats(),
+        "lookups": lookups,
+        "hits": hits,
+        "hit_rate": (hits / lookups) if lookups else None,
+        "audits": audits,
+        "false_hits": false_hits,
+        "false_hit_rate": (false_hits / audits) if audits else None,
+    }
+
+
+@app.get("/admission")
+def get_admission_stats():
+    controller = get_admission_controller()
+    if controller is None:
+        return {"enabled": False}
+    return {"enabled": True, **controller.stats()}
+
+
+@app.get("/kb/{kb_id}/shards")
+def get_kb_shards_info(kb_id: str):
+    path = kb_dir(get_base_dir(), kb_id)
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail=f"KB not found: {kb_id}")
+    vs = open_sharded_kb(path)
+    if vs is None:
+        return {"kb_id": kb_id, "sharded": False, "num_shards": 1}
+    return {
+        "kb_id": kb_id,
+        "sharded": True,
+        **vs.layout,
+        "shards_present": len(vs.shard_dirs()),
+        "pool": get_shard_pool().stats(),
+    }
+
+
+# ---- retrieval-node mode (RETRIEVAL_NODE=1): vector search over this process's local KBs ----
+
+def _require_node_mode() -> None:
+    if not retrieval_node_enabled():
+        # 403, not 404: coordinators read 404 as "this node doesn't host the KB"
+        raise HTTPException(status_code=403, detail="retrieval node mode is off (RETRIEVAL_NODE=1)")
+
+
+@app.post("/node/search")
+def node_search(req: NodeSearchRequest):
+    _require_node_mode()
+    base_dir = get_base_dir()
+    if not kb_exists(base_dir, req.kb_id):
+        raise HTTPException(status_code=404, detail=f"KB not hosted here: {req.kb_id}")
+    t0 = time.perf_counter()
+    vs = get_resident_kb(kb_id=req.kb_id, base_dir=base_dir)
+    scored = search_top_k_with_scores(
+        vs, query="", k=req.k, embedding=req.vector, id_filter=kb_id_filter(vs, req.kb_id, base_dir, req.filters),
+    )
+    return {
+        "kb_id": req.kb_id,
+        "hits": serialize_hits(scored),
+        "search_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+    }
+
+
+@app.get("/node/chunk")
+def node_chunk(kb_id: str = Query(...), chunk_id: str = Query(...)):
+    _require_node_mode()
+    base_dir = get_base_dir()
+    if not kb_exists(base_dir, kb_id):
+        raise HTTPException(status_code=404, detail=f"KB not hosted here: {kb_id}")
+    doc = find_chunk_by_id(get_resident_kb(kb_id=kb_id, base_dir=base_dir), chunk_id=chunk_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"chunk_id not found: {chunk_id}")
+    return {"kb_id": kb_id, "chunk_id": chunk_id, "page_content": doc.page_content, "metadata": doc.metadata or {}}
+
+
+@app.get("/node/info")
+def node_info(kb_id: Optional[str] = Query(None, description="only this KB (coordinators read its generation)")):
+    _require_node_mode()
+    root = os.path.join(get_base_dir(), "kb")
+    kbs = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d))) if os.path.isdir(root) else []
+    if kb_id is not None:
+        kbs = [k for k in kbs if k == kb_id]
+    return {
+        "kbs": [
+            {
+                "kb_id": k,
+                "total_chunks": load_manifest(kb_dir(get_base_dir(), k)).get("total_chunks", 0),
+                "generation": kb_generation(kb_dir(get_base_dir(), k)),
+            }
+            for k in kbs
+        ],
+    }
@@ -0,0 +1,161 @@
+"""
+Pre-fork server: load the models and KBs once, then fork the HTTP workers.
+
+`uvicorn --workers N` starts N fresh interpreters, and each one imports
+app.main and loads its own embedding model, cross-encoder and KB indexes.
+Here the parent does that loading once and then forks. The children share
+those pages copy-on-write, so each extra worker costs only what it writes
+(request state, caches) instead of another copy of every model.
+
+    cd backend && python -m app.prefork --workers 4 --port 8000 --preload '*'
+    PREFORK_WORKERS=4 PRELOAD_KBS=default,tenant_a python -m app.prefork
+
+Use KB_INDEX_MMAP=1 as well: mmapped index files live in the page cache and
+are shared even by KBs that a worker (re)loads after the fork.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+# set before the tokenizers library is imported: its thread pool does not survive fork()
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+RESTART_BACKOFF_S = 1.0
+
+
+def get_prefork_workers() -> int:
+    try:
+        return max(1, int(os.getenv("PREFORK_WORKERS", "2")))
+    except ValueError:
+        return 2
+
+
+def _preload(kb_ids: List[str]) -> Dict[str, object]:
+    """Everything loaded here is shared by the workers. No inference runs here:
+    a torch / OpenMP thread pool started in the parent is not usable after fork."""
+    t0 = time.perf_counter()
+    import app.main  # noqa: F401  (loads the embedding model, builds the app)
+    from app.main import get_base_dir
+    from app.services.kb_store import preload_kbs
+    from app.services.reranker import load_reranker
+
+    load_reranker()
+    loaded = preload_kbs(get_base_dir(), kb_ids) if kb_ids else []
+
+    # move everything allocated so far out of the GC's reach: collections in the
+    # workers would otherwise write to (and so un-share) every object header
+    gc.collect()
+    gc.freeze()
+    return {"kbs": loaded, "load_s": round(time.perf_counter() - t0, 2)}
+
+
+def _bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket, args: argparse.Namespace) -> None:
+    import uvicorn
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        import torch
+
+        torch.set_num_threads(args.threads)
+    except ImportError:
+        pass
+
+    from app.main import app
+
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, args: argparse.Namespace) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(sock, args)
+        except BaseException:
+            import traceback
+
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=get_prefork_workers())
+    ap.add_argument("--preload", default=os.getenv("PRELOAD_KBS", ""),
+                    help="comma-separated kb_ids to load before forking, or '*' for all")
+    ap.add_argument("--threads", type=int, default=0,
+                    help="torch threads per worker (default: CPUs / workers, at least 1)")
+    ap.add_argument("--keep-alive", type=int, default=5)
+    ap.add_argument("--log-level", default="info")
+    args = ap.parse_args(argv)
+    args.threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    kb_ids = [k.strip() for k in args.preload.split(",") if k.strip()]
+    info = _preload(kb_ids)
+    sock = _bind(args.host, args.port)
+    print(f"[prefork] parent {os.getpid()} loaded in {info['load_s']}s, kbs={info['kbs']}; "
+          f"{args.workers} workers x {args.threads} threads on http://{args.host}:{args.port}", flush=True)
+
+    children: Dict[int, float] = {}
+    for _ in range(args.workers):
+        children[_spawn(sock, args)] = time.monotonic()
+
+    stopping = False
+
+    def _stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    # supervise: replace workers that die (OOM kill, crash) until asked to stop
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"[prefork] worker {pid} exited ({os.waitstatus_to_exitcode(status)}), restarting", flush=True)
+        if time.monotonic() - started < RESTART_BACKOFF_S:
+            time.sleep(RESTART_BACKOFF_S)
+        children[_spawn(sock, args)] = time.monotonic()
+
+    sock.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
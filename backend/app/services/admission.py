@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.services.error_taxonomy import QUEUE_FULL, RATE_LIMITED
+from app.services.metrics import incr, observe
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1}     # lower value is served first
+
+PRIORITY_HEADER = "X-Priority"
+API_KEY_HEADER = "X-API-Key"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing; maps to HTTP 429 with Retry-After."""
+
+    def __init__(self, reason: str, retry_after_s: float, detail: str = ""):
+        super().__init__(detail or reason)
+        self.reason = reason
+        self.retry_after_s = max(1, int(math.ceil(retry_after_s)))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(burst, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token; return 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tenant: str = field(compare=False)
+    future: "asyncio.Future[None]" = field(compare=False)
+
+
+class Ticket:
+    """One admitted request. release() is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", tenant: str, wait_ms: float):
+        self.controller = controller
+        self.tenant = tenant
+        self.wait_ms = wait_ms
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self.controller._release(self.tenant, time.monotonic() - self.started)
+
+
+class AdmissionController:
+    """
+    Admission control in front of the expensive pipeline (rerank + LLM):
+    - global concurrency slots, granted by priority class (interactive before
+      batch, FIFO within a class)
+    - per-tenant concurrency cap, so one tenant can't hold every slot; a
+      tenant at its cap doesn't block other tenants queued behind it
+    - optional per-tenant token-bucket rate limit
+    - bounded queue per priority class: when full, reject immediately (429)
+      with a Retry-After estimate instead of piling up requests
+    All state lives on the event loop; no locking needed.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        tenant_concurrency: int = 4,
+        tenant_rps: float = 0.0,
+        tenant_burst: float = 10.0,
+        max_queue: Optional[Dict[str, int]] = None,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.tenant_concurrency = max(1, tenant_concurrency)
+        self.tenant_rps = tenant_rps
+        self.tenant_burst = tenant_burst
+        self.max_queue = max_queue or {INTERACTIVE: 64, BATCH: 16}
+
+        self.active = 0
+        self.active_by_tenant: Dict[str, int] = {}
+        self.waiters: List[_Waiter] = []
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.avg_service_s = 1.0            # EWMA, used for Retry-After estimates
+        self._seq = itertools.count()
+
+    def _queued(self, priority: str) -> int:
+        p = PRIORITIES[priority]
+        return sum(1 for w in self.waiters if w.priority == p and not w.future.done())
+
+    def _can_run(self, tenant: str) -> bool:
+        return self.active < self.max_concurrency and self.active_by_tenant.get(tenant, 0) < self.tenant_concurrency
+
+    def _grant(self, tenant: str) -> None:
+        self.active += 1
+        self.active_by_tenant[tenant] = self.active_by_tenant.get(tenant, 0) + 1
+
+    def _release(self, tenant: str, service_s: float) -> None:
+        self.active -= 1
+        left = self.active_by_tenant.get(tenant, 1) - 1
+        if left > 0:
+            self.active_by_tenant[tenant] = left
+        else:
+            self.active_by_tenant.pop(tenant, None)
+        self.avg_service_s = 0.8 * self.avg_service_s + 0.2 * service_s
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        self.waiters = [w for w in self.waiters if not w.future.done()]
+        self.waiters.sort()
+        for w in self.waiters:
+            if self.active >= self.max_concurrency:
+                break
+            if self._can_run(w.tenant):
+                self._grant(w.tenant)
+                w.future.set_result(None)
+        self.waiters = [w for w in self.waiters if not w.future.done()]
+
+    async def acquire(self, tenant: str, priority: str = INTERACTIVE) -> Ticket:
+        priority = priority if priority in PRIORITIES else INTERACTIVE
+        t0 = time.monotonic()
+
+        if self.tenant_rps > 0:
+            bucket = self.buckets.setdefault(tenant, TokenBucket(self.tenant_rps, self.tenant_burst))
+            wait_s = bucket.take()
+            if wait_s > 0:
+                incr(f"admission.rejected.{RATE_LIMITED}")
+                raise AdmissionRejected(RATE_LIMITED, wait_s, f"rate limit exceeded for tenant {tenant!r}")
+
+        if not self.waiters and self._can_run(tenant):
+            self._grant(tenant)
+        else:
+            queued = self._queued(priority)
+            if queued >= self.max_queue.get(priority, 0):
+                incr(f"admission.rejected.{QUEUE_FULL}")
+                retry = (queued + self.active) * self.avg_service_s / self.max_concurrency
+                raise AdmissionRejected(QUEUE_FULL, retry, f"{priority} queue is full ({queued})")
+
+            fut: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+            self.waiters.append(_Waiter(PRIORITIES[priority], next(self._seq), tenant, fut))
+            self._dispatch()
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    # slot was granted right as the client went away: hand it back
+                    self._release(tenant, 0.0)
+                raise
+
+        wait_ms = (time.monotonic() - t0) * 1000.0
+        incr("admission.admitted")
+        observe("admission.queue_wait_ms", wait_ms)
+        observe(f"admission.queue_wait_ms.{priority}", wait_ms)
+        return Ticket(self, tenant, wait_ms)
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, priority: str = INTERACTIVE) -> AsyncIterator[Ticket]:
+        ticket = await self.acquire(tenant, priority)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "tenant_concurrency": self.tenant_concurrency,
+            "tenant_rps": self.tenant_rps,
+            "active_by_tenant": dict(self.active_by_tenant),
+            "queued": {p: self._queued(p) for p in PRIORITIES},
+            "max_queue": dict(self.max_queue),
+            "avg_service_s": round(self.avg_service_s, 3),
+        }
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """
+    Process-wide controller configured from ADMISSION_* env vars; off unless
+    ADMISSION_ENABLED=1 (the per-tenant cap would otherwise limit every KB to 4).
+    """
+    global _controller
+    if os.getenv("ADMISSION_ENABLED", "0").strip().lower() in ("0", "false", "no", "off"):
+        return None
+    if _controller is None:
+        _controller = AdmissionController(
+            max_concurrency=_env_int("ADMISSION_MAX_CONCURRENCY", 8),
+            tenant_concurrency=_env_int("ADMISSION_TENANT_CONCURRENCY", 4),
+            tenant_rps=_env_float("ADMISSION_TENANT_RPS", 0.0),
+            tenant_burst=_env_float("ADMISSION_TENANT_BURST", 10.0),
+            max_queue={
+                INTERACTIVE: _env_int("ADMISSION_MAX_QUEUE", 64),
+                BATCH: _env_int("ADMISSION_MAX_QUEUE_BATCH", 16),
+            },
+        )
+    return _controller
+
+
+def request_tenant(api_key: Optional[str], kb_id: str) -> str:
+    """Tenants are API keys when present (hashed, since stats are exposed), else the kb_id."""
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return f"kb:{kb_id}"
+
+
+def request_priority(header_value: Optional[str]) -> str:
+    v = (header_value or "").strip().lower()
+    return v if v in PRIORITIES else INTERACTIVE
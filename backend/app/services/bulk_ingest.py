@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import posixpath
+import shutil
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from app.services.embedding_store import embed_documents_cached
+from app.services.ingestion import get_chunk_profile, kb_chunk_profile, load_and_chunk_pdf
+from app.services.kb_store import kb_changed, kb_dir, refresh_filters, write_chunks
+from app.services.manifest_store import add_file_records, file_record, file_sha256, load_manifest
+from app.services.metrics import incr, observe
+from app.services.page_cache import page_cache_dir
+
+# (path on disk, filename recorded in chunk metadata / manifest)
+Source = Tuple[str, str]
+
+MAX_PARSE_WORKERS = 8
+# below this many files, starting worker processes costs more than it saves
+POOL_MIN_FILES = 8
+
+
+def get_bulk_parse_workers() -> int:
+    """BULK_PARSE_WORKERS: processes parsing PDFs in a bulk ingest (default: CPUs, at most 8)."""
+    default = min(MAX_PARSE_WORKERS, os.cpu_count() or 1)
+    try:
+        return max(1, int(os.getenv("BULK_PARSE_WORKERS", str(default))))
+    except ValueError:
+        return default
+
+
+def _is_pdf(name: str) -> bool:
+    return name.lower().endswith(".pdf")
+
+
+def extract_zip(zip_path: str, dest_dir: str) -> List[Source]:
+    """PDFs in a zip archive, extracted under dest_dir; filenames keep the path inside the archive."""
+    out: List[Source] = []
+    os.makedirs(dest_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_path) as zf:
+        for i, info in enumerate(zf.infolist()):
+            name = info.filename.replace("\\", "/")
+            if info.is_dir() or not _is_pdf(name) or name.startswith("__MACOSX/"):
+                continue
+            # never join archive names into paths (zip-slip): extract to a numbered file
+            target = os.path.join(dest_dir, f"{i:06d}.pdf")
+            with zf.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            out.append((target, posixpath.normpath("/" + name).lstrip("/")))
+    return out
+
+
+def collect_sources(path: str, extract_dir: str) -> List[Source]:
+    """PDFs to ingest from a directory (recursive), a .zip archive or a single PDF."""
+    if os.path.isdir(path):
+        out: List[Source] = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if _is_pdf(name):
+                    full = os.path.join(root, name)
+                    out.append((full, os.path.relpath(full, path).replace(os.sep, "/")))
+        return out
+    if zipfile.is_zipfile(path):
+        return extract_zip(path, os.path.join(extract_dir, os.path.basename(path) + ".d"))
+    if _is_pdf(path):
+        return [(path, os.path.basename(path))]
+    raise ValueError(f"Not a directory, zip archive or PDF: {path}")
+
+
+def run_per_file(
+    fn: Callable[..., List[Document]],
+    calls: List[Tuple[str, Dict[str, Any]]],
+    workers: int,
+) -> Tuple[List[Optional[List[Document]]], List[Dict[str, str]]]:
+    """
+    fn(**kwargs) for every (filename, kwargs) call, on a process pool when the
+    batch is big enough. fn must live in a light module (app.services.ingestion).
+    Returns results in call order (None where fn raised) and the failures.
+    """
+    results: List[Optional[List[Document]]] = [None] * len(calls)
+    failed: List[Dict[str, str]] = []
+
+    def fail(i: int, e: BaseException) -> None:
+        failed.append({"filename": calls[i][0], "error": f"{type(e).__name__}: {e}"[:300]})
+
+    if workers <= 1 or len(calls) < POOL_MIN_FILES:
+        for i, (_, kwargs) in enumerate(calls):
+            try:
+                results[i] = fn(**kwargs)
+            except Exception as e:
+                fail(i, e)
+        return results, failed
+
+    # spawn, not fork: the server process has threads and loaded models; the
+    # children only import app.services.ingestion
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(calls)), mp_context=multiprocessing.get_context("spawn"),
+    ) as ex:
+        futures = [ex.submit(fn, **kwargs) for _, kwargs in calls]
+        for i, f in enumerate(futures):
+            try:
+                results[i] = f.result()
+            except Exception as e:
+                fail(i, e)
+    return results, failed
+
+
+def bulk_ingest(
+    kb_id: str,
+    base_dir: str,
+    sources: List[Source],
+    mode: str = "append",
+    workers: Optional[int] = None,
+    profile: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Ingest many PDFs with one index update: files are parsed in parallel, all
+    chunks embedded in one batch, and the index, chunk store, embeddings and
+    manifest are each written once. Files whose sha256 is already in the KB
+    (append) or earlier in the batch are skipped.
+    """
+    t0 = time.perf_counter()
+    workers = workers or get_bulk_parse_workers()
+    path = kb_dir(base_dir, kb_id)
+    profile = kb_chunk_profile(path, profile, mode)
+    get_chunk_profile(profile)                      # unknown profile: fail before any work
+    cache_dir = page_cache_dir(base_dir)
+    known = set()
+    if mode == "append" and os.path.isdir(path):
+        known = {rec.get("sha256") for rec in load_manifest(path).get("files", [])}
+
+    items: List[Tuple[str, str, str]] = []
+    skipped: List[Dict[str, str]] = []
+    for src_path, name in sources:
+        sha = file_sha256(src_path)
+        if sha in known:
+            skipped.append({"filename": name, "sha256": sha})
+            continue
+        known.add(sha)
+        items.append((src_path, name, sha))
+    t_hash = time.perf_counter()
+
+    parsed, failed = run_per_file(load_and_chunk_pdf, [
+        (name, {"pdf_path": src_path, "kb_id": kb_id, "filename": name, "file_sha256": sha,
+                "page_cache_dir": cache_dir, "profile": profile})
+        for src_path, name, sha in items
+    ], workers)
+    t_parse = time.perf_counter()
+
+    chunks: List[Document] = []
+    records: List[Dict[str, Any]] = []
+    for (src_path, name, sha), docs in zip(items, parsed):
+        if docs is None:
+            continue
+        chunks.extend(docs)
+        records.append(file_record(name, sha, len(docs), mode))
+
+    report: Dict[str, Any] = {
+        "kb_id": kb_id,
+        "mode": mode,
+        "chunk_profile": profile,
+        "files": len(sources),
+        "ingested": len(records),
+        "skipped": skipped,
+        "failed": failed,
+        "num_chunks": len(chunks),
+        "parse_workers": min(workers, len(items)) if len(items) >= POOL_MIN_FILES else 1,
+    }
+    t_embed = t_write = t_parse
+    if chunks:
+        vectors = embed_documents_cached(chunks, base_dir=base_dir)
+        t_embed = time.perf_counter()
+        saved_path, _, vs, touched_shards = write_chunks(kb_id, base_dir, chunks, vectors, mode)
+        manifest = add_file_records(saved_path, records, mode, chunk_profile=profile)
+        refresh_filters(saved_path, vs, touched_shards)
+        report["generation"] = kb_changed(kb_id, base_dir)
+        report["manifest"] = {
+            "total_files": manifest["total_files"],
+            "total_chunks": manifest["total_chunks"],
+            "updated_at": manifest["updated_at"],
+        }
+        t_write = time.perf_counter()
+
+    elapsed = t_write - t0
+    report["timings_s"] = {
+        "hash": round(t_hash - t0, 3),
+        "parse": round(t_parse - t_hash, 3),
+        "embed": round(t_embed - t_parse, 3),
+        "write": round(t_write - t_embed, 3),
+        "total": round(elapsed, 3),
+    }
+    report["docs_per_s"] = round(len(records) / elapsed, 2) if elapsed > 0 else None
+    report["chunks_per_s"] = round(len(chunks) / elapsed, 2) if elapsed > 0 else None
+
+    incr("bulk_ingest.files", len(records))
+    incr("bulk_ingest.skipped", len(skipped))
+    incr("bulk_ingest.failed", len(failed))
+    observe("bulk_ingest.ms", elapsed * 1000.0)
+    return report
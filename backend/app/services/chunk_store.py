@@ -16,12 +16,16 @@ def chunk_path(kb_dir: str, chunk_id: str) -> str:
     safe_name = chunk_id.replace(":", "_")
     return os.path.join(chunks_dir(kb_dir), safe_name + CHUNK_EXT)
 
-def save_chunks(kb_dir: str, docs: Iterable[Document]) -> int:
+def save_chunks(kb_dir: str, docs: Iterable[Document], replace: bool = False) -> int:
+    """
+    Write one json per chunk and update chunk_index.json.
+    replace=True: the index lists only these chunks; files of other chunks are removed.
+    """
     os.makedirs(chunks_dir(kb_dir), exist_ok=True)
     index_path = os.path.join(kb_dir, "chunk_index.json")
 
     index: Dict[str, str] = {}
-    if os.path.exists(index_path):
+    if os.path.exists(index_path) and not replace:
         with open(index_path, "r", encoding="utf-8") as f:
             index = json.load(f)
 
@@ -52,6 +56,12 @@ def save_chunks(kb_dir: str, docs: Iterable[Document]) -> int:
     with open(index_path, "w", encoding="utf-8") as f:
         json.dump(index, f, ensure_ascii=False, indent=2)
 
+    if replace:
+        keep = {os.path.basename(p) for p in index.values()}
+        for name in os.listdir(chunks_dir(kb_dir)):
+            if name.endswith(CHUNK_EXT) and name not in keep:
+                os.remove(os.path.join(chunks_dir(kb_dir), name))
+
     return n
 
 def load_chunk(kb_dir: str, chunk_id: str) -> Dict[str, Any]:
@@ -71,6 +81,9 @@ def load_chunk(kb_dir: str, chunk_id: str) -> Dict[str, Any]:
         return json.load(f)
 
 def find_chunk_by_id(vs: FAISS, chunk_id: str) -> Optional[Document]:
+    find = getattr(vs.docstore, "find_by_chunk_id", None)
+    if find is not None:
+        return find(chunk_id)
     store = getattr(vs.docstore, "_dict", None)
     if not store:
         return None
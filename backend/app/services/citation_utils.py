@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import re
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
+
+from app.services.error_taxonomy import CITATION_MISS, PROMPT_VIOLATION
 
 # 1) 先抓所有方括号内容：[ ... ]
 BRACKET_PATTERN = re.compile(r"\[([^\]]+)\]")
@@ -66,4 +68,62 @@ def validate_citations(answer: str, source_map: Dict[str, str]) -> Dict[str, obj
         "unused": unused,
         "parse_ok": parse_ok,
         "ok": (len(missing) == 0) and parse_ok,
-    }
\ No newline at end of file
+    }
+
+class StreamingCitationParser:
+    """
+    Incremental version of extract_citations for token streams.
+
+    feed(delta) returns the citations that became complete with this delta
+    (first occurrence only). Brackets are parsed exactly like
+    extract_citations, so after the last delta `used` equals
+    extract_citations(full_text).
+    """
+
+    def __init__(self, source_map: Dict[str, str]):
+        self.source_map = source_map or {}
+        self.text = ""
+        self.used: List[str] = []
+        self.missing: List[str] = []
+        self._seen: Set[str] = set()
+        self._scan_pos = 0          # brackets before this offset are already parsed
+        self._last_cited_at = 0     # end offset of the last bracket that held an S#
+
+    def feed(self, delta: str) -> List[Dict[str, object]]:
+        self.text += delta or ""
+        new: List[Dict[str, object]] = []
+
+        for m in BRACKET_PATTERN.finditer(self.text, self._scan_pos):
+            self._scan_pos = m.end()
+            sids = SOURCE_ID_PATTERN.findall(m.group(1))
+            if sids:
+                self._last_cited_at = m.end()
+            for sid in sids:
+                if sid in self._seen:
+                    continue
+                self._seen.add(sid)
+                self.used.append(sid)
+                known = sid in self.source_map
+                if not known:
+                    self.missing.append(sid)
+                new.append({"source_id": sid, "chunk_id": self.source_map.get(sid), "known": known})
+
+        return new
+
+    @property
+    def uncited_chars(self) -> int:
+        """Characters streamed since the last citation (or since the start)."""
+        return len(self.text.rstrip()) - self._last_cited_at
+
+    def violation(self, max_uncited_chars: int = 0) -> Optional[str]:
+        """
+        Return a failure reason once the stream clearly breaks the answer
+        contract, else None:
+          - cites an S# that is not in source_map -> citation_miss
+          - keeps writing for max_uncited_chars without any citation -> prompt_violation
+        """
+        if self.missing:
+            return CITATION_MISS
+        if max_uncited_chars > 0 and self.uncited_chars > max_uncited_chars:
+            return PROMPT_VIOLATION
+        return None
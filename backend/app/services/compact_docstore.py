@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import os
+import sys
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from app.services.ingestion import make_chunk_id
+
+# metadata kept per chunk; everything else in a chunk's metadata is per file
+_CHUNK_KEYS = ("page", "page_label", "chunk_index", "chunk_id")
+_FILE_KEYS = ("kb_id", "filename", "file_sha256", "total_pages")
+_REQUIRED = ("kb_id", "filename", "file_sha256", "page", "chunk_index", "chunk_id")
+
+
+def compact_docstore_enabled() -> bool:
+    """COMPACT_DOCSTORE=0 keeps langchain's InMemoryDocstore (one metadata dict per chunk)."""
+    return os.getenv("COMPACT_DOCSTORE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class FileMeta:
+    """Metadata shared by every chunk of one file, stored once."""
+
+    __slots__ = ("kb_id", "filename", "file_sha256", "total_pages", "extra")
+
+    def __init__(self, kb_id: str, filename: str, file_sha256: str, total_pages: Any, extra: Dict[str, Any]):
+        self.kb_id = kb_id
+        self.filename = filename
+        self.file_sha256 = file_sha256
+        self.total_pages = total_pages
+        self.extra = extra            # PDF info (producer, title, source path, ...)
+
+
+class ChunkRecord:
+    """
+    One chunk: text + the few fields that differ per chunk + a file id.
+    chunk_id is derived (make_chunk_id); `extra` only holds values that
+    don't match the file (None for almost every chunk).
+    """
+
+    __slots__ = ("text", "file_id", "page", "page_label", "chunk_index", "extra")
+
+    def __init__(self, text: str, file_id: int, page: Any, page_label: Any, chunk_index: Any,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.text = text
+        self.file_id = file_id
+        self.page = page
+        self.page_label = page_label
+        self.chunk_index = chunk_index
+        self.extra = extra
+
+
+class _DocView(Mapping):
+    """Read-only id -> Document view for code that reaches into InMemoryDocstore._dict."""
+
+    def __init__(self, store: "CompactDocstore"):
+        self._store = store
+
+    def __getitem__(self, key: str) -> Document:
+        doc = self._store.search(key)
+        if not isinstance(doc, Document):
+            raise KeyError(key)
+        return doc
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.records)
+
+    def __len__(self) -> int:
+        return len(self._store.records)
+
+
+class CompactDocstore(Docstore, AddableMixin):
+    """
+    Drop-in replacement for InMemoryDocstore. Per-file metadata (kb_id,
+    filename, 64-char sha, total_pages, PDF info) lives once in `files`;
+    each chunk is a slotted ChunkRecord pointing at it. Documents are
+    materialized on lookup, so callers get a fresh metadata dict as before.
+    """
+
+    def __init__(self) -> None:
+        self.files: List[FileMeta] = []
+        self.records: Dict[str, ChunkRecord] = {}
+        self._file_ids: Dict[Tuple[Any, ...], int] = {}
+
+    # ---- pickling (index.pkl) ---------------------------------------------
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"files": self.files, "records": self.records}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.files = state["files"]
+        self.records = state["records"]
+        self._file_ids = {self._file_key_of(f): i for i, f in enumerate(self.files)}
+
+    # ---- encode / decode ----------------------------------------------------
+
+    @staticmethod
+    def _file_key_of(f: FileMeta) -> Tuple[Any, ...]:
+        return (f.kb_id, f.file_sha256, f.filename, f.total_pages, tuple(f.extra))
+
+    def _file_id(self, md: Dict[str, Any]) -> int:
+        extra = {k: v for k, v in md.items() if k not in _CHUNK_KEYS and k not in _FILE_KEYS}
+        key = (md["kb_id"], md["file_sha256"], md["filename"], md.get("total_pages"), tuple(extra))
+        fid = self._file_ids.get(key)
+        if fid is None:
+            fid = len(self.files)
+            self.files.append(FileMeta(
+                sys.intern(str(md["kb_id"])), md["filename"], sys.intern(str(md["file_sha256"])),
+                md.get("total_pages"), extra,
+            ))
+            self._file_ids[key] = fid
+        return fid
+
+    def _encode(self, doc: Document) -> ChunkRecord:
+        md = doc.metadata or {}
+        if any(k not in md for k in _REQUIRED):
+            # not produced by load_and_chunk_pdf: keep the metadata as-is
+            return ChunkRecord(doc.page_content, -1, None, None, None, dict(md))
+
+        fid = self._file_id(md)
+        f = self.files[fid]
+        label = md.get("page_label")
+        rec = ChunkRecord(
+            doc.page_content, fid, md["page"],
+            sys.intern(label) if isinstance(label, str) else label,
+            md["chunk_index"],
+        )
+        diff = {k: v for k, v in md.items() if k in f.extra and f.extra[k] != v}
+        if md["chunk_id"] != make_chunk_id(f.kb_id, f.file_sha256, rec.page, rec.chunk_index):
+            diff["chunk_id"] = md["chunk_id"]
+        rec.extra = diff or None
+        return rec
+
+    def _metadata(self, rec: ChunkRecord) -> Dict[str, Any]:
+        if rec.file_id < 0:
+            return dict(rec.extra or {})
+        f = self.files[rec.file_id]
+        md = dict(f.extra)
+        md.update({
+            "total_pages": f.total_pages,
+            "page": rec.page,
+            "page_label": rec.page_label,
+            "kb_id": f.kb_id,
+            "filename": f.filename,
+            "file_sha256": f.file_sha256,
+            "chunk_index": rec.chunk_index,
+            "chunk_id": make_chunk_id(f.kb_id, f.file_sha256, rec.page, rec.chunk_index),
+        })
+        if rec.extra:
+            md.update(rec.extra)
+        return md
+
+    # ---- Docstore / AddableMixin -------------------------------------------
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = set(texts).intersection(self.records)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        for _id, doc in texts.items():
+            self.records[_id] = self._encode(doc)
+
+    def delete(self, ids: List) -> None:
+        overlapping = set(ids).intersection(self.records)
+        if not overlapping:
+            raise ValueError(f"Tried to delete ids that does not  exist: {ids}")
+        for _id in ids:
+            self.records.pop(_id)
+
+    def search(self, search: str) -> Union[str, Document]:
+        rec = self.records.get(search)
+        if rec is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=rec.text, metadata=self._metadata(rec))
+
+    @property
+    def _dict(self) -> Mapping:
+        return _DocView(self)
+
+    # ---- lookups ------------------------------------------------------------
+
+    def find_by_chunk_id(self, chunk_id: str) -> Optional[Document]:
+        """Scan the slotted records (no Document per chunk) for kb:sha:pN:cM."""
+        for _id, rec in self.records.items():
+            if rec.file_id < 0 or rec.extra:
+                if self._metadata(rec).get("chunk_id") == chunk_id:
+                    return self.search(_id)
+                continue
+            f = self.files[rec.file_id]
+            if make_chunk_id(f.kb_id, f.file_sha256, rec.page, rec.chunk_index) == chunk_id:
+                return self.search(_id)
+        return None
+
+    @classmethod
+    def from_documents(cls, docs: Dict[str, Document]) -> "CompactDocstore":
+        store = cls()
+        store.add(docs)
+        return store
+
+
+def compact_vector_store(vs: FAISS) -> FAISS:
+    """Swap an InMemoryDocstore for a CompactDocstore (in place) unless COMPACT_DOCSTORE=0."""
+    if compact_docstore_enabled() and isinstance(vs.docstore, InMemoryDocstore):
+        vs.docstore = CompactDocstore.from_documents(vs.docstore._dict)
+    return vs
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import os
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from app.services.metrics import incr
+
+# flat   : float32, 1536 B/vector (384-d), exact
+# fp16   : IndexScalarQuantizer QT_fp16, 768 B/vector
+# sq8    : IndexScalarQuantizer QT_8bit (per-dim min/max), 384 B/vector
+# binary : IndexLSH sign bits over per-dim thresholds, 48 B/vector
+STORAGE_MODES = ("flat", "fp16", "sq8", "binary")
+DEFAULT_OVERSAMPLE = 4
+
+
+def get_vector_storage() -> str:
+    """VECTOR_STORAGE used when a KB index is (re)built."""
+    v = os.getenv("VECTOR_STORAGE", "flat").strip().lower()
+    return v if v in STORAGE_MODES else "flat"
+
+
+def get_oversample() -> int:
+    """Compact-index candidates per requested result (VECTOR_OVERSAMPLE)."""
+    try:
+        return max(1, int(os.getenv("VECTOR_OVERSAMPLE", str(DEFAULT_OVERSAMPLE))))
+    except ValueError:
+        return DEFAULT_OVERSAMPLE
+
+
+def build_compact_index(vectors: np.ndarray, storage: str) -> faiss.Index:
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    d = vectors.shape[1]
+    if storage == "flat":
+        index = faiss.IndexFlatL2(d)
+    elif storage == "fp16":
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    elif storage == "sq8":
+        # trained on the current vectors; later appends outside the range are clipped,
+        # which only affects candidate order (final scores are exact)
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    elif storage == "binary":
+        index = faiss.IndexLSH(d, d, False, True)      # nbits=d, no rotation, trained thresholds
+    else:
+        raise ValueError(f"Unknown vector storage: {storage!r} (expected one of {STORAGE_MODES})")
+    if len(vectors):
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+    return index
+
+
+def storage_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexLSH):
+        return "binary"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "flat"
+
+
+def is_compact(index: faiss.Index) -> bool:
+    return storage_of(index) != "flat"
+
+
+def attach_full_vectors(vs: FAISS, matrix: Optional[np.ndarray]) -> None:
+    """Full-precision rows (usually a read-only memmap) used to re-score compact-index candidates."""
+    vs.full_vectors = matrix
+
+
+def rescore_search(
+    vs: FAISS,
+    query_vector,
+    k: int,
+    oversample: Optional[int] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Two-phase search over a compact index: k * oversample candidates from the
+    quantized codes, then exact squared-L2 against the persisted float vectors,
+    so scores mean the same as with a flat index (retrieval gate thresholds hold).
+    """
+    n = vs.index.ntotal
+    if n == 0 or k <= 0:
+        return []
+    q = np.asarray(query_vector, dtype="float32").reshape(1, -1)
+    n_cand = min(n, k * (oversample or get_oversample()))
+    approx, idxs = vs.index.search(q, n_cand)
+    rows = [int(i) for i in idxs[0] if i >= 0]
+
+    full = getattr(vs, "full_vectors", None)
+    if full is not None and len(full) == n:
+        cand = np.asarray(full[rows], dtype="float32")
+        dists = ((cand - q) ** 2).sum(axis=1)
+        incr("vector_search.rescored")
+    else:
+        # no usable full-precision vectors: best effort from the codes
+        incr("vector_search.rescore_unavailable")
+        try:
+            cand = np.stack([vs.index.reconstruct(r) for r in rows])
+            dists = ((cand - q) ** 2).sum(axis=1)
+        except RuntimeError:
+            dists = approx[0][: len(rows)]
+
+    order = np.lexsort((np.asarray(rows), dists))[:k]      # ties in row order, like a flat index
+    out = []
+    for j in order:
+        doc = vs.docstore.search(vs.index_to_docstore_id[rows[j]])
+        if isinstance(doc, Document):
+            out.append((doc, float(dists[j])))
+    return out
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+# Rough per-stage costs on our CPU nodes; they only need to be in the right ballpark.
+RERANK_MS_PER_DOC = float(os.getenv("DEADLINE_RERANK_MS_PER_DOC", "15"))
+LLM_MIN_MS = float(os.getenv("DEADLINE_LLM_MIN_MS", "1500"))     # not worth calling the LLM below this
+SAFETY_MARGIN_MS = 100.0                                          # respond (fallback) before the hard limit
+
+# degradation labels reported in responses
+FETCH_K_REDUCED = "fetch_k_reduced"
+RERANK_PARTIAL = "rerank_partial"
+RERANK_SKIPPED = "rerank_skipped"
+LLM_SKIPPED = "llm_skipped"
+LLM_TIMEOUT = "llm_timeout"
+LLM_ERROR = "llm_error"
+
+
+def is_timeout_error(exc: BaseException) -> bool:
+    """True for a timeout from any client library (stdlib, requests, httpx, ...), also when wrapped."""
+    seen = set()
+    e: Optional[BaseException] = exc
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        if isinstance(e, TimeoutError) or any("timeout" in c.__name__.lower() for c in type(e).__mro__):
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+
+def default_deadline_ms() -> Optional[float]:
+    """Server-wide default latency budget (ASK_DEADLINE_MS); None = unbounded."""
+    raw = os.getenv("ASK_DEADLINE_MS")
+    if not raw:
+        return None
+    try:
+        v = float(raw)
+    except ValueError:
+        return None
+    return v if v > 0 else None
+
+
+class Deadline:
+    """
+    Monotonic per-request latency budget shared by all pipeline stages.
+    Stages ask how much time is left and record the degradations they apply.
+    Create it when the request arrives, so queueing (admission, single-flight,
+    worker threads) is charged to the budget too.
+    """
+
+    def __init__(self, budget_ms: Optional[float] = None):
+        self.budget_ms = budget_ms if budget_ms and budget_ms > 0 else None
+        self.started = time.monotonic()
+        self.degradations: List[str] = []
+
+    @classmethod
+    def from_request(cls, deadline_ms: Optional[float]) -> "Deadline":
+        return cls(deadline_ms if deadline_ms else default_deadline_ms())
+
+    @property
+    def bounded(self) -> bool:
+        return self.budget_ms is not None
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000.0
+
+    def remaining_ms(self) -> float:
+        if self.budget_ms is None:
+            return math.inf
+        return self.budget_ms - self.elapsed_ms() - SAFETY_MARGIN_MS
+
+    def expired(self) -> bool:
+        return self.remaining_ms() <= 0
+
+    def degrade(self, name: str) -> None:
+        if name not in self.degradations:
+            self.degradations.append(name)
+
+    # ---- stage policies -------------------------------------------------
+
+    def plan_fetch_k(self, fetch_k: int, min_k: int = 1) -> int:
+        """
+        Shrink vector recall so that reranking the candidates still leaves
+        LLM_MIN_MS for generation.
+        """
+        if not self.bounded:
+            return fetch_k
+        affordable = int((self.remaining_ms() - LLM_MIN_MS) // RERANK_MS_PER_DOC)
+        k = max(min_k, min(fetch_k, affordable))
+        if k < fetch_k:
+            self.degrade(FETCH_K_REDUCED)
+        return k
+
+    def plan_rerank(self, n_candidates: int, top_k: int) -> int:
+        """
+        How many candidates (best vector scores first) the cross-encoder may see.
+        0 means skip reranking and keep vector order.
+        """
+        if not self.bounded:
+            return n_candidates
+        remaining = self.remaining_ms()
+        if remaining < LLM_MIN_MS + RERANK_MS_PER_DOC * min(top_k, n_candidates):
+            self.degrade(RERANK_SKIPPED)
+            return 0
+        n = min(n_candidates, int((remaining - LLM_MIN_MS) // RERANK_MS_PER_DOC))
+        if n < n_candidates:
+            self.degrade(RERANK_PARTIAL)
+        return n
+
+    def llm_allowed(self) -> bool:
+        if self.remaining_ms() < LLM_MIN_MS:
+            self.degrade(LLM_SKIPPED)
+            return False
+        return True
+
+    def llm_timeout_ms(self) -> Optional[float]:
+        return None if not self.bounded else max(self.remaining_ms(), 1.0)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "budget_ms": self.budget_ms,
+            "elapsed_ms": round(self.elapsed_ms(), 1),
+            "degradations": list(self.degradations),
+        }
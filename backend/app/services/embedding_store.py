@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from app.services.chunk_store import load_chunk
+from app.services.compact_docstore import compact_vector_store
+from app.services.compact_index import attach_full_vectors, build_compact_index, is_compact
+from app.services.index_io import write_vector_store
+from app.services.metrics import incr
+from app.services.vector_store import EMBEDDING_MODEL, embeddings
+
+# <kb_dir>/embeddings.npy          float32/float16 matrix, row i = vector of chunk_ids[i]
+# <kb_dir>/embeddings.json         {"model", "dim", "dtype", "index_storage", "chunk_ids", "content_hashes"}
+EMBEDDINGS_NPY = "embeddings.npy"
+EMBEDDINGS_META = "embeddings.json"
+
+# <base_dir>/embedding_cache.sqlite3   (model, content_hash) -> vector, shared by all KBs
+EMBEDDING_CACHE_DB = "embedding_cache.sqlite3"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def store_dtype() -> str:
+    """EMBEDDING_STORE_DTYPE=float16 halves the on-disk matrix; vectors are float32 in memory."""
+    v = os.getenv("EMBEDDING_STORE_DTYPE", "float32").strip().lower()
+    return v if v in ("float32", "float16") else "float32"
+
+
+# ---------------------------------------------------------------------------
+# content-hash -> vector cache (shared across KBs)
+# ---------------------------------------------------------------------------
+
+class EmbeddingCache:
+    """
+    Vectors keyed by (model, sha256(chunk text)), so identical content is embedded
+    once no matter which KB (or which re-chunking run) it shows up in.
+    SQLite because several workers/processes may ingest at the same time.
+    """
+
+    def __init__(self, path: str, model: str = EMBEDDING_MODEL):
+        self.path = path
+        self.model = model
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors ("
+                " model TEXT NOT NULL, content_hash TEXT NOT NULL, dim INTEGER NOT NULL, vec BLOB NOT NULL,"
+                " PRIMARY KEY (model, content_hash))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        if not hashes:
+            return found
+        with self._lock, self._connect() as conn:
+            uniq = list(dict.fromkeys(hashes))
+            for i in range(0, len(uniq), 500):
+                part = uniq[i : i + 500]
+                rows = conn.execute(
+                    f"SELECT content_hash, vec FROM vectors WHERE model = ? AND content_hash IN ({','.join('?' * len(part))})",
+                    [self.model, *part],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype="float32")
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        if not items:
+            return
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO vectors (model, content_hash, dim, vec) VALUES (?, ?, ?, ?)",
+                [(self.model, h, int(v.shape[0]), np.asarray(v, dtype="float32").tobytes()) for h, v in items.items()],
+            )
+
+    def count(self) -> int:
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM vectors WHERE model = ?", [self.model]).fetchone()[0]
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(base_dir: str) -> EmbeddingCache:
+    path = os.path.join(base_dir, EMBEDDING_CACHE_DB)
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = EmbeddingCache(path)
+        return _caches[path]
+
+
+def embed_documents_cached(docs: Sequence[Document], base_dir: str) -> np.ndarray:
+    """float32 (n, dim) vectors for docs; only content not seen before hits the model."""
+    hashes = [content_hash(d.page_content) for d in docs]
+    cache = get_embedding_cache(base_dir)
+    found = cache.get_many(hashes)
+
+    missing = list(dict.fromkeys(h for h in hashes if h not in found))
+    incr("embedding_cache.hit", len(found))
+    if missing:
+        incr("embedding_cache.miss", len(missing))
+        text_by_hash = {h: d.page_content for h, d in zip(hashes, docs)}
+        new = embeddings.embed_documents([text_by_hash[h] for h in missing])
+        fresh = {h: np.asarray(v, dtype="float32") for h, v in zip(missing, new)}
+        cache.put_many(fresh)
+        found.update(fresh)
+
+    if not hashes:
+        return np.zeros((0, 0), dtype="float32")
+    return np.stack([found[h] for h in hashes]).astype("float32", copy=False)
+
+
+# ---------------------------------------------------------------------------
+# per-KB embedding matrix
+# ---------------------------------------------------------------------------
+
+def _chunk_ids(docs: Sequence[Document]) -> List[str]:
+    return [(d.metadata or {}).get("chunk_id", "") for d in docs]
+
+
+def load_kb_embeddings(kb_dir: str, mmap: bool = True) -> Optional[Tuple[Dict[str, Any], np.ndarray]]:
+    """(meta, matrix) or None if the KB has no persisted vectors. mmap keeps RAM flat."""
+    meta_path = os.path.join(kb_dir, EMBEDDINGS_META)
+    npy_path = os.path.join(kb_dir, EMBEDDINGS_NPY)
+    if not (os.path.exists(meta_path) and os.path.exists(npy_path)):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    matrix = np.load(npy_path, mmap_mode="r" if mmap else None)
+    return meta, matrix
+
+
+def kb_index_storage(kb_dir: str) -> str:
+    """Vector storage the KB's index was built with ("flat" for older KBs)."""
+    meta_path = os.path.join(kb_dir, EMBEDDINGS_META)
+    if not os.path.exists(meta_path):
+        return "flat"
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f).get("index_storage", "flat")
+
+
+def save_kb_embeddings(
+    kb_dir: str,
+    docs: Sequence[Document],
+    vectors: np.ndarray,
+    append: bool = False,
+    index_storage: Optional[str] = None,
+) -> int:
+    """
+    Persist vectors next to the FAISS index (atomic replace of both files).
+    append=True extends the existing matrix (same order as FAISS add_embeddings).
+    index_storage records how index.faiss stores vectors (kept as-is when None).
+    """
+    chunk_ids = _chunk_ids(docs)
+    hashes = [content_hash(d.page_content) for d in docs]
+    dtype = store_dtype()
+    vectors = np.asarray(vectors, dtype="float32")
+    if index_storage is None:
+        index_storage = kb_index_storage(kb_dir)
+
+    if append:
+        existing = load_kb_embeddings(kb_dir, mmap=False)
+        if existing is not None:
+            meta, old = existing
+            chunk_ids = meta["chunk_ids"] + chunk_ids
+            hashes = meta.get("content_hashes", [""] * len(meta["chunk_ids"])) + hashes
+            vectors = np.concatenate([np.asarray(old, dtype="float32"), vectors]) if len(old) else vectors
+
+    os.makedirs(kb_dir, exist_ok=True)
+    npy_path = os.path.join(kb_dir, EMBEDDINGS_NPY)
+    tmp_npy = npy_path + ".tmp.npy"
+    np.save(tmp_npy, vectors.astype(dtype))
+
+    meta = {
+        "model": EMBEDDING_MODEL,
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 and len(vectors) else 0,
+        "dtype": dtype,
+        "index_storage": index_storage,
+        "count": len(chunk_ids),
+        "chunk_ids": chunk_ids,
+        "content_hashes": hashes,
+    }
+    meta_path = os.path.join(kb_dir, EMBEDDINGS_META)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    os.replace(tmp_npy, npy_path)
+    os.replace(meta_path + ".tmp", meta_path)
+    return len(chunk_ids)
+
+
+def faiss_from_vectors(docs: Sequence[Document], vectors: np.ndarray, storage: str = "flat") -> FAISS:
+    """
+    Same index FAISS.from_documents would build, from precomputed vectors.
+    storage != "flat" swaps in a compact index (see compact_index.STORAGE_MODES).
+    """
+    vs = FAISS.from_embeddings(
+        text_embeddings=[(d.page_content, v.tolist()) for d, v in zip(docs, vectors)],
+        embedding=embeddings,
+        metadatas=[d.metadata for d in docs],
+    )
+    if storage != "flat" and len(docs):
+        vs.index = build_compact_index(vectors, storage)
+        attach_full_vectors(vs, np.asarray(vectors, dtype="float32"))
+    return compact_vector_store(vs)
+
+
+def add_vectors(vs: FAISS, docs: Sequence[Document], vectors: np.ndarray) -> None:
+    vs.add_embeddings(
+        text_embeddings=[(d.page_content, v.tolist()) for d, v in zip(docs, vectors)],
+        metadatas=[d.metadata for d in docs],
+    )
+
+
+def index_vectors(vs: FAISS) -> Tuple[List[Document], np.ndarray]:
+    """(docs, vectors) in FAISS row order, read back from a flat index (backfill for old KBs)."""
+    if is_compact(vs.index):
+        raise ValueError("Can't read exact vectors back from a compact index")
+    n = vs.index.ntotal
+    docs = [vs.docstore.search(vs.index_to_docstore_id[i]) for i in range(n)]
+    vectors = vs.index.reconstruct_n(0, n) if n else np.zeros((0, vs.index.d), dtype="float32")
+    return docs, np.asarray(vectors, dtype="float32")
+
+
+def backfill_kb_embeddings(kb_dir: str, vs: FAISS, base_dir: str) -> int:
+    """Persist the vectors of a KB ingested before embeddings were stored."""
+    docs, vectors = index_vectors(vs)
+    get_embedding_cache(base_dir).put_many({content_hash(d.page_content): v for d, v in zip(docs, vectors)})
+    return save_kb_embeddings(kb_dir, docs, vectors)
+
+
+def kb_documents(kb_dir: str, chunk_ids: Sequence[str]) -> List[Document]:
+    """Documents from the per-chunk JSON store (doesn't need index.pkl)."""
+    docs = []
+    for cid in chunk_ids:
+        payload = load_chunk(kb_dir=kb_dir, chunk_id=cid)
+        docs.append(Document(page_content=payload["page_content"], metadata=payload.get("metadata") or {}))
+    return docs
+
+
+def load_kb_rows(
+    kb_dir: str,
+    base_dir: str,
+    chunk_store_dir: Optional[str] = None,
+) -> Tuple[Dict[str, Any], List[Document], np.ndarray, int]:
+    """
+    (meta, docs, float32 vectors, re_embedded) from the persisted matrix + chunk
+    store. Rows whose content changed or whose model differs are re-embedded
+    through the shared cache. chunk_store_dir: where chunks/ lives (the KB dir
+    when kb_dir is a shard).
+    """
+    loaded = load_kb_embeddings(kb_dir, mmap=True)
+    if loaded is None:
+        raise FileNotFoundError(f"No persisted embeddings in {kb_dir}; ingest again or backfill first")
+    meta, matrix = loaded
+
+    docs = kb_documents(chunk_store_dir or kb_dir, meta["chunk_ids"])
+    stale = [
+        i for i, d in enumerate(docs)
+        if meta.get("model") != EMBEDDING_MODEL
+        or (meta.get("content_hashes") and meta["content_hashes"][i] != content_hash(d.page_content))
+    ]
+    vectors = np.asarray(matrix, dtype="float32")
+    if stale:
+        vectors = vectors.copy() if vectors.size else np.zeros((len(docs), 0), dtype="float32")
+        fresh = embed_documents_cached([docs[i] for i in stale], base_dir=base_dir)
+        if vectors.shape[1] != fresh.shape[1]:
+            vectors = embed_documents_cached(docs, base_dir=base_dir)
+        else:
+            vectors[stale] = fresh
+    return meta, docs, vectors, len(stale)
+
+
+def rebuild_kb_index(kb_dir: str, base_dir: str, storage: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Rebuild index.faiss/index.pkl from the persisted matrix + chunk store without
+    calling the embedding model (see load_kb_rows). storage switches the vector
+    storage; None keeps the KB's current one.
+    """
+    meta, docs, vectors, re_embedded = load_kb_rows(kb_dir, base_dir)
+    storage = storage or meta.get("index_storage", "flat")
+    vs = faiss_from_vectors(docs, vectors, storage=storage)
+    write_vector_store(vs, kb_dir)
+    if re_embedded or storage != meta.get("index_storage", "flat"):
+        save_kb_embeddings(kb_dir, docs, vectors, index_storage=storage)
+    return {
+        "num_chunks": len(docs),
+        "re_embedded": re_embedded,
+        "dim": int(vectors.shape[1]) if len(docs) else 0,
+        "index_storage": storage,
+    }
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from app.services.ingestion import load_and_chunk_pdf
+from app.services.metrics import incr
+from app.services.vector_store import build_faiss_index
+
+# chunk_ids of uploaded (not ingested) files live in their own namespace
+EPHEMERAL_KB_ID = "ephemeral"
+
+DEFAULT_MAX_ENTRIES = 16
+DEFAULT_TTL_S = 900.0
+
+
+@dataclass
+class EphemeralIndex:
+    doc_token: str                # sha256 of the PDF bytes
+    filename: str
+    chunks: List[Document]
+    vector_store: FAISS
+    created_at: float
+    last_used: float
+
+
+class DocTokenNotFound(KeyError):
+    """doc_token unknown or expired: the client has to upload the file again."""
+
+
+class EphemeralIndexCache:
+    """
+    In-memory FAISS indexes for the upload-and-ask endpoints, keyed by the
+    SHA-256 of the uploaded bytes. Bounded LRU with a TTL since last use.
+    Concurrent first requests for the same file build the index only once.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_s: float = DEFAULT_TTL_S):
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, EphemeralIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._building: Dict[str, threading.Lock] = {}
+
+    def _expire(self, now: float) -> None:
+        if self.ttl_s <= 0:
+            return
+        for token in [t for t, e in self._entries.items() if now - e.last_used > self.ttl_s]:
+            del self._entries[token]
+            incr("ephemeral_index.expired")
+
+    def get(self, doc_token: str) -> Optional[EphemeralIndex]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(doc_token)
+            if entry is None:
+                return None
+            entry.last_used = now
+            self._entries.move_to_end(doc_token)
+            return entry
+
+    def require(self, doc_token: str) -> EphemeralIndex:
+        entry = self.get(doc_token)
+        if entry is None:
+            incr("ephemeral_index.token_miss")
+            raise DocTokenNotFound(doc_token)
+        incr("ephemeral_index.hit")
+        return entry
+
+    def get_or_build(self, data: bytes, filename: str) -> Tuple[EphemeralIndex, bool]:
+        """Return (index, cached) for the uploaded bytes; the hash is computed once here."""
+        token = hashlib.sha256(data).hexdigest()
+        entry = self.get(token)
+        if entry is not None:
+            incr("ephemeral_index.hit")
+            return entry, True
+
+        with self._lock:
+            build_lock = self._building.setdefault(token, threading.Lock())
+        with build_lock:
+            entry = self.get(token)          # built by a concurrent request meanwhile
+            if entry is not None:
+                incr("ephemeral_index.hit")
+                return entry, True
+
+            incr("ephemeral_index.miss")
+            entry = None
+            try:
+                entry = self._build(token, data, filename)
+            finally:
+                # publish the entry before dropping the build lock, so a request
+                # that misses get() never finds neither and builds a second copy
+                with self._lock:
+                    if entry is not None:
+                        self._entries[token] = entry
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)
+                            incr("ephemeral_index.evicted")
+                    self._building.pop(token, None)
+            return entry, False
+
+    @staticmethod
+    def _build(token: str, data: bytes, filename: str) -> EphemeralIndex:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+            tmp.write(data)
+            tmp_path = tmp.name
+        try:
+            chunks = load_and_chunk_pdf(tmp_path, kb_id=EPHEMERAL_KB_ID, filename=filename, file_sha256=token)
+        finally:
+            os.remove(tmp_path)
+        if not chunks:
+            raise ValueError("No text could be extracted from the uploaded PDF.")
+        now = time.time()
+        return EphemeralIndex(
+            doc_token=token,
+            filename=filename,
+            chunks=chunks,
+            vector_store=build_faiss_index(chunks),
+            created_at=now,
+            last_used=now,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.time())
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+            }
+
+
+_cache: Optional[EphemeralIndexCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_ephemeral_cache() -> EphemeralIndexCache:
+    """Process-wide cache; EPHEMERAL_INDEX_MAX_ENTRIES / EPHEMERAL_INDEX_TTL_S tune it."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EphemeralIndexCache(
+                max_entries=int(os.getenv("EPHEMERAL_INDEX_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))),
+                ttl_s=float(os.getenv("EPHEMERAL_INDEX_TTL_S", str(DEFAULT_TTL_S))),
+            )
+        return _cache
@@ -9,21 +9,33 @@ This prevents semantic drift and makes failures enumerable and testable.
 EVIDENCE_MISS = "evidence_miss"        # Retrieved docs do not support the answer
 CITATION_MISS = "citation_miss"        # Answer lacks required [S#] citations
 RETRIEVAL_MISS = "retrieval_miss"      # Retrieved docs don't include used chunks
+LOW_CONFIDENCE = "low_confidence"      # Rerank/vector scores too weak to attempt generation
 
 # Prompt / model related
 PROMPT_VIOLATION = "prompt_violation"  # LLM ignored strict instructions
 MODEL_ERROR = "model_error"            # Upstream LLM failure / timeout
+DEADLINE_EXCEEDED = "deadline_exceeded" # Not enough latency budget left to call the LLM
 
 # Knowledge base / system
 KB_NOT_FOUND = "kb_not_found"           # Requested KB does not exist
+NODE_UNAVAILABLE = "node_unavailable"   # Coordinator: no retrieval node answered for the KB
 INTERNAL_ERROR = "internal_error"       # Unexpected server-side failure
 
+# Admission control (HTTP 429)
+RATE_LIMITED = "rate_limited"           # Tenant exceeded its request rate
+QUEUE_FULL = "queue_full"               # Too many requests already waiting for a slot
+
 ALL_REASONS = {
     EVIDENCE_MISS,
     CITATION_MISS,
     RETRIEVAL_MISS,
+    LOW_CONFIDENCE,
     PROMPT_VIOLATION,
     MODEL_ERROR,
+    DEADLINE_EXCEEDED,
     KB_NOT_FOUND,
+    NODE_UNAVAILABLE,
     INTERNAL_ERROR,
+    RATE_LIMITED,
+    QUEUE_FULL,
 }
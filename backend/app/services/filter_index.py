@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from app.services.compact_index import get_oversample, is_compact
+from app.services.manifest_store import load_manifest
+from app.services.metrics import incr
+
+# <kb_dir>/filter_index.json: FAISS row ids per file and per page, rebuilt on every ingest
+FILTER_INDEX_NAME = "filter_index.json"
+
+
+@dataclass
+class FileRows:
+    filename: str
+    ingested_at: Optional[float]
+    rows: np.ndarray              # FAISS row ids (int64)
+
+
+class FilterIndex:
+    """
+    Metadata -> FAISS row id sets for one KB. Filters are evaluated as numpy
+    bitmaps (one bool per row), then handed to FAISS as an IDSelectorBitmap so
+    the search itself only visits matching vectors.
+    """
+
+    def __init__(self, n: int, files: Dict[str, FileRows], pages: Dict[int, np.ndarray]):
+        self.n = n
+        self.files = files
+        self.pages = pages
+
+    # ---- (de)serialization ---------------------------------------------
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "n": self.n,
+            "files": {
+                sha: {"filename": f.filename, "ingested_at": f.ingested_at, "rows": f.rows.tolist()}
+                for sha, f in self.files.items()
+            },
+            "pages": {str(p): rows.tolist() for p, rows in self.pages.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "FilterIndex":
+        files = {
+            sha: FileRows(f.get("filename", ""), f.get("ingested_at"), np.asarray(f["rows"], dtype="int64"))
+            for sha, f in (data.get("files") or {}).items()
+        }
+        pages = {int(p): np.asarray(rows, dtype="int64") for p, rows in (data.get("pages") or {}).items()}
+        return cls(int(data.get("n", 0)), files, pages)
+
+    # ---- evaluation -----------------------------------------------------
+
+    def _rows_mask(self, rows: np.ndarray) -> np.ndarray:
+        m = np.zeros(self.n, dtype=bool)
+        m[rows] = True
+        return m
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        AND across fields, OR within a list. Supported keys:
+        filenames, file_sha256 (lists), page_min/page_max (0-based `page`),
+        ingested_after/ingested_before (unix seconds, from the manifest).
+        """
+        m = np.ones(self.n, dtype=bool)
+
+        file_ok = None
+        if filters.get("filenames"):
+            names = set(filters["filenames"])
+            file_ok = {sha for sha, f in self.files.items() if f.filename in names}
+        if filters.get("file_sha256"):
+            shas = set(filters["file_sha256"])
+            file_ok = shas if file_ok is None else file_ok & shas
+        after, before = filters.get("ingested_after"), filters.get("ingested_before")
+        if after is not None or before is not None:
+            in_range = {
+                sha for sha, f in self.files.items()
+                if f.ingested_at is not None
+                and (after is None or f.ingested_at >= after)
+                and (before is None or f.ingested_at <= before)
+            }
+            file_ok = in_range if file_ok is None else file_ok & in_range
+        if file_ok is not None:
+            fm = np.zeros(self.n, dtype=bool)
+            for sha in file_ok:
+                if sha in self.files:
+                    fm[self.files[sha].rows] = True
+            m &= fm
+
+        lo, hi = filters.get("page_min"), filters.get("page_max")
+        if lo is not None or hi is not None:
+            pm = np.zeros(self.n, dtype=bool)
+            for page, rows in self.pages.items():
+                if (lo is None or page >= lo) and (hi is None or page <= hi):
+                    pm[rows] = True
+            m &= pm
+        return m
+
+
+def build_filter_index(vs: FAISS, kb_dir: str, manifest_dir: Optional[str] = None) -> FilterIndex:
+    """
+    From the docstore (row -> metadata) and the manifest (sha -> ingested_at).
+    manifest_dir: where manifest.json lives when kb_dir is a shard of the KB.
+    """
+    manifest = load_manifest(manifest_dir or kb_dir)
+    ingested_at = {rec.get("sha256"): rec.get("ingested_at") for rec in manifest.get("files", [])}
+    file_rows: Dict[str, List[int]] = {}
+    filenames: Dict[str, str] = {}
+    page_rows: Dict[int, List[int]] = {}
+    for row in range(vs.index.ntotal):
+        doc = vs.docstore.search(vs.index_to_docstore_id[row])
+        md = doc.metadata if isinstance(doc, Document) else {}
+        sha = md.get("file_sha256", "")
+        file_rows.setdefault(sha, []).append(row)
+        filenames.setdefault(sha, md.get("filename", ""))
+        page_rows.setdefault(int(md.get("page") or 0), []).append(row)
+
+    files = {
+        sha: FileRows(filenames[sha], ingested_at.get(sha), np.asarray(rows, dtype="int64"))
+        for sha, rows in file_rows.items()
+    }
+    pages = {p: np.asarray(rows, dtype="int64") for p, rows in page_rows.items()}
+    return FilterIndex(vs.index.ntotal, files, pages)
+
+
+def save_filter_index(kb_dir: str, fi: FilterIndex) -> None:
+    path = os.path.join(kb_dir, FILTER_INDEX_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(fi.to_json(), f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def get_filter_index(vs: FAISS, kb_dir: str, manifest_dir: Optional[str] = None) -> FilterIndex:
+    """Load (and memoize on the store); rebuild if missing or out of date with the index."""
+    fi = getattr(vs, "filter_index", None)
+    if fi is not None and fi.n == vs.index.ntotal:
+        return fi
+    path = os.path.join(kb_dir, FILTER_INDEX_NAME)
+    fi = None
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            fi = FilterIndex.from_json(json.load(f))
+    if fi is None or fi.n != vs.index.ntotal:
+        fi = build_filter_index(vs, kb_dir, manifest_dir=manifest_dir)
+        save_filter_index(kb_dir, fi)
+    vs.filter_index = fi
+    return fi
+
+
+def filtered_search(vs: FAISS, query_vector, k: int, mask: np.ndarray) -> List[Tuple[Document, float]]:
+    """
+    Top-k among rows where mask is True, with FAISS skipping the others
+    (IDSelectorBitmap). Distances are squared L2, as in search_top_k_with_scores.
+    """
+    n_match = int(mask.sum())
+    incr("vector_search.filtered")
+    if n_match == 0 or k <= 0:
+        return []
+    q = np.asarray(query_vector, dtype="float32").reshape(1, -1)
+    compact = is_compact(vs.index)
+    full = getattr(vs, "full_vectors", None)
+
+    bits = np.packbits(mask, bitorder="little")
+    params = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits)))
+    n_cand = min(n_match, k * get_oversample() if compact else k)
+    try:
+        dists, idxs = vs.index.search(q, n_cand, params=params)
+        rows = [int(i) for i in idxs[0] if i >= 0]
+        dists = dists[0][: len(rows)]
+    except RuntimeError:
+        # index type without selector support (IndexLSH): exact scan of the matching rows
+        rows = np.flatnonzero(mask).tolist()
+        dists = None
+
+    if compact or dists is None:
+        if full is not None and len(full) == vs.index.ntotal:
+            cand = np.asarray(full[rows], dtype="float32")
+        else:
+            cand = np.stack([vs.index.reconstruct(r) for r in rows])
+        dists = ((cand - q) ** 2).sum(axis=1)
+
+    order = np.lexsort((np.asarray(rows), dists))[:k]
+    out = []
+    for j in order:
+        doc = vs.docstore.search(vs.index_to_docstore_id[rows[j]])
+        if isinstance(doc, Document):
+            out.append((doc, float(dists[j])))
+    return out
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import os
-import time
-from typing import Iterator
+from typing import Iterator, Optional
 
 
 DEFAULT_MODEL = "gemini-2.5-flash-lite"
 
+# regression tests pin the model output with this file (any backend)
+MOCK_RESPONSE_FILE = "/tmp/rag_mock_response.txt"
+
 from app.services.prompting_hardened import build_strict_prompt
+from app.services.llm_backend import get_llm_backend
 
 
 def _get_genai():
@@ -32,6 +35,16 @@ def _get_genai():
             ) from e
 
 
+def _make_client(genai, api_key: str, timeout_ms: Optional[float] = None):
+    """
+    timeout_ms bounds the HTTP call (google-genai http_options.timeout is in ms),
+    so a request deadline also caps the model call.
+    """
+    if timeout_ms is None:
+        return genai.Client(api_key=api_key)
+    return genai.Client(api_key=api_key, http_options={"timeout": int(timeout_ms)})
+
+
 def build_prompt(query: str, context: str) -> str:
     return f"""
 You are a helpful assistant.
@@ -47,17 +60,52 @@ Question:
 """.strip()
 
 
+def _read_mock_response() -> Optional[str]:
+    if not os.path.exists(MOCK_RESPONSE_FILE):
+        return None
+    with open(MOCK_RESPONSE_FILE, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
 def stream_answer_gemini(
     query: str,
     context: str,
     model: str = DEFAULT_MODEL,
+    timeout_ms: Optional[float] = None,
+) -> Iterator[str]:
+    """Stream the answer from the configured backend (LLM_BACKEND)."""
+    mock = _read_mock_response()
+    if mock is not None:
+        return (mock[i : i + 50] for i in range(0, len(mock), 50))
+    return get_llm_backend().stream(query=query, context=context, model=model, timeout_ms=timeout_ms)
+
+
+def generate_answer_gemini(
+    query: str,
+    context: str,
+    model: str = DEFAULT_MODEL,
+    timeout_ms: Optional[float] = None,
+) -> str:
+    """Generate the answer with the configured backend (LLM_BACKEND)."""
+    # MOCK LOGIC for regression testing
+    mock = _read_mock_response()
+    if mock is not None:
+        return mock
+    return get_llm_backend().generate(query=query, context=context, model=model, timeout_ms=timeout_ms)
+
+
+def gemini_stream(
+    query: str,
+    context: str,
+    model: str = DEFAULT_MODEL,
+    timeout_ms: Optional[float] = None,
 ) -> Iterator[str]:
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise ValueError("GEMINI_API_KEY is not set.")
 
     genai = _get_genai()
-    client = genai.Client(api_key=api_key)
+    client = _make_client(genai, api_key, timeout_ms)
     
     # Day22: harden prompt
     pack = build_strict_prompt(query=query, context=context)
@@ -80,31 +128,26 @@ def stream_answer_gemini(
                 yield text
         return
 
-    # Fallback: fake streaming
+    # Fallback: the SDK has no streaming, so the finished text goes out as one delta
+    # (slicing and sleeping only delayed it and cost a frame per slice)
     resp = client.models.generate_content(model=model, contents=contents, config=config)
     text = (getattr(resp, "text", "") or "").strip()
-    for i in range(0, len(text), 50):
-        yield text[i : i + 50]
-        time.sleep(0.02)
+    if text:
+        yield text
 
 
-def generate_answer_gemini(
+def gemini_generate(
     query: str,
     context: str,
     model: str = DEFAULT_MODEL,
+    timeout_ms: Optional[float] = None,
 ) -> str:
-    # MOCK LOGIC for regression testing
-    mock_file = "/tmp/rag_mock_response.txt"
-    if os.path.exists(mock_file):
-        with open(mock_file, "r", encoding="utf-8") as f:
-            return f.read().strip()
-
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise ValueError("GEMINI_API_KEY is not set.")
 
     genai = _get_genai()
-    client = genai.Client(api_key=api_key)
+    client = _make_client(genai, api_key, timeout_ms)
     
     # Day22: harden prompt
     pack = build_strict_prompt(query=query, context=context)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import os
+from typing import Tuple
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+# read-only mmap of the codes of flat / SQ / LSH indexes (IndexFlatCodes): the
+# pages live in the OS page cache and are shared by every process mapping the file
+MMAP_IO_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+def index_mmap_enabled() -> bool:
+    """KB_INDEX_MMAP=1: query-path KBs map index.faiss instead of copying it into each process."""
+    return os.getenv("KB_INDEX_MMAP", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def index_stamp(path: str) -> Tuple[int, ...]:
+    """Changes whenever index.faiss / index.pkl in `path` are replaced."""
+    a = os.stat(os.path.join(path, "index.faiss"))
+    b = os.stat(os.path.join(path, "index.pkl"))
+    return (a.st_ino, a.st_mtime_ns, a.st_size, b.st_ino, b.st_mtime_ns, b.st_size)
+
+
+def read_vector_store(path: str, embedding: Embeddings, mmap: bool = False) -> FAISS:
+    # ✅ allow_dangerous_deserialization=True 是因为 FAISS.load_local 会反序列化 pickle
+    return FAISS.load_local(
+        path,
+        embedding,
+        allow_dangerous_deserialization=True,
+        io_flags=MMAP_IO_FLAGS if mmap else 0,
+    )
+
+
+def write_vector_store(vs: FAISS, path: str) -> None:
+    """
+    save_local, but each file is written under a temp name and renamed into
+    place: processes that mmap (or are reading) the old index.faiss keep a
+    consistent file instead of one truncated under them.
+    """
+    os.makedirs(path, exist_ok=True)
+    vs.save_local(path, index_name="index.tmp")
+    os.replace(os.path.join(path, "index.tmp.faiss"), os.path.join(path, "index.faiss"))
+    os.replace(os.path.join(path, "index.tmp.pkl"), os.path.join(path, "index.pkl"))
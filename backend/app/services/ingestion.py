@@ -1,13 +1,18 @@
 # backend/app/services/ingestion.py
 from __future__ import annotations
 
-from typing import List
+from typing import Any, Dict, List, Optional
 import hashlib
+import json
+import os
 
 from langchain_core.documents import Document
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from app.services.manifest_store import load_manifest
+from app.services.page_cache import load_pages, save_pages
+
 
 def make_chunk_id(kb_id: str, file_sha256: str, page: int, chunk_index: int) -> str:
     """
@@ -17,30 +22,84 @@ def make_chunk_id(kb_id: str, file_sha256: str, page: int, chunk_index: int) ->
     return f"{kb_id}:{file_sha256}:p{page}:c{chunk_index}"
 
 
-def load_and_chunk_pdf(
-    pdf_path: str,
+DEFAULT_CHUNK_PROFILE = "default"
+
+# splitter settings by name; CHUNK_PROFILES (JSON) adds / overrides entries, e.g.
+#   {"tiny": {"chunk_size": 300, "chunk_overlap": 50}}
+CHUNK_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {"chunk_size": 1000, "chunk_overlap": 150},
+    "small": {"chunk_size": 500, "chunk_overlap": 80},
+    "large": {"chunk_size": 2000, "chunk_overlap": 300},
+}
+
+
+def get_chunk_profiles() -> Dict[str, Dict[str, Any]]:
+    profiles = {k: dict(v) for k, v in CHUNK_PROFILES.items()}
+    raw = os.getenv("CHUNK_PROFILES", "").strip()
+    if raw:
+        for name, cfg in json.loads(raw).items():
+            profiles[name] = {**profiles.get(name, {}), **cfg}
+    return profiles
+
+
+def get_default_chunk_profile() -> str:
+    """CHUNK_PROFILE: profile for new KBs (appends keep the KB's own profile)."""
+    return os.getenv("CHUNK_PROFILE", DEFAULT_CHUNK_PROFILE).strip() or DEFAULT_CHUNK_PROFILE
+
+
+def get_chunk_profile(name: Optional[str] = None) -> Dict[str, Any]:
+    name = name or get_default_chunk_profile()
+    profiles = get_chunk_profiles()
+    if name not in profiles:
+        raise ValueError(f"Unknown chunk profile: {name} (known: {', '.join(sorted(profiles))})")
+    return profiles[name]
+
+
+def kb_chunk_profile(kb_dir: str, requested: Optional[str], mode: str) -> str:
+    """
+    Chunk profile for an ingest: the requested one, else (append) the one the
+    KB was chunked with, else CHUNK_PROFILE.
+    """
+    if requested:
+        return requested
+    if mode == "append":
+        recorded = load_manifest(kb_dir).get("chunk_profile") if os.path.isdir(kb_dir) else None
+        if recorded:
+            return recorded
+    return get_default_chunk_profile()
+
+
+def load_pdf_pages(pdf_path: str, file_sha256: str = "", page_cache_dir: Optional[str] = None) -> List[Document]:
+    """
+    PDF -> one Document per page. With page_cache_dir, pages extracted before
+    (same sha256) are read back from the page cache and new ones are stored there.
+    """
+    if page_cache_dir and file_sha256:
+        cached = load_pages(page_cache_dir, file_sha256)
+        if cached is not None:
+            return cached
+    documents: List[Document] = PyPDFLoader(pdf_path).load()
+    if page_cache_dir and file_sha256:
+        save_pages(page_cache_dir, file_sha256, documents)
+    return documents
+
+
+def chunk_pages(
+    documents: List[Document],
     kb_id: str = "default",
     filename: str = "",
     file_sha256: str = "",
+    profile: Optional[str] = None,
 ) -> List[Document]:
     """
-    Load a PDF and split it into chunks.
+    Split pages into chunks with a chunk profile's splitter settings.
     Also attach metadata needed for Day8 citations:
       kb_id, filename, file_sha256, chunk_index, chunk_id, page/page_label/total_pages
     """
-
-    # 1) Load PDF -> list[Document] (each is usually per-page)
-    loader = PyPDFLoader(pdf_path)
-    documents: List[Document] = loader.load()
-
-    # 2) Split into smaller text chunks for retrieval
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=150,
-    )
+    splitter = RecursiveCharacterTextSplitter(**get_chunk_profile(profile))
     chunks: List[Document] = splitter.split_documents(documents)
 
-    # 3) Attach stable citation metadata to each chunk
+    # Attach stable citation metadata to each chunk
     for idx, doc in enumerate(chunks):
         md = doc.metadata or {}
 
@@ -63,4 +122,35 @@ def load_and_chunk_pdf(
 
         doc.metadata = md
 
-    return chunks
\ No newline at end of file
+    return chunks
+
+
+def load_and_chunk_pdf(
+    pdf_path: str,
+    kb_id: str = "default",
+    filename: str = "",
+    file_sha256: str = "",
+    page_cache_dir: Optional[str] = None,
+    profile: Optional[str] = None,
+) -> List[Document]:
+    """
+    Load a PDF and split it into chunks (see load_pdf_pages / chunk_pages).
+    """
+    # 1) Load PDF -> list[Document] (each is usually per-page)
+    documents = load_pdf_pages(pdf_path, file_sha256=file_sha256, page_cache_dir=page_cache_dir)
+    # 2) Split into smaller text chunks for retrieval + citation metadata
+    return chunk_pages(documents, kb_id=kb_id, filename=filename, file_sha256=file_sha256, profile=profile)
+
+
+def chunk_cached_pdf(
+    page_cache_dir: str,
+    file_sha256: str,
+    kb_id: str = "default",
+    filename: str = "",
+    profile: Optional[str] = None,
+) -> List[Document]:
+    """Re-chunk a previously ingested PDF from the page cache alone (no PDF, no parsing)."""
+    documents = load_pages(page_cache_dir, file_sha256)
+    if documents is None:
+        raise FileNotFoundError(f"No cached pages for {filename or file_sha256}")
+    return chunk_pages(documents, kb_id=kb_id, filename=filename, file_sha256=file_sha256, profile=profile)
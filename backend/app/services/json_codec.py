@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+
+from app.services.metrics import observe
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+
+# numpy scalars/arrays (scores, vectors) and int keys serialize without a default= hook
+_ORJSON_OPTS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+
+def get_json_codec() -> str:
+    """JSON_CODEC=orjson|json (default: orjson when installed)."""
+    codec = os.getenv("JSON_CODEC", "orjson").strip().lower()
+    return "orjson" if codec == "orjson" and orjson is not None else "json"
+
+
+def _default(obj: Any) -> Any:
+    # stdlib fallback for what orjson handles natively (numpy scalars / arrays)
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON (no spaces, non-ASCII kept as is)."""
+    if get_json_codec() == "orjson":
+        return orjson.dumps(obj, option=_ORJSON_OPTS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps_str(obj: Any) -> str:
+    """dumps() as text, for SSE data lines."""
+    return dumps(obj).decode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """
+    JSONResponse rendered with dumps(). Serialization time and body size are
+    recorded under <metric>.serialize_ms / <metric>.response_bytes.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        background: Optional[BackgroundTask] = None,
+        metric: str = "response",
+    ) -> None:
+        self.metric = metric
+        super().__init__(content, status_code=status_code, headers=headers, background=background)
+
+    def render(self, content: Any) -> bytes:
+        t0 = time.perf_counter()
+        body = dumps(content)
+        observe(f"{self.metric}.serialize_ms", (time.perf_counter() - t0) * 1000.0)
+        observe(f"{self.metric}.response_bytes", len(body))
+        return body
+
+
+# ---------------------------------------------------------------------------
+# /ask-kb response shaping
+# ---------------------------------------------------------------------------
+
+VERBOSITY_LEVELS = ("compact", "full")
+
+# compact sources: enough to cite and to fetch the chunk via /kb/chunk
+COMPACT_SOURCE_FIELDS = ("source_id", "chunk_id")
+# always kept in compact mode; everything else is opt-in via `fields`
+COMPACT_FIELDS = ("kb_id", "query", "answer", "sources", "fallback_used", "cache")
+
+
+def compact_sources(sources: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{k: s.get(k) for k in COMPACT_SOURCE_FIELDS} for s in sources]
+
+
+def shape_payload(payload: Dict[str, Any], verbosity: str = "full", fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Trim a full /ask-kb payload. compact: answer, source/chunk ids, the gate
+    decision and fallback flag; `fields` adds top-level blocks back (e.g.
+    quality_gate, evaluation, metrics; "sources" returns the full source records).
+    full: unchanged.
+    """
+    if verbosity != "compact":
+        return payload
+    extra = set(fields or ())
+    out = {k: payload[k] for k in COMPACT_FIELDS if k in payload}
+    if "sources" not in extra:
+        out["sources"] = compact_sources(payload.get("sources") or [])
+    gate = payload.get("quality_gate") or {}
+    if "decision" in gate:
+        out["decision"] = gate["decision"]
+    for k in extra:
+        if k in payload:
+            out[k] = payload[k]
+    return out
@@ -3,19 +3,30 @@ from typing import Optional, Dict, Any, List
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
+from app.services.remote_kb import RemoteKB
+from app.services.shard_search import ShardedKB
+
 
 def find_chunk_by_id(vs: FAISS, chunk_id: str) -> Optional[Document]:
     """
     Find a chunk Document by chunk_id from a loaded FAISS vector store.
 
     Implementation detail:
-    - FAISS stores documents in vs.docstore (InMemoryDocstore)
+    - FAISS stores documents in vs.docstore (CompactDocstore, or InMemoryDocstore)
     - We iterate all stored docs and match metadata["chunk_id"]
     """
+    if isinstance(vs, (ShardedKB, RemoteKB)):
+        return vs.find_chunk_by_id(chunk_id)
+
     docstore = getattr(vs, "docstore", None)
     if docstore is None:
         return None
 
+    # ✅ CompactDocstore: scan the slotted records, no Document per chunk
+    find = getattr(docstore, "find_by_chunk_id", None)
+    if find is not None:
+        return find(chunk_id)
+
     store_dict = getattr(docstore, "_dict", None)
     if not store_dict:
         return None
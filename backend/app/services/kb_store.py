@@ -1,11 +1,34 @@
 from __future__ import annotations
 
 import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
 
+import numpy as np
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
 
+from app.services.chunk_store import save_chunks
+from app.services.compact_docstore import compact_vector_store
+from app.services.compact_index import attach_full_vectors, get_vector_storage, is_compact
+from app.services.embedding_store import (
+    add_vectors,
+    backfill_kb_embeddings,
+    faiss_from_vectors,
+    load_kb_embeddings,
+    save_kb_embeddings,
+)
+from app.services.filter_index import build_filter_index, save_filter_index
+from app.services.index_io import index_mmap_enabled, read_vector_store, write_vector_store
+from app.services.manifest_store import bump_generation, kb_version
+from app.services.metrics import incr
+from app.services.shard_search import ShardedKB, is_sharded, open_sharded_kb
+from app.services.shard_store import (
+    append_to_shards, drop_shards, get_kb_shards, refresh_shard_filters, wait_for_shard_swap, write_kb_shards,
+)
 from app.services.vector_store import embeddings
 
 
@@ -18,18 +41,279 @@ def kb_exists(base_dir: str, kb_id: str) -> bool:
 def save_kb(vector_store: FAISS, kb_id: str, base_dir: str = "storage") -> str:
     path = kb_dir(base_dir, kb_id)
     os.makedirs(path, exist_ok=True)
-    vector_store.save_local(path)
+    write_vector_store(vector_store, path)
     return path
 
 
-def load_kb(kb_id: str, base_dir: str = "storage") -> FAISS:
+def load_kb(kb_id: str, base_dir: str = "storage", mmap: bool = False) -> Union[FAISS, ShardedKB]:
+    """
+    Fresh copy of a KB (safe to modify and save). mmap=True maps index.faiss
+    read-only instead; use get_resident_kb for the query path.
+    """
     path = kb_dir(base_dir, kb_id)
     if not os.path.isdir(path):
         raise FileNotFoundError(f"KB not found: {path}")
 
-    # ✅ allow_dangerous_deserialization=True 是因为 FAISS.load_local 会反序列化 pickle
-    return FAISS.load_local(
-        path,
-        embeddings,
-        allow_dangerous_deserialization=True,
-    )
\ No newline at end of file
+    # ✅ sharded KB: shards are loaded by the search workers, not here
+    sharded = open_sharded_kb(path)
+    if sharded is None and not os.path.exists(os.path.join(path, "index.faiss")):
+        wait_for_shard_swap(path)               # caught mid-reshard, between its two renames
+        sharded = open_sharded_kb(path)
+    if sharded is not None:
+        return sharded
+
+    vs = read_vector_store(path, embeddings, mmap=mmap)
+    if is_compact(vs.index):
+        # compact codes for recall, memory-mapped float vectors for exact re-scoring
+        loaded = load_kb_embeddings(path, mmap=True)
+        attach_full_vectors(vs, loaded[1] if loaded is not None else None)
+    # KBs saved before the compact docstore still pickle an InMemoryDocstore
+    return compact_vector_store(vs)
+
+
+def write_chunks(
+    kb_id: str,
+    base_dir: str,
+    chunks: Sequence[Document],
+    vectors: np.ndarray,
+    mode: str,
+    num_shards: Optional[int] = None,
+    storage: Optional[str] = None,
+) -> Tuple[str, int, Optional[FAISS], Optional[List[int]]]:
+    """
+    Write embedded chunks to a KB in one index update (overwrite / append):
+    the FAISS index or touched shards, the chunk store and the embedding matrix.
+    num_shards / storage for overwrite default to KB_SHARDS / VECTOR_STORAGE.
+    Returns (kb_dir, saved_chunks, vs, touched_shards); vs is None for sharded KBs.
+    The manifest, filter bitmaps and generation are up to the caller
+    (see refresh_filters / kb_changed).
+    """
+    path = kb_dir(base_dir, kb_id)
+    storage = storage or get_vector_storage()
+    num_shards = num_shards or get_kb_shards()
+    vs: Optional[FAISS] = None
+    touched_shards: Optional[List[int]] = None
+    if mode == "append" and is_sharded(path):
+        # ✅ sharded KB: only the shard(s) these files hash to are rewritten
+        touched_shards = append_to_shards(path, chunks, vectors)
+    elif mode != "append" and num_shards > 1:
+        write_kb_shards(path, chunks, vectors, num_shards, storage=storage)
+    elif mode == "append" and kb_exists(base_dir, kb_id):
+        vs = load_kb(kb_id=kb_id, base_dir=base_dir)
+        if load_kb_embeddings(path) is None:
+            backfill_kb_embeddings(path, vs, base_dir=base_dir)
+        add_vectors(vs, chunks, vectors)
+        save_kb(vector_store=vs, kb_id=kb_id, base_dir=base_dir)
+        save_kb_embeddings(path, chunks, vectors, append=True)
+    else:
+        vs = faiss_from_vectors(chunks, vectors, storage=storage)
+        save_kb(vector_store=vs, kb_id=kb_id, base_dir=base_dir)
+        drop_shards(path)
+        save_kb_embeddings(path, chunks, vectors, index_storage=storage)
+    # overwrite: chunk files of the previous content are dropped, not left behind
+    saved_chunks = save_chunks(kb_dir=path, docs=chunks, replace=(mode != "append"))
+    return path, saved_chunks, vs, touched_shards
+
+
+def refresh_filters(path: str, vs: Optional[FAISS], touched_shards: Optional[List[int]] = None) -> None:
+    """Metadata filter bitmaps after a write (needs the manifest's ingested_at)."""
+    if is_sharded(path):
+        refresh_shard_filters(path, touched_shards)
+    elif vs is not None:
+        save_filter_index(path, build_filter_index(vs, path))
+
+
+# ---------------------------------------------------------------------------
+# resident KBs: loaded once per process and shared by all read-only requests.
+# A KB is keyed by kb_version() (its generation file); when another process
+# finishes a write, the new snapshot is loaded in the background and swapped
+# in, while queries keep using the old one.
+# ---------------------------------------------------------------------------
+
+DEFAULT_KB_CACHE_MAX = 8
+DEFAULT_KB_RELOAD_POLL_S = 2.0
+
+
+class _Resident:
+    __slots__ = ("kb_id", "base_dir", "version", "vs")
+
+    def __init__(self, kb_id: str, base_dir: str, version: str, vs: FAISS):
+        self.kb_id = kb_id
+        self.base_dir = base_dir
+        self.version = version
+        self.vs = vs
+
+
+_resident: "OrderedDict[str, _Resident]" = OrderedDict()
+_resident_lock = threading.Lock()
+_reloading: Set[str] = set()
+_watcher: Optional[threading.Thread] = None
+
+
+def get_kb_cache_max() -> int:
+    """KB_CACHE_MAX: KBs kept loaded per process (LRU); 0 reloads from disk on every request."""
+    try:
+        return max(0, int(os.getenv("KB_CACHE_MAX", str(DEFAULT_KB_CACHE_MAX))))
+    except ValueError:
+        return DEFAULT_KB_CACHE_MAX
+
+
+def get_kb_reload_poll_s() -> float:
+    """KB_RELOAD_POLL_S: how often the watcher checks resident KBs for new generations (0 = only on access)."""
+    try:
+        return max(0.0, float(os.getenv("KB_RELOAD_POLL_S", str(DEFAULT_KB_RELOAD_POLL_S))))
+    except ValueError:
+        return DEFAULT_KB_RELOAD_POLL_S
+
+
+def _store(path: str, entry: _Resident, limit: int) -> None:
+    with _resident_lock:
+        current = _resident.get(path)
+        if current is not None and current.version == entry.version:
+            return
+        _resident[path] = entry
+        _resident.move_to_end(path)
+        while len(_resident) > limit:
+            _resident.popitem(last=False)
+            incr("kb_cache.evicted")
+
+
+def _reload_in_background(path: str, kb_id: str, base_dir: str) -> None:
+    """Load the KB's current generation off the request path, then swap it in (one load per KB at a time)."""
+    with _resident_lock:
+        if path in _reloading:
+            return
+        _reloading.add(path)
+
+    def run() -> None:
+        try:
+            # version first: a write finishing during the load is picked up by the next check
+            version = kb_version(path)
+            if not os.path.exists(os.path.join(path, "index.faiss")):
+                with _resident_lock:
+                    _resident.pop(path, None)          # became sharded: served by ShardedKB
+                return
+            vs = load_kb(kb_id=kb_id, base_dir=base_dir, mmap=index_mmap_enabled())
+            _store(path, _Resident(kb_id, base_dir, version, vs), get_kb_cache_max())
+            incr("kb_cache.swapped")
+        except Exception:
+            # keep serving the previous snapshot; the next check retries
+            incr("kb_cache.reload_error")
+        finally:
+            with _resident_lock:
+                _reloading.discard(path)
+
+    threading.Thread(target=run, name="kb-reload", daemon=True).start()
+
+
+def get_resident_kb(kb_id: str, base_dir: str = "storage") -> Union[FAISS, ShardedKB]:
+    """
+    Read-only KB for searches; with KB_INDEX_MMAP=1 the index is mapped, not copied.
+    Only the first request for a KB waits for the load: after an ingest / reindex
+    (in any process) it is served from the previous snapshot until the new one
+    is loaded. Callers must not add to or save the returned store.
+    """
+    return get_resident_kb_versioned(kb_id, base_dir)[0]
+
+
+def get_resident_kb_versioned(kb_id: str, base_dir: str = "storage") -> Tuple[Union[FAISS, ShardedKB], str]:
+    """get_resident_kb plus the version of the snapshot returned, which lags kb_version() during a reload."""
+    path = kb_dir(base_dir, kb_id)
+    limit = get_kb_cache_max()
+    version = kb_version(path)
+    if limit <= 0 or not os.path.exists(os.path.join(path, "index.faiss")):
+        return load_kb(kb_id=kb_id, base_dir=base_dir, mmap=index_mmap_enabled()), version
+
+    with _resident_lock:
+        hit = _resident.get(path)
+        if hit is not None:
+            _resident.move_to_end(path)
+    if hit is not None:
+        if hit.version == version:
+            incr("kb_cache.hit")
+        else:
+            incr("kb_cache.stale")
+            _reload_in_background(path, kb_id, base_dir)
+        return hit.vs, hit.version
+
+    incr("kb_cache.miss")
+    vs = load_kb(kb_id=kb_id, base_dir=base_dir, mmap=index_mmap_enabled())
+    _store(path, _Resident(kb_id, base_dir, version, vs), limit)
+    return vs, version
+
+
+def served_kb_version(kb_id: str, base_dir: str = "storage") -> str:
+    """
+    Version of the snapshot queries are answered from right now: the resident one
+    (the previous generation while a reload runs), else the on-disk kb_version().
+    Response / semantic cache keys use this, so answers built from an old snapshot
+    are never filed under the new version.
+    """
+    path = kb_dir(base_dir, kb_id)
+    with _resident_lock:
+        hit = _resident.get(path)
+    return hit.version if hit is not None else kb_version(path)
+
+
+def kb_changed(kb_id: str, base_dir: str = "storage") -> int:
+    """
+    Last step of a write (ingest / reindex): publish a new generation for every
+    process sharing base_dir, and start swapping it in here. Returns the generation.
+    """
+    path = kb_dir(base_dir, kb_id)
+    gen = bump_generation(path)
+    with _resident_lock:
+        resident = path in _resident
+    if resident:
+        _reload_in_background(path, kb_id, base_dir)
+    return gen
+
+
+def _watch(poll_s: float) -> None:
+    while True:
+        time.sleep(poll_s)
+        with _resident_lock:
+            entries = list(_resident.items())
+        for path, entry in entries:
+            try:
+                if kb_version(path) != entry.version:
+                    _reload_in_background(path, entry.kb_id, entry.base_dir)
+            except OSError:
+                pass
+
+
+def start_kb_watcher() -> bool:
+    """
+    Poll resident KBs for new generations so they are swapped in before the next
+    query asks. Start it in each serving process (threads don't survive fork).
+    """
+    global _watcher
+    poll_s = get_kb_reload_poll_s()
+    if poll_s <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return False
+    _watcher = threading.Thread(target=_watch, args=(poll_s,), name="kb-watcher", daemon=True)
+    _watcher.start()
+    return True
+
+
+def preload_kbs(base_dir: str, kb_ids: List[str]) -> List[str]:
+    """Make KBs resident up front ("*" = every KB under base_dir); returns the ids loaded."""
+    if "*" in kb_ids:
+        root = os.path.join(base_dir, "kb")
+        kb_ids = sorted(os.listdir(root)) if os.path.isdir(root) else []
+    loaded = []
+    for kb_id in kb_ids:
+        if kb_exists(base_dir, kb_id):
+            get_resident_kb(kb_id, base_dir)
+            loaded.append(kb_id)
+    return loaded
+
+
+def resident_kbs() -> List[Dict[str, Any]]:
+    with _resident_lock:
+        entries = list(_resident.items())
+        reloading = set(_reloading)
+    return [
+        {"kb_id": e.kb_id, "kb_dir": path, "version": e.version, "reloading": path in reloading}
+        for path, e in entries
+    ]
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+CITATION_MODES = ("valid", "none", "invalid", "mixed")
+
+_SOURCE_HEADER = re.compile(r"^\[(S\d+)\][^\n]*\n", re.MULTILINE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+_TOKEN = re.compile(r"\S+\s*")
+
+IDK_ANSWER = "I don't know based on the provided document."
+
+
+class LLMBackend(ABC):
+    """
+    What the pipeline needs from a model: a full answer, or the same answer as
+    text deltas. timeout_ms (if given) bounds the whole call. Both methods are
+    abstract, so an incomplete backend fails when it is constructed.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def generate(self, query: str, context: str, model: str, timeout_ms: Optional[float] = None) -> str:
+        ...
+
+    @abstractmethod
+    def stream(self, query: str, context: str, model: str, timeout_ms: Optional[float] = None) -> Iterator[str]:
+        ...
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def generate(self, query: str, context: str, model: str, timeout_ms: Optional[float] = None) -> str:
+        from app.services.gemini_llm import gemini_generate
+        return gemini_generate(query=query, context=context, model=model, timeout_ms=timeout_ms)
+
+    def stream(self, query: str, context: str, model: str, timeout_ms: Optional[float] = None) -> Iterator[str]:
+        from app.services.gemini_llm import gemini_stream
+        return gemini_stream(query=query, context=context, model=model, timeout_ms=timeout_ms)
+
+
+class FakeLLMError(RuntimeError):
+    """Injected model failure (FAKE_LLM_ERROR_RATE)."""
+
+
+@dataclass
+class FakeLLMConfig:
+    ttft_ms: float = 300.0          # time to first token
+    tokens_per_s: float = 40.0      # decode speed after the first token
+    error_rate: float = 0.0         # fraction of calls that fail (streams fail part-way)
+    citations: str = "valid"        # valid | none | invalid | mixed
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMConfig":
+        seed = os.getenv("FAKE_LLM_SEED")
+        citations = os.getenv("FAKE_LLM_CITATIONS", "valid").strip().lower()
+        return cls(
+            ttft_ms=float(os.getenv("FAKE_LLM_TTFT_MS", "300")),
+            tokens_per_s=float(os.getenv("FAKE_LLM_TOKENS_PER_S", "40")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            citations=citations if citations in CITATION_MODES else "valid",
+            seed=int(seed) if seed else None,
+        )
+
+
+def parse_context_sources(context: str) -> List[Tuple[str, str]]:
+    """[(source_id, text)] from a context built by prompting.pack_context."""
+    heads = list(_SOURCE_HEADER.finditer(context or ""))
+    out = []
+    for i, m in enumerate(heads):
+        end = heads[i + 1].start() if i + 1 < len(heads) else len(context)
+        text = context[m.end():end].replace("\n---\n", " ").strip()
+        out.append((m.group(1), text))
+    return out
+
+
+def _first_sentence(text: str, max_chars: int = 200) -> str:
+    text = " ".join(text.split())
+    sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+    return sentence[:max_chars].rstrip(" .,;:") + "."
+
+
+class FakeLLMBackend(LLMBackend):
+    """
+    Offline stand-in for load tests: answers are stitched from the context
+    sources (so the quality gate has something real to check), with simulated
+    time-to-first-token, decode speed, failures and citation behaviour.
+    """
+
+    name = "fake"
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None):
+        self.config = config or FakeLLMConfig()
+        self._rng = random.Random(self.config.seed)
+
+    def compose_answer(self, context: str) -> str:
+        all_sources = parse_context_sources(context)
+        sources = all_sources[:2]
+        if not sources:
+            return IDK_ANSWER
+
+        mode = self.config.citations
+        if mode == "mixed":
+            mode = self._rng.choice(("valid", "none", "invalid"))
+
+        unknown = len(all_sources) + 7
+        parts = []
+        for sid, text in sources:
+            sentence = _first_sentence(text)
+            if mode == "valid":
+                parts.append(f"{sentence} [{sid}]")
+            elif mode == "invalid":
+                parts.append(f"{sentence} [S{unknown}]")
+            else:
+                parts.append(sentence)
+        return "According to the document: " + " ".join(parts)
+
+    def _check_budget(self, n_tokens: int, timeout_ms: Optional[float]) -> None:
+        cfg = self.config
+        total_ms = cfg.ttft_ms + 1000.0 * n_tokens / max(cfg.tokens_per_s, 1e-6)
+        if timeout_ms is not None and total_ms > timeout_ms:
+            time.sleep(max(timeout_ms, 0.0) / 1000.0)
+            raise TimeoutError(f"fake LLM call exceeded timeout ({timeout_ms:.0f} ms)")
+
+    def _fails(self) -> bool:
+        return self.config.error_rate > 0 and self._rng.random() < self.config.error_rate
+
+    def generate(self, query: str, context: str, model: str, timeout_ms: Optional[float] = None) -> str:
+        answer = self.compose_answer(context)
+        n_tokens = len(_TOKEN.findall(answer))
+        self._check_budget(n_tokens, timeout_ms)
+        if self._fails():
+            time.sleep(self.config.ttft_ms / 1000.0)
+            raise FakeLLMError("fake LLM error (injected)")
+        time.sleep((self.config.ttft_ms + 1000.0 * n_tokens / max(self.config.tokens_per_s, 1e-6)) / 1000.0)
+        return answer
+
+    def stream(self, query: str, context: str, model: str, timeout_ms: Optional[float] = None) -> Iterator[str]:
+        answer = self.compose_answer(context)
+        tokens = _TOKEN.findall(answer)
+        self._check_budget(len(tokens), timeout_ms)
+        fail_at = self._rng.randrange(len(tokens)) if tokens and self._fails() else None
+
+        time.sleep(self.config.ttft_ms / 1000.0)
+        per_token_s = 1.0 / max(self.config.tokens_per_s, 1e-6)
+        for i, tok in enumerate(tokens):
+            if i == fail_at:
+                raise FakeLLMError("fake LLM stream error (injected)")
+            if i:
+                time.sleep(per_token_s)
+            yield tok
+
+
+_backend: Optional[LLMBackend] = None
+_backend_key: Optional[str] = None
+
+
+def get_llm_backend() -> LLMBackend:
+    """
+    LLM_BACKEND=gemini (default) | fake. The fake backend is tuned with
+    FAKE_LLM_TTFT_MS, FAKE_LLM_TOKENS_PER_S, FAKE_LLM_ERROR_RATE,
+    FAKE_LLM_CITATIONS (valid|none|invalid|mixed) and FAKE_LLM_SEED.
+    """
+    global _backend, _backend_key
+    key = os.getenv("LLM_BACKEND", "gemini").strip().lower()
+    if _backend is None or key != _backend_key:
+        if key == "fake":
+            _backend = FakeLLMBackend(FakeLLMConfig.from_env())
+        elif key == "gemini":
+            _backend = GeminiBackend()
+        else:
+            raise ValueError(f"Unknown LLM_BACKEND: {key!r} (expected 'gemini' or 'fake')")
+        _backend_key = key
+    return _backend
+
+
+class StoppableStream:
+    """
+    A blocking delta iterator pulled from worker threads and stopped from the
+    event loop. close() on a generator that is inside next() in another thread
+    raises "generator already executing", so stop() only closes it when no
+    next() is running; otherwise the worker closes it as soon as next() returns.
+    """
+
+    def __init__(self, it: Iterator[str]):
+        self._it = it
+        self._lock = threading.Lock()
+        self._busy = False
+        self._stopped = False
+
+    def next(self) -> Optional[str]:
+        """The next delta, or None when the stream is exhausted or stopped (worker thread)."""
+        with self._lock:
+            if self._stopped:
+                return None
+            self._busy = True
+        try:
+            delta = next(self._it, None)
+        finally:
+            with self._lock:
+                self._busy = False
+                close = self._stopped
+        if close:
+            self._close()
+            return None
+        return delta
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            if self._busy:
+                return
+        self._close()
+
+    def _close(self) -> None:
+        close = getattr(self._it, "close", None)
+        if close is not None:
+            close()
+
+
+async def aiter_deltas(it: Iterator[str]) -> AsyncIterator[str]:
+    """
+    Async view of a blocking delta stream (one worker-thread hop per delta).
+    Closing or cancelling the async generator stops the upstream, so no more
+    tokens are generated (or billed); use it under contextlib.aclosing.
+    """
+    stream = StoppableStream(it)
+    try:
+        while True:
+            delta = await asyncio.to_thread(stream.next)
+            if delta is None:
+                return
+            yield delta
+    finally:
+        stream.stop()
@@ -5,9 +5,12 @@ import json
 import os
 import time
 import hashlib
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 MANIFEST_NAME = "manifest.json"
+# bumped as the very last step of an ingest / reindex: a KB's files are complete
+# for the generation they are read under
+GENERATION_NAME = "generation"
 
 
 def file_sha256(path: str) -> str:
@@ -22,6 +25,51 @@ def manifest_path(kb_dir: str) -> str:
     return os.path.join(kb_dir, MANIFEST_NAME)
 
 
+def generation_path(kb_dir: str) -> str:
+    return os.path.join(kb_dir, GENERATION_NAME)
+
+
+def kb_generation(kb_dir: str) -> int:
+    """Number of completed writes to the KB (0 for KBs written before generations)."""
+    try:
+        with open(generation_path(kb_dir), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_generation(kb_dir: str) -> int:
+    """
+    Publish a finished write to every process sharing the storage dir. Replaced
+    with a rename, so kb_version() (one stat) changes exactly once per write.
+    """
+    gen = kb_generation(kb_dir) + 1
+    path = generation_path(kb_dir)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(gen))
+    os.replace(tmp, path)
+    return gen
+
+
+def kb_version(kb_dir: str) -> str:
+    """
+    Cheap version token for caches (one stat): changes when the generation is
+    bumped. KBs from before generations fall back to the manifest, which is
+    rewritten by every ingest. "0" if the KB has neither.
+    """
+    try:
+        st = os.stat(generation_path(kb_dir))
+        return f"g{st.st_ino}:{st.st_mtime_ns}"
+    except FileNotFoundError:
+        pass
+    try:
+        st = os.stat(manifest_path(kb_dir))
+    except FileNotFoundError:
+        return "0"
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
 def load_manifest(kb_dir: str) -> Dict[str, Any]:
     mp = manifest_path(kb_dir)
     if not os.path.exists(mp):
@@ -50,30 +98,46 @@ def has_sha256(m: Dict[str, Any], sha256: str) -> bool:
     return False
 
 
-def upsert_file_record(
-    kb_dir: str,
-    filename: str,
-    file_path: str,
-    num_chunks: int,
-    mode: str,
-) -> Dict[str, Any]:
-    m = load_manifest(kb_dir)
-
-    rec = {
+def file_record(filename: str, sha256: str, num_chunks: int, mode: str) -> Dict[str, Any]:
+    return {
         "filename": filename,
-        "sha256": file_sha256(file_path),
+        "sha256": sha256,
         "num_chunks": num_chunks,
         "ingested_at": time.time(),
         "mode": mode,
     }
 
+
+def add_file_records(
+    kb_dir: str,
+    records: List[Dict[str, Any]],
+    mode: str,
+    chunk_profile: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Record several ingested files with one manifest write (bulk ingest)."""
+    m = load_manifest(kb_dir)
+    if chunk_profile:
+        m["chunk_profile"] = chunk_profile
+
     # overwrite: 清空 files；append: 追加（同名可重复，方便审计）
     if mode == "overwrite":
-        m["files"] = [rec]
+        m["files"] = list(records)
     else:
-        m["files"].append(rec)
+        m["files"].extend(records)
 
     m["total_files"] = len(m["files"])
     m["total_chunks"] = sum(x.get("num_chunks", 0) for x in m["files"])
     save_manifest(kb_dir, m)
-    return m
\ No newline at end of file
+    return m
+
+
+def upsert_file_record(
+    kb_dir: str,
+    filename: str,
+    file_path: str,
+    num_chunks: int,
+    mode: str,
+    chunk_profile: Optional[str] = None,
+) -> Dict[str, Any]:
+    rec = file_record(filename, file_sha256(file_path), num_chunks, mode)
+    return add_file_records(kb_dir, [rec], mode, chunk_profile=chunk_profile)
@@ -1,6 +1,7 @@
 import json
 import logging
 import hashlib
+import threading
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger("rag.metrics")
@@ -11,6 +12,48 @@ if not logger.handlers:
     handler.setFormatter(logging.Formatter('%(message)s'))
     logger.addHandler(handler)
 
+# In-process counters / summaries exposed by GET /metrics (per worker process)
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_summaries: Dict[str, Dict[str, float]] = {}
+
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample (e.g. a latency in ms) into a count/sum/max summary."""
+    with _lock:
+        s = _summaries.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        s["count"] += 1
+        s["sum"] += value
+        s["max"] = max(s["max"], value)
+
+
+def metrics_snapshot() -> Dict[str, Any]:
+    with _lock:
+        summaries = {
+            k: {**v, "avg": (v["sum"] / v["count"]) if v["count"] else 0.0}
+            for k, v in _summaries.items()
+        }
+        return {"counters": dict(_counters), "summaries": summaries}
+
+
+def emit_event(event: str, **fields: Any) -> None:
+    """Structured JSON log line for non-quality events (cache hits, throttling, ...)."""
+    try:
+        logger.info(json.dumps({"event": event, **fields}, ensure_ascii=False))
+    except Exception as e:
+        print(f"[metrics_error] {e}")
+
+
+def query_hash(query: str) -> str:
+    """Stable short hash logged instead of the raw query text."""
+    return "sha256:" + hashlib.sha256(query.encode("utf-8")).hexdigest()[:16]
+
+
 def emit_quality_metrics(
     kb_id: str,
     query: str,
@@ -21,15 +64,10 @@ def emit_quality_metrics(
     Emits a structured JSON log for RAG quality monitoring.
     """
     try:
-        # Use simple hash() as requested by user snippet, or sha256 for stability?
-        # User snippet used hash(query). The example JSON showed "sha256:...".
-        # I will use sha256 to match the example JSON's implication of stability.
-        query_hash = "sha256:" + hashlib.sha256(query.encode("utf-8")).hexdigest()[:16]
-
         payload = {
             "event": "rag_quality",
             "kb_id": kb_id,
-            "query_hash": query_hash,
+            "query_hash": query_hash(query),
             "metrics": {
                 "quality_gate": quality_gate.get("decision"),
                 "citation_ok": evaluation.get("citation", {}).get("ok"),
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+# <base_dir>/page_cache/<sha[:2]>/<sha256>.json.gz — extracted page text of every
+# ingested PDF, shared by all KBs (same idea as the embedding cache), so chunking
+# can be redone without the original file or another PyPDF pass.
+# Kept free of heavy imports: parse / re-chunk workers import it.
+PAGE_CACHE_DIRNAME = "page_cache"
+PAGE_CACHE_VERSION = 1
+
+# per-page keys; everything else PyPDFLoader puts in the metadata is per file
+_PAGE_KEYS = ("page", "page_label")
+
+
+def page_cache_enabled() -> bool:
+    """PAGE_CACHE=0 stops persisting extracted page text on ingest."""
+    return os.getenv("PAGE_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def page_cache_dir(base_dir: str) -> Optional[str]:
+    return os.path.join(base_dir, PAGE_CACHE_DIRNAME) if page_cache_enabled() else None
+
+
+def page_cache_path(cache_dir: str, sha256: str) -> str:
+    return os.path.join(cache_dir, sha256[:2], sha256 + ".json.gz")
+
+
+def has_pages(cache_dir: str, sha256: str) -> bool:
+    return bool(sha256) and os.path.exists(page_cache_path(cache_dir, sha256))
+
+
+def save_pages(cache_dir: str, sha256: str, pages: List[Document]) -> str:
+    """Store a file's pages (text + page / page_label, file metadata once), gzip JSON, atomic."""
+    file_md: Dict[str, Any] = {}
+    if pages:
+        file_md = {k: v for k, v in (pages[0].metadata or {}).items() if k not in _PAGE_KEYS}
+    payload = {
+        "v": PAGE_CACHE_VERSION,
+        "sha256": sha256,
+        "metadata": file_md,
+        "pages": [
+            {"page": (p.metadata or {}).get("page", i), "page_label": (p.metadata or {}).get("page_label"), "text": p.page_content}
+            for i, p in enumerate(pages)
+        ],
+    }
+    path = page_cache_path(cache_dir, sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
+
+
+def load_pages(cache_dir: str, sha256: str) -> Optional[List[Document]]:
+    """Pages as PyPDFLoader returned them, or None if the file was never cached."""
+    path = page_cache_path(cache_dir, sha256)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return None
+    file_md = payload.get("metadata") or {}
+    return [
+        Document(page_content=p["text"], metadata={**file_md, "page": p["page"], "page_label": p.get("page_label")})
+        for p in payload["pages"]
+    ]
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import os
+from typing import Dict, Optional
+
+# /proc/<pid>/smaps_rollup fields (kB) -> our keys
+_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+    "Swap": "swap",
+}
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, float]:
+    """
+    Memory of a process in MB (Linux only; empty dict elsewhere):
+      rss     every page the process maps
+      pss     shared pages split between the processes sharing them
+      uss     pages only this process has (what one more worker costs)
+      shared  pages also mapped by other processes (models / indexes from the parent)
+    """
+    path = f"/proc/{pid or os.getpid()}/smaps_rollup"
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return {}
+
+    kb: Dict[str, int] = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].rstrip(":") in _FIELDS:
+            kb[_FIELDS[parts[0].rstrip(":")]] = int(parts[1])
+
+    def mb(v: int) -> float:
+        return round(v / 1024.0, 1)
+
+    return {
+        "rss_mb": mb(kb.get("rss", 0)),
+        "pss_mb": mb(kb.get("pss", 0)),
+        "uss_mb": mb(kb.get("private_clean", 0) + kb.get("private_dirty", 0)),
+        "shared_mb": mb(kb.get("shared_clean", 0) + kb.get("shared_dirty", 0)),
+        "swap_mb": mb(kb.get("swap", 0)),
+    }
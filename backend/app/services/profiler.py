@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+PROFILES_DIRNAME = "profiles"      # <base_dir>/profiles/<kb_id>/
+PROFILE_EXT = ".folded"            # collapsed stacks, one "a;b;c <count>" per line
+PROFILE_HEADER = "X-Profile"       # per-request opt-in header
+
+DEFAULT_INTERVAL_MS = 5.0
+MAX_STACK_DEPTH = 128
+
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_.:-]+$")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # 只保留路径最后两段，site-packages 前缀对火焰图没有意义
+    parts = code.co_filename.replace("\\", "/").split("/")
+    short = "/".join(parts[-2:])
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Periodically sample the Python stack of one thread (the caller's thread by
+    default) and aggregate it in collapsed-stack format, ready for
+    flamegraph.pl / speedscope / inferno.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval_ms: float = DEFAULT_INTERVAL_MS):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = max(interval_ms, 0.5) / 1000.0
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="rag-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack: List[str] = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+                self.samples += 1
+            self._stop.wait(self.interval)
+
+    def folded(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+
+def is_truthy(value: Optional[str]) -> bool:
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def slow_threshold_ms() -> Optional[float]:
+    """
+    PROFILE_SLOW_MS enables always-on sampling; the profile is only kept
+    when the request took at least that long.
+    """
+    raw = os.getenv("PROFILE_SLOW_MS")
+    if not raw:
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256((query or "").encode("utf-8")).hexdigest()[:16]
+
+
+def profiles_dir(base_dir: str, kb_id: Optional[str] = None) -> str:
+    root = os.path.join(base_dir, PROFILES_DIRNAME)
+    return os.path.join(root, kb_id) if kb_id else root
+
+
+def save_profile(
+    base_dir: str,
+    kb_id: str,
+    query: str,
+    profiler: SamplingProfiler,
+    elapsed_ms: float,
+    trigger: str,
+) -> str:
+    out_dir = profiles_dir(base_dir, kb_id)
+    os.makedirs(out_dir, exist_ok=True)
+
+    name = f"{int(time.time() * 1000)}_{query_hash(query)}"
+    path = os.path.join(out_dir, name + PROFILE_EXT)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.folded())
+
+    meta = {
+        "name": name + PROFILE_EXT,
+        "kb_id": kb_id,
+        "query_hash": "sha256:" + query_hash(query),
+        "elapsed_ms": round(elapsed_ms, 2),
+        "samples": profiler.samples,
+        "interval_ms": profiler.interval * 1000.0,
+        "trigger": trigger,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(out_dir, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return path
+
+
+@contextmanager
+def profile_request(base_dir: str, kb_id: str, query: str, forced: bool = False) -> Iterator[Optional[SamplingProfiler]]:
+    """
+    Profile the body of a request.
+    - forced (header / query flag): always store the profile
+    - PROFILE_SLOW_MS set: sample every request, store only the slow ones
+    """
+    threshold = slow_threshold_ms()
+    if not forced and threshold is None:
+        yield None
+        return
+
+    profiler = SamplingProfiler().start()
+    t0 = time.perf_counter()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        if forced or elapsed_ms >= (threshold or 0.0):
+            try:
+                save_profile(
+                    base_dir=base_dir,
+                    kb_id=kb_id,
+                    query=query,
+                    profiler=profiler,
+                    elapsed_ms=elapsed_ms,
+                    trigger="request" if forced else "slow",
+                )
+            except Exception as e:
+                # profiling must never break the request
+                print(f"[profiler_error] {e}")
+
+
+def _safe_kb_id(kb_id: str) -> bool:
+    # kb_id becomes a path component under profiles/: no separators, no "." / ".."
+    return kb_id not in (".", "..") and bool(_SAFE_NAME.match(kb_id))
+
+
+def list_profiles(base_dir: str, kb_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    root = profiles_dir(base_dir)
+    if not os.path.isdir(root) or (kb_id and not _safe_kb_id(kb_id)):
+        return []
+
+    kb_ids = [kb_id] if kb_id else sorted(os.listdir(root))
+    out: List[Dict[str, Any]] = []
+    for kid in kb_ids:
+        d = profiles_dir(base_dir, kid)
+        if not os.path.isdir(d):
+            continue
+        for fn in os.listdir(d):
+            if not fn.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(d, fn), "r", encoding="utf-8") as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+    out.sort(key=lambda m: m.get("created_at", 0), reverse=True)
+    return out
+
+
+def profile_path(base_dir: str, kb_id: str, name: str) -> str:
+    if not _safe_kb_id(kb_id) or not _SAFE_NAME.match(name) or not name.endswith(PROFILE_EXT):
+        raise FileNotFoundError(f"Profile not found: {kb_id}/{name}")
+
+    path = os.path.join(profiles_dir(base_dir, kb_id), name)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Profile not found: {kb_id}/{name}")
+    return path
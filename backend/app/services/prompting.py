@@ -1,44 +1,213 @@
 from __future__ import annotations
-from typing import List, Dict, Tuple, Any
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Any, Optional
 from langchain_core.documents import Document
 
+DEFAULT_CONTEXT_TOKEN_BUDGET = 2000   # <= 0 disables trimming
+MIN_PARTIAL_TOKENS = 48               # don't bother sending a shorter tail of a chunk
+MIN_OVERLAP_CHARS = 20                # shorter suffix/prefix matches are coincidence
+MAX_OVERLAP_CHARS = 600               # splitter overlap is 150; leave headroom
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
 
-def build_context_with_citations(docs: List[Document]) -> Tuple[str, List[Dict[str, Any]], Dict[str, str]]:
+def estimate_tokens(text: str) -> int:
     """
-    Build LLM context with [S1], [S2] markers and return:
-    - context: string
-    - sources: list of source metadata objects
-    - source_map: { "S1": "<chunk_id>", ... }
+    Fast local token estimate (no tokenizer download).
+    Word/punctuation count, floored by the usual ~4 chars/token rule so long
+    identifiers and hashes are not under-counted.
     """
-    context_blocks = []
-    sources = []
-    source_map: Dict[str, str] = {}
+    text = text or ""
+    return max(len(_TOKEN_PATTERN.findall(text)), (len(text) + 3) // 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    end = len(text)
+    for i, m in enumerate(_TOKEN_PATTERN.finditer(text), start=1):
+        if i == max_tokens:
+            end = m.end()
+            break
+    end = min(end, max_tokens * 4)
+    return text[:end].rstrip() + " ..."
+
+
+def overlap_len(prev: str, nxt: str) -> int:
+    """
+    Length of the longest suffix of `prev` that is also a prefix of `nxt`
+    (RecursiveCharacterTextSplitter chunk_overlap region).
+    """
+    upper = min(len(prev), len(nxt), MAX_OVERLAP_CHARS)
+    for n in range(upper, MIN_OVERLAP_CHARS - 1, -1):
+        if prev.endswith(nxt[:n]):
+            return n
+    return 0
+
+
+def get_context_token_budget() -> int:
+    try:
+        return int(os.getenv("CONTEXT_TOKEN_BUDGET", str(DEFAULT_CONTEXT_TOKEN_BUDGET)))
+    except ValueError:
+        return DEFAULT_CONTEXT_TOKEN_BUDGET
+
+
+@dataclass
+class _Member:
+    rank: int
+    sid: str
+    doc: Document
+    text: str
+    group: Tuple[Any, Any]
+    chunk_index: Optional[int]
+
+
+@dataclass
+class PackedContext:
+    context: str
+    sources: List[Dict[str, Any]]
+    source_map: Dict[str, str]
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+
+def _header(m: _Member) -> str:
+    md = m.doc.metadata or {}
+    return f"[{m.sid}] (page={md.get('page_label', md.get('page'))}, chunk_id={md.get('chunk_id', '')})\n"
 
+
+_SOURCE_FIELDS = ("chunk_id", "chunk_index", "kb_id", "filename", "file_sha256", "page", "page_label", "total_pages")
+
+
+def _source_record(m: _Member) -> Dict[str, Any]:
+    md = m.doc.metadata or {}
+    rec: Dict[str, Any] = {"source_id": m.sid}
+    rec.update({k: md.get(k) for k in _SOURCE_FIELDS})
+    rec["chunk_id"] = rec["chunk_id"] or ""
+    rec["content_preview"] = m.doc.page_content[:220]
+    # only what the fields above don't already carry (PDF info); full metadata via /kb/chunk
+    rec["metadata"] = {k: v for k, v in md.items() if k not in _SOURCE_FIELDS}
+    return rec
+
+
+def pack_context(docs: List[Document], token_budget: Optional[int] = None) -> PackedContext:
+    """
+    Token-budget-aware version of the [S#] context:
+    - [S#] ids follow the input (rerank) order, so S# -> chunk_id stays stable
+    - adjacent chunks of the same file/page are rendered as one block and the
+      splitter overlap is sent only once
+    - sources are admitted in rank order until the token budget is used up;
+      the last one may be cut short, the rest are dropped (no gaps in S#)
+    """
+    budget = get_context_token_budget() if token_budget is None else token_budget
+
+    members: List[_Member] = []
     for i, doc in enumerate(docs, start=1):
-        sid = f"S{i}"
         md = doc.metadata or {}
+        members.append(_Member(
+            rank=i,
+            sid=f"S{i}",
+            doc=doc,
+            text=doc.page_content.strip(),
+            group=(md.get("file_sha256") or md.get("filename"), md.get("page")),
+            chunk_index=md.get("chunk_index"),
+        ))
+
+    def predecessor(m: _Member, pool: List[_Member]) -> Optional[_Member]:
+        if m.chunk_index is None:
+            return None
+        for p in pool:
+            if p.group == m.group and p.chunk_index == m.chunk_index - 1:
+                return p
+        return None
+
+    # 1) admit sources in rank order under the budget
+    selected: List[_Member] = []
+    used_tokens = 0
+    truncated = 0
+    for m in members:
+        prev = predecessor(m, selected)
+        ov = overlap_len(prev.text, m.text) if prev else 0
+        cost = estimate_tokens(_header(m)) + estimate_tokens(m.text[ov:])
+
+        if budget > 0 and used_tokens + cost > budget:
+            remaining = budget - used_tokens - estimate_tokens(_header(m))
+            if remaining >= MIN_PARTIAL_TOKENS:
+                # the overlap is stripped again at render time, so it is free
+                m.text = truncate_to_tokens(m.text, remaining + estimate_tokens(m.text[:ov]))
+                selected.append(m)
+                truncated += 1
+            break
+
+        selected.append(m)
+        used_tokens += cost
 
-        chunk_id = md.get("chunk_id", "")
-        source_map[sid] = chunk_id
-
-        context_blocks.append(
-            f"[{sid}] (page={md.get('page_label', md.get('page'))}, chunk_id={chunk_id})\n"
-            f"{doc.page_content.strip()}\n"
-        )
-
-        sources.append({
-            "source_id": sid,
-            "chunk_id": chunk_id,
-            "chunk_index": md.get("chunk_index"),
-            "kb_id": md.get("kb_id"),
-            "filename": md.get("filename"),
-            "file_sha256": md.get("file_sha256"),
-            "page": md.get("page"),
-            "page_label": md.get("page_label"),
-            "total_pages": md.get("total_pages"),
-            "content_preview": doc.page_content[:220],
-            "metadata": md,
-        })
+    # 2) merge runs of consecutive chunks (same file + page) into blocks
+    runs: List[List[_Member]] = []
+    for m in sorted(selected, key=lambda x: (str(x.group), x.chunk_index if x.chunk_index is not None else -1, x.rank)):
+        last = runs[-1][-1] if runs else None
+        if (
+            last is not None
+            and m.chunk_index is not None
+            and last.chunk_index is not None
+            and last.group == m.group
+            and m.chunk_index == last.chunk_index + 1
+        ):
+            runs[-1].append(m)
+        else:
+            runs.append([m])
+    runs.sort(key=lambda run: min(x.rank for x in run))
+
+    context_blocks = []
+    overlap_chars = 0
+    for run in runs:
+        parts = []
+        prev_text: Optional[str] = None
+        for m in run:
+            body = m.text
+            if prev_text is not None:
+                n = overlap_len(prev_text, body)
+                overlap_chars += n
+                body = body[n:].lstrip()
+            parts.append(_header(m) + body + "\n")
+            prev_text = m.text
+        context_blocks.append("".join(parts))
 
     context = "\n---\n".join(context_blocks)
-    return context, sources, source_map
\ No newline at end of file
+
+    ordered = sorted(selected, key=lambda x: x.rank)
+    return PackedContext(
+        context=context,
+        sources=[_source_record(m) for m in ordered],
+        source_map={m.sid: (m.doc.metadata or {}).get("chunk_id", "") for m in ordered},
+        stats={
+            "token_budget": budget,
+            "tokens_est": estimate_tokens(context),
+            "blocks": len(runs),
+            "merged_chunks": len(selected) - len(runs),
+            "overlap_chars_removed": overlap_chars,
+            "truncated": truncated,
+            "dropped": len(members) - len(selected),
+        },
+    )
+
+
+def build_context_with_citations(
+    docs: List[Document],
+    token_budget: Optional[int] = None,
+) -> Tuple[str, List[Dict[str, Any]], Dict[str, str]]:
+    """
+    Build LLM context with [S1], [S2] markers and return:
+    - context: string
+    - sources: list of source metadata objects
+    - source_map: { "S1": "<chunk_id>", ... }
+    Overlapping neighbours are merged and the context is kept within
+    CONTEXT_TOKEN_BUDGET (see pack_context).
+    """
+    packed = pack_context(docs, token_budget=token_budget)
+    return packed.context, packed.sources, packed.source_map
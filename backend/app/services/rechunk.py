@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from app.services.bulk_ingest import get_bulk_parse_workers, run_per_file
+from app.services.embedding_store import embed_documents_cached, kb_index_storage
+from app.services.ingestion import chunk_cached_pdf, get_chunk_profile, get_default_chunk_profile
+from app.services.kb_store import kb_changed, kb_dir, refresh_filters, write_chunks
+from app.services.manifest_store import load_manifest, save_manifest
+from app.services.metrics import incr, observe
+from app.services.page_cache import PAGE_CACHE_DIRNAME, has_pages
+from app.services.shard_search import read_shard_layout
+
+
+class PagesNotCached(FileNotFoundError):
+    """Some of the KB's files were ingested before the page cache (or with PAGE_CACHE=0)."""
+
+    def __init__(self, kb_id: str, files: List[str]):
+        super().__init__(f"No cached pages for {len(files)} file(s) of KB '{kb_id}'; re-ingest them once")
+        self.files = files
+
+
+def rechunk_kb(
+    kb_id: str,
+    base_dir: str,
+    profile: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Re-chunk every file of a KB from the page cache with a chunk profile (default:
+    the KB's current one) and rebuild its index: no PDFs, no parsing. Files are
+    chunked in parallel; chunk text seen before is not re-embedded. The shard
+    count and vector storage of the KB are kept.
+    """
+    t0 = time.perf_counter()
+    path = kb_dir(base_dir, kb_id)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"KB not found: {path}")
+    manifest = load_manifest(path)
+    profile = profile or manifest.get("chunk_profile") or get_default_chunk_profile()
+    get_chunk_profile(profile)                      # unknown profile: fail before any work
+    # read the cache even when PAGE_CACHE=0 stopped new writes
+    cache_dir = os.path.join(base_dir, PAGE_CACHE_DIRNAME)
+
+    files = manifest.get("files", [])
+    missing = [rec.get("filename") or rec.get("sha256", "") for rec in files if not has_pages(cache_dir, rec.get("sha256", ""))]
+    if missing:
+        raise PagesNotCached(kb_id, missing)
+
+    results, failed = run_per_file(chunk_cached_pdf, [
+        (rec.get("filename", ""), {"page_cache_dir": cache_dir, "file_sha256": rec["sha256"], "kb_id": kb_id,
+                                   "filename": rec.get("filename", ""), "profile": profile})
+        for rec in files
+    ], workers or get_bulk_parse_workers())
+    if failed:
+        raise ValueError(f"Re-chunking failed for {len(failed)} file(s): {failed[:3]}")
+    t_chunk = time.perf_counter()
+
+    chunks: List[Document] = [d for docs in results for d in (docs or [])]
+    vectors = embed_documents_cached(chunks, base_dir=base_dir)
+    t_embed = time.perf_counter()
+
+    layout = read_shard_layout(path)
+    num_shards = int(layout["num_shards"]) if layout else 1
+    storage = layout.get("index_storage", "flat") if layout else kb_index_storage(path)
+    _, _, vs, _ = write_chunks(kb_id, base_dir, chunks, vectors, "overwrite", num_shards=num_shards, storage=storage)
+
+    previous_chunks = manifest.get("total_chunks", 0)
+    for rec, docs in zip(files, results):
+        rec["num_chunks"] = len(docs or [])
+    manifest["chunk_profile"] = profile
+    manifest["total_chunks"] = len(chunks)
+    save_manifest(path, manifest)
+    refresh_filters(path, vs)
+    generation = kb_changed(kb_id, base_dir)
+    t_write = time.perf_counter()
+
+    incr("rechunk.files", len(files))
+    observe("rechunk.ms", (t_write - t0) * 1000.0)
+    return {
+        "kb_id": kb_id,
+        "chunk_profile": profile,
+        "profile_settings": get_chunk_profile(profile),
+        "files": len(files),
+        "previous_chunks": previous_chunks,
+        "num_chunks": len(chunks),
+        "num_shards": num_shards,
+        "index_storage": storage,
+        "generation": generation,
+        "timings_s": {
+            "chunk": round(t_chunk - t0, 3),
+            "embed": round(t_embed - t_chunk, 3),
+            "write": round(t_write - t_embed, 3),
+            "total": round(t_write - t0, 3),
+        },
+    }
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+from langchain_core.documents import Document
+
+from app.services.deadline import LLM_MIN_MS, Deadline
+from app.services.metrics import incr, observe
+
+DEFAULT_NODE_TIMEOUT_MS = 2000.0
+MIN_NODE_TIMEOUT_MS = 50.0
+
+# degradation label (Deadline.report) when some nodes did not answer in time
+NODES_PARTIAL = "retrieval_nodes_partial"
+
+
+def retrieval_node_enabled() -> bool:
+    """RETRIEVAL_NODE=1 exposes /node/* so coordinators can search this process's local KBs."""
+    return os.getenv("RETRIEVAL_NODE", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_node_timeout_ms() -> float:
+    try:
+        return max(MIN_NODE_TIMEOUT_MS, float(os.getenv("NODE_TIMEOUT_MS", str(DEFAULT_NODE_TIMEOUT_MS))))
+    except ValueError:
+        return DEFAULT_NODE_TIMEOUT_MS
+
+
+def get_node_version_ttl_s() -> float:
+    """NODE_VERSION_TTL_S: how long a coordinator reuses the KB version it read from the nodes (default 1)."""
+    try:
+        return max(0.0, float(os.getenv("NODE_VERSION_TTL_S", "1")))
+    except ValueError:
+        return 1.0
+
+
+def get_retrieval_nodes(kb_id: str) -> List[str]:
+    """
+    Coordinator mode: RETRIEVAL_NODES lists the nodes that host a KB.
+      http://a:8101,http://b:8102                          every KB on these nodes
+      {"big_tenant": ["http://a:8101"], "*": ["http://b:8102"]}
+    Empty / unset: KBs are local.
+    """
+    raw = os.getenv("RETRIEVAL_NODES", "").strip()
+    if not raw:
+        return []
+    if raw.startswith("{"):
+        mapping = json.loads(raw)
+        nodes = mapping.get(kb_id, mapping.get("*", []))
+    else:
+        nodes = raw.split(",")
+    return [n.strip().rstrip("/") for n in nodes if n and n.strip()]
+
+
+# ---------------------------------------------------------------------------
+# node side
+# ---------------------------------------------------------------------------
+
+def serialize_hits(scored: List[Tuple[Document, float]]) -> List[Dict[str, Any]]:
+    return [{"distance": float(dist), "page_content": d.page_content, "metadata": d.metadata or {}} for d, dist in scored]
+
+
+# ---------------------------------------------------------------------------
+# coordinator side
+# ---------------------------------------------------------------------------
+
+class NodesUnavailable(RuntimeError):
+    """No retrieval node answered for the KB (all timed out or failed)."""
+
+    def __init__(self, kb_id: str, report: Dict[str, Any]):
+        super().__init__(f"No retrieval node answered for KB '{kb_id}'")
+        self.report = report
+
+
+class KBNotOnNodes(FileNotFoundError):
+    """Every node answered, none hosts the KB."""
+
+
+_session_local = threading.local()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _session() -> requests.Session:
+    # one keep-alive session per fan-out thread
+    s = getattr(_session_local, "session", None)
+    if s is None:
+        s = requests.Session()
+        _session_local.session = s
+    return s
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("NODE_FANOUT_THREADS", "32")), thread_name_prefix="node-fanout",
+            )
+        return _executor
+
+
+class RemoteKB:
+    """
+    A KB hosted by retrieval nodes (RETRIEVAL_NODES). Each search embeds the
+    query once on the coordinator, sends the vector to every node at the same
+    time, and merges the per-node top-k by distance. Nodes that time out or fail
+    are skipped; `last_report` says which, and the answer is built from the rest.
+    """
+
+    def __init__(self, kb_id: str, nodes: List[str], timeout_ms: Optional[float] = None):
+        self.kb_id = kb_id
+        self.nodes = nodes
+        self.timeout_ms = timeout_ms or get_node_timeout_ms()
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    def _timeout_s(self, deadline: Optional[Deadline]) -> float:
+        ms = self.timeout_ms
+        if deadline is not None and deadline.bounded:
+            # leave the LLM its minimum; never wait longer than the configured node timeout
+            ms = min(ms, max(MIN_NODE_TIMEOUT_MS, deadline.remaining_ms() - LLM_MIN_MS))
+        return ms / 1000.0
+
+    def _search_node(self, node: str, body: Dict[str, Any], timeout_s: float) -> Tuple[int, Any]:
+        r = _session().post(f"{node}/node/search", json=body, timeout=timeout_s)
+        if r.status_code == 404:
+            return 404, None
+        r.raise_for_status()
+        return 200, r.json().get("hits", [])
+
+    def search_with_scores(
+        self,
+        vector,
+        k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> List[Tuple[Document, float]]:
+        if k <= 0:
+            return []
+        body = {
+            "kb_id": self.kb_id,
+            "vector": np.asarray(vector, dtype="float32").reshape(-1).tolist(),
+            "k": k,
+            "filters": filters or None,
+        }
+        timeout_s = self._timeout_s(deadline)
+        t0 = time.perf_counter()
+        ex = _get_executor()
+        futures = {ex.submit(self._search_node, n, body, timeout_s): n for n in self.nodes}
+        done, not_done = wait(futures, timeout=timeout_s + 0.05)
+
+        hits: List[Tuple[float, int, int, Dict[str, Any]]] = []
+        failed: List[Dict[str, str]] = [{"node": futures[f], "error": "timeout"} for f in not_done]
+        ok, not_hosted = 0, 0
+        for i, f in enumerate(futures):
+            if f not in done:
+                f.cancel()
+                continue
+            try:
+                status, node_hits = f.result()
+            except requests.Timeout:
+                failed.append({"node": futures[f], "error": "timeout"})
+                continue
+            except Exception as e:
+                failed.append({"node": futures[f], "error": f"{type(e).__name__}: {e}"[:200]})
+                continue
+            if status == 404:
+                not_hosted += 1
+                continue
+            ok += 1
+            hits.extend((float(h["distance"]), i, rank, h) for rank, h in enumerate(node_hits))
+
+        self.last_report = {
+            "nodes": len(self.nodes),
+            "ok": ok,
+            "not_hosted": not_hosted,
+            "failed": failed,
+            "partial": bool(failed) and ok > 0,
+            "timeout_ms": round(timeout_s * 1000.0, 1),
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+        }
+        incr("retrieval_nodes.search")
+        incr("retrieval_nodes.failed", len(failed))
+        observe("retrieval_nodes.ms", (time.perf_counter() - t0) * 1000.0)
+
+        if ok == 0:
+            if failed:
+                raise NodesUnavailable(self.kb_id, self.last_report)
+            raise KBNotOnNodes(f"KB not found on any retrieval node: {self.kb_id}")
+        if failed and deadline is not None:
+            deadline.degrade(NODES_PARTIAL)
+
+        # replicas of the same shard return the same chunks: keep the first (closest) copy
+        out: List[Tuple[Document, float]] = []
+        seen = set()
+        for dist, _, _, h in sorted(hits, key=lambda x: x[:3]):
+            md = h.get("metadata") or {}
+            cid = md.get("chunk_id")
+            if cid and cid in seen:
+                continue
+            seen.add(cid)
+            out.append((Document(page_content=h.get("page_content", ""), metadata=md), dist))
+            if len(out) == k:
+                break
+        return out
+
+    def version(self, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """remote_kb_version() within this KB's node timeout (and the request's budget)."""
+        return remote_kb_version(self.kb_id, self.nodes, timeout_s=self._timeout_s(deadline))
+
+    def find_chunk_by_id(self, chunk_id: str) -> Optional[Document]:
+        timeout_s = self._timeout_s(None)
+        for node in self.nodes:
+            try:
+                r = _session().get(
+                    f"{node}/node/chunk", params={"kb_id": self.kb_id, "chunk_id": chunk_id}, timeout=timeout_s,
+                )
+            except requests.RequestException:
+                continue
+            if r.status_code == 200:
+                payload = r.json()
+                return Document(page_content=payload["page_content"], metadata=payload.get("metadata") or {})
+        return None
+
+
+_versions: Dict[Tuple[str, Tuple[str, ...]], Tuple[float, Optional[str]]] = {}
+_versions_lock = threading.Lock()
+
+
+def _node_generation(node: str, kb_id: str, timeout_s: float) -> str:
+    r = _session().get(f"{node}/node/info", params={"kb_id": kb_id}, timeout=timeout_s)
+    r.raise_for_status()
+    for kb in r.json().get("kbs", []):
+        if kb.get("kb_id") == kb_id:
+            return str(kb.get("generation", 0))
+    return "-"                                  # node doesn't host the KB
+
+
+def remote_kb_version(kb_id: str, nodes: List[str], timeout_s: Optional[float] = None) -> Optional[str]:
+    """
+    Version of a KB hosted on retrieval nodes, for cache keys: the generations
+    the nodes report in /node/info, hashed together, so an ingest on any node
+    changes it. None when a node does not answer (the caller must not cache).
+    Reused for NODE_VERSION_TTL_S so cache lookups don't cost a round trip each.
+    """
+    key = (kb_id, tuple(nodes))
+    now = time.monotonic()
+    ttl = get_node_version_ttl_s()
+    with _versions_lock:
+        hit = _versions.get(key)
+    if hit is not None and now - hit[0] < ttl:
+        return hit[1]
+
+    if timeout_s is None:
+        timeout_s = get_node_timeout_ms() / 1000.0
+    futures = {_get_executor().submit(_node_generation, n, kb_id, timeout_s): n for n in nodes}
+    done, not_done = wait(futures, timeout=timeout_s + 0.05)
+    version: Optional[str] = None
+    try:
+        if not not_done:
+            generations = sorted(f"{futures[f]}={f.result()}" for f in done)
+            version = "nodes:" + hashlib.sha256("|".join(generations).encode("utf-8")).hexdigest()[:16]
+    except Exception:
+        version = None
+    if version is None:
+        incr("retrieval_nodes.version_unknown")
+        for f in not_done:
+            f.cancel()
+    with _versions_lock:
+        _versions[key] = (now, version)
+    return version
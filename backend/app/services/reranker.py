@@ -1,10 +1,13 @@
 from __future__ import annotations
 
-from typing import List
+import math
+from typing import List, Optional, Tuple
 
 from langchain_core.documents import Document
 from sentence_transformers import CrossEncoder
 
+from app.services.deadline import Deadline
+
 _MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 
 _reranker: CrossEncoder | None = None
@@ -17,19 +20,57 @@ def _get_reranker() -> CrossEncoder:
     return _reranker
 
 
-def rerank_docs(query: str, docs: List[Document], top_k: int = 3) -> List[Document]:
+def load_reranker() -> None:
+    """Load the cross-encoder now (pre-fork parents load it once for every worker)."""
+    _get_reranker()
+
+
+def calibrate_score(logit: float) -> float:
     """
-    Re-rank retrieved docs using a cross-encoder.
-    Input: query + candidate docs
-    Output: top_k docs sorted by relevance (highest score first)
+    ms-marco cross-encoders output relevance logits; squash to (0, 1) so
+    thresholds are comparable across queries and KBs.
+    """
+    x = float(logit)
+    if x >= 0:
+        return 1.0 / (1.0 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1.0 + z)
+
+
+def rerank_docs_with_scores(
+    query: str,
+    docs: List[Document],
+    top_k: int = 3,
+    deadline: Optional[Deadline] = None,
+) -> List[Tuple[Document, Optional[float]]]:
+    """
+    Same as rerank_docs, but also return the calibrated relevance score
+    (0..1, higher is better) of each kept doc.
+    With a `deadline`, only the best-by-vector candidates the budget allows are
+    reranked; if there is no time at all, vector order is kept and scores are None.
     """
     if not docs:
         return []
 
+    if deadline is not None:
+        n = deadline.plan_rerank(len(docs), top_k=top_k)
+        if n == 0:
+            return [(d, None) for d in docs[:top_k]]
+        docs = docs[:n]
+
     model = _get_reranker()
 
     pairs = [(query, d.page_content) for d in docs]
     scores = model.predict(pairs)
 
     ranked = sorted(zip(docs, scores), key=lambda x: float(x[1]), reverse=True)
-    return [d for d, _ in ranked[:top_k]]
+    return [(d, calibrate_score(s)) for d, s in ranked[:top_k]]
+
+
+def rerank_docs(query: str, docs: List[Document], top_k: int = 3) -> List[Document]:
+    """
+    Re-rank retrieved docs using a cross-encoder.
+    Input: query + candidate docs
+    Output: top_k docs sorted by relevance (highest score first)
+    """
+    return [d for d, _ in rerank_docs_with_scores(query=query, docs=docs, top_k=top_k)]
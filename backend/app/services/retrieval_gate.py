@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from app.services.error_taxonomy import LOW_CONFIDENCE, RETRIEVAL_MISS
+
+GATE_CONFIG_NAME = "retrieval_gate.json"   # optional per-KB overrides in <kb_dir>/
+
+DEFAULT_GATE_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    # calibrated cross-encoder relevance (0..1) of the best candidate;
+    # below this the answer would be discarded by the quality gate anyway
+    "min_rerank_score": 0.01,
+    # squared L2 distance of the closest candidate (normalized MiniLM vectors, 0..4);
+    # 1.9 ~ cosine 0.05, i.e. nothing even loosely related was found
+    "max_vector_distance": 1.9,
+    # optional hard floor: below it we reject instead of falling back (None = never)
+    "reject_rerank_score": None,
+}
+
+
+def _env_float(name: str) -> Optional[float]:
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+def load_gate_config(kb_dir: str) -> Dict[str, Any]:
+    """
+    Defaults <- env (RETRIEVAL_GATE_*) <- <kb_dir>/retrieval_gate.json
+    """
+    cfg = dict(DEFAULT_GATE_CONFIG)
+
+    if os.getenv("RETRIEVAL_GATE_ENABLED", "1").strip().lower() in ("0", "false", "no", "off"):
+        cfg["enabled"] = False
+    for key, env in (
+        ("min_rerank_score", "RETRIEVAL_GATE_MIN_RERANK_SCORE"),
+        ("max_vector_distance", "RETRIEVAL_GATE_MAX_VECTOR_DISTANCE"),
+        ("reject_rerank_score", "RETRIEVAL_GATE_REJECT_RERANK_SCORE"),
+    ):
+        v = _env_float(env)
+        if v is not None:
+            cfg[key] = v
+
+    path = os.path.join(kb_dir, GATE_CONFIG_NAME)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cfg.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"[retrieval_gate] ignoring bad {path}: {e}")
+
+    return cfg
+
+
+def retrieval_gate_decision(
+    rerank_scores: List[Optional[float]],
+    distances: List[float],
+    config: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Pre-generation gate: decide whether retrieval is strong enough to be worth
+    an LLM call.
+    decision:
+      - generate: call the LLM as usual
+      - fallback: skip the LLM, answer with build_fallback_answer
+      - reject:   nothing usable was retrieved
+    Scores may be None when reranking was skipped (deadline); then only the
+    vector distance is checked.
+    """
+    cfg = config or DEFAULT_GATE_CONFIG
+    known_scores = [s for s in rerank_scores if s is not None]
+    best_score = max(known_scores) if known_scores else None
+    best_distance = min(distances) if distances else None
+
+    out: Dict[str, Any] = {
+        "decision": "generate",
+        "reason": "ok",
+        "best_rerank_score": best_score,
+        "best_vector_distance": best_distance,
+    }
+
+    if not rerank_scores:
+        out.update(decision="reject", reason=RETRIEVAL_MISS)
+        return out
+
+    if not cfg.get("enabled", True):
+        return out
+
+    reject_below = cfg.get("reject_rerank_score")
+    if reject_below is not None and best_score is not None and best_score < float(reject_below):
+        out.update(decision="reject", reason=LOW_CONFIDENCE)
+        return out
+
+    min_score = cfg.get("min_rerank_score")
+    if min_score is not None and best_score is not None and best_score < float(min_score):
+        out.update(decision="fallback", reason=LOW_CONFIDENCE)
+        return out
+
+    max_distance = cfg.get("max_vector_distance")
+    if max_distance is not None and best_distance is not None and best_distance > float(max_distance):
+        out.update(decision="fallback", reason=LOW_CONFIDENCE)
+        return out
+
+    return out
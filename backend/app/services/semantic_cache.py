@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import copy
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from app.services.metrics import emit_event, incr, query_hash
+
+DEFAULT_THRESHOLD = 0.92          # cosine similarity between query embeddings
+DEFAULT_MAX_ENTRIES_PER_KB = 2000
+DEFAULT_AUDIT_RATE = 0.05         # fraction of hits re-checked against fresh retrieval
+LOOKUP_K = 5                      # neighbours inspected per lookup (params must match too)
+
+
+@dataclass
+class CacheEntry:
+    query: str
+    vector: np.ndarray
+    params: Tuple[Any, ...]       # (fetch_k, top_k): different params -> different answer
+    payload: Dict[str, Any]       # full /ask-kb response of an accepted answer
+    created_at: float
+    hits: int = 0
+
+
+class _KBCache:
+    def __init__(self, version: str, dim: int):
+        self.version = version
+        self.index = faiss.IndexFlatIP(dim)
+        self.entries: List[CacheEntry] = []
+
+    def rebuild(self, entries: List[CacheEntry]) -> None:
+        self.index.reset()
+        self.entries = entries
+        if entries:
+            self.index.add(np.stack([e.vector for e in entries]))
+
+
+def _normalize(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype="float32").reshape(-1)
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+
+class SemanticAnswerCache:
+    """
+    Per-KB near-duplicate query cache for accepted answers.
+
+    - one small FAISS inner-product index per kb_id over normalized query embeddings
+    - an entry is only served while the KB version it was computed on is current
+      (any ingest changes the version and drops the whole KB partition)
+    - only answers whose quality_gate decision was "accept" are stored
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries_per_kb: int = DEFAULT_MAX_ENTRIES_PER_KB,
+        audit_rate: float = DEFAULT_AUDIT_RATE,
+    ):
+        self.threshold = threshold
+        self.max_entries_per_kb = max_entries_per_kb
+        self.audit_rate = audit_rate
+        self._kbs: Dict[str, _KBCache] = {}
+        self._lock = threading.Lock()
+
+    def _partition(self, kb_id: str, version: str, dim: int) -> _KBCache:
+        part = self._kbs.get(kb_id)
+        if part is None or part.version != version or part.index.d != dim:
+            if part is not None:
+                incr("semantic_cache.invalidated", len(part.entries))
+            part = _KBCache(version=version, dim=dim)
+            self._kbs[kb_id] = part
+        return part
+
+    def lookup(
+        self,
+        kb_id: str,
+        version: str,
+        query_vector,
+        params: Tuple[Any, ...],
+    ) -> Optional[Tuple[CacheEntry, float]]:
+        q = _normalize(query_vector)
+        incr("semantic_cache.lookup")
+        with self._lock:
+            part = self._partition(kb_id, version, q.shape[0])
+            if part.index.ntotal == 0:
+                incr("semantic_cache.miss")
+                return None
+
+            sims, idxs = part.index.search(q.reshape(1, -1), min(LOOKUP_K, part.index.ntotal))
+            for sim, idx in zip(sims[0], idxs[0]):
+                if idx < 0 or float(sim) < self.threshold:
+                    break
+                entry = part.entries[idx]
+                if entry.params == params:
+                    entry.hits += 1
+                    incr("semantic_cache.hit")
+                    return entry, float(sim)
+
+        incr("semantic_cache.miss")
+        return None
+
+    def store(
+        self,
+        kb_id: str,
+        version: str,
+        query: str,
+        query_vector,
+        params: Tuple[Any, ...],
+        payload: Dict[str, Any],
+    ) -> bool:
+        if (payload.get("quality_gate") or {}).get("decision") != "accept" or payload.get("fallback_used"):
+            return False
+
+        q = _normalize(query_vector)
+        entry = CacheEntry(query=query, vector=q, params=params, payload=copy.deepcopy(payload), created_at=time.time())
+        with self._lock:
+            part = self._partition(kb_id, version, q.shape[0])
+            if len(part.entries) >= self.max_entries_per_kb:
+                # drop the oldest quarter and rebuild (IndexFlat has no cheap delete)
+                part.rebuild(part.entries[self.max_entries_per_kb // 4:])
+            part.entries.append(entry)
+            part.index.add(q.reshape(1, -1))
+        incr("semantic_cache.store")
+        return True
+
+    def evict(self, kb_id: str, entry: CacheEntry) -> None:
+        with self._lock:
+            part = self._kbs.get(kb_id)
+            if part is not None and entry in part.entries:
+                part.rebuild([e for e in part.entries if e is not entry])
+
+    def should_audit(self) -> bool:
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def record_audit(self, kb_id: str, entry: CacheEntry, query: str, similarity: float, ok: bool) -> None:
+        incr("semantic_cache.audit")
+        if ok:
+            return
+        incr("semantic_cache.false_hit")
+        emit_event(
+            "semantic_cache_false_hit",
+            kb_id=kb_id,
+            similarity=round(similarity, 4),
+            cached_query_hash=query_hash(entry.query),
+            query_hash=query_hash(query),
+        )
+        self.evict(kb_id, entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "audit_rate": self.audit_rate,
+                "kbs": {kb_id: {"version": p.version, "entries": len(p.entries)} for kb_id, p in self._kbs.items()},
+            }
+
+
+def cached_answer(entry: CacheEntry, query: str, similarity: float) -> Dict[str, Any]:
+    """Response body for a cache hit: the stored answer, re-labelled for this query."""
+    payload = copy.deepcopy(entry.payload)
+    payload["query"] = query
+    payload["cache"] = {
+        "hit": True,
+        "similarity": round(similarity, 4),
+        "cached_query": entry.query,
+        "cached_at": entry.created_at,
+    }
+    return payload
+
+
+def cited_chunk_ids(payload: Dict[str, Any]) -> List[str]:
+    """chunk_ids the cached answer actually cites (what an audit must find again)."""
+    source_map = payload.get("source_map") or {}
+    used = ((payload.get("final_evaluation") or {}).get("citation") or {}).get("used") or []
+    return [source_map[sid] for sid in used if sid in source_map]
+
+
+_cache: Optional[SemanticAnswerCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticAnswerCache]:
+    """
+    Process-wide cache, enabled with SEMANTIC_CACHE=1.
+    Tuning: SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_AUDIT_RATE.
+    """
+    global _cache
+    if os.getenv("SEMANTIC_CACHE", "0").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    if _cache is None:
+        _cache = SemanticAnswerCache(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", str(DEFAULT_THRESHOLD))),
+            max_entries_per_kb=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES_PER_KB))),
+            audit_rate=float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", str(DEFAULT_AUDIT_RATE))),
+        )
+    return _cache
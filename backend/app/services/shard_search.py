@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import atexit
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.services.chunk_store import load_chunk
+from app.services.compact_docstore import compact_vector_store
+from app.services.compact_index import attach_full_vectors, is_compact, rescore_search
+from app.services.filter_index import filtered_search, get_filter_index
+from app.services.index_io import index_mmap_enabled, index_stamp, read_vector_store
+from app.services.metrics import incr, observe
+
+# <kb_dir>/shards/shards.json          {"num_shards", "assign", "index_storage", "created_at"}
+# <kb_dir>/shards/shard_000/ ...       index.faiss, index.pkl, embeddings.npy/json, filter_index.json
+# manifest.json, chunks/ and gate config stay in <kb_dir>.
+# Kept free of vector_store/embedding_store imports: shard workers must not load the embedding model.
+SHARDS_DIRNAME = "shards"
+SHARDS_META = "shards.json"
+SHARD_EMBEDDINGS_NPY = "embeddings.npy"      # embedding_store.EMBEDDINGS_NPY
+
+
+def shards_root(kb_dir: str) -> str:
+    return os.path.join(kb_dir, SHARDS_DIRNAME)
+
+
+def shard_dir(kb_dir: str, shard_no: int) -> str:
+    return os.path.join(shards_root(kb_dir), f"shard_{shard_no:03d}")
+
+
+def read_shard_layout(kb_dir: str) -> Optional[Dict[str, Any]]:
+    """shards.json of a sharded KB, None for a single-index KB."""
+    path = os.path.join(shards_root(kb_dir), SHARDS_META)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_sharded(kb_dir: str) -> bool:
+    return read_shard_layout(kb_dir) is not None
+
+
+def shard_of(file_sha256: str, num_shards: int) -> int:
+    """All chunks of a file go to one shard, so an append rewrites only that shard."""
+    return int(file_sha256[:8] or "0", 16) % num_shards if num_shards > 1 else 0
+
+
+# ---------------------------------------------------------------------------
+# worker side: shards loaded once per process, reloaded when their files change
+# ---------------------------------------------------------------------------
+
+class VectorOnlyEmbeddings(Embeddings):
+    """Shard searches receive query vectors; nothing is embedded in a worker."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError("shard workers search by vector only")
+
+    def embed_query(self, text: str) -> List[float]:
+        raise NotImplementedError("shard workers search by vector only")
+
+
+_loaded: Dict[str, Tuple[Tuple[int, ...], FAISS]] = {}
+_loaded_lock = threading.Lock()
+
+
+def load_shard(path: str, cache: bool = True) -> FAISS:
+    """cache=False for one-off loads (appends, filter rebuilds) in the server process."""
+    stamp = index_stamp(path)
+    with _loaded_lock:
+        hit = _loaded.get(path) if cache else None
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+
+    # cached (query-path) shards honour KB_INDEX_MMAP; one-off loads get a writable copy
+    vs = read_vector_store(path, VectorOnlyEmbeddings(), mmap=cache and index_mmap_enabled())
+    if is_compact(vs.index):
+        npy = os.path.join(path, SHARD_EMBEDDINGS_NPY)
+        attach_full_vectors(vs, np.load(npy, mmap_mode="r") if os.path.exists(npy) else None)
+    compact_vector_store(vs)
+    if cache:
+        with _loaded_lock:
+            _loaded[path] = (stamp, vs)
+    return vs
+
+
+def search_shard(
+    path: str,
+    kb_dir: str,
+    vector: np.ndarray,
+    k: int,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Tuple[float, Document]]:
+    """Top-k (distance, doc) of one shard; same scoring as vector_store.search_top_k_with_scores."""
+    vs = load_shard(path)
+    if filters:
+        mask = get_filter_index(vs, path, manifest_dir=kb_dir).mask(filters)
+        pairs = filtered_search(vs, vector, k, mask)
+    elif is_compact(vs.index):
+        pairs = rescore_search(vs, vector, k)
+    else:
+        pairs = vs.similarity_search_with_score_by_vector(np.asarray(vector).tolist(), k=k)
+    return [(float(dist), doc) for doc, dist in pairs]
+
+
+def _init_worker() -> None:
+    # one shard per call and one call per worker at a time: no nested OpenMP threads
+    faiss.omp_set_num_threads(1)
+
+
+# ---------------------------------------------------------------------------
+# pool
+# ---------------------------------------------------------------------------
+
+class ShardPool:
+    """
+    process: one single-process lane per worker; a shard always maps to the same
+    lane, so each shard is loaded (and kept) in exactly one worker process.
+    thread : shards searched by a thread pool in this process (FAISS drops the GIL).
+    """
+
+    def __init__(self, workers: int, mode: str = "process"):
+        self.workers = max(1, workers)
+        self.mode = mode
+        self._lanes: List[Optional[Executor]] = [None] * self.workers
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _lane(self, lane: int) -> Executor:
+        with self._lock:
+            if self.mode == "thread":
+                if self._threads is None:
+                    self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="shard")
+                return self._threads
+            ex = self._lanes[lane]
+            if ex is None:
+                # spawn, not fork: the server process has threads (and a loaded model)
+                ex = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+                self._lanes[lane] = ex
+            return ex
+
+    def submit(self, key: int, fn, *args) -> Tuple[int, Future]:
+        lane = key % self.workers
+        return lane, self._lane(lane).submit(fn, *args)
+
+    def reset(self, lane: int) -> None:
+        with self._lock:
+            ex, self._lanes[lane] = self._lanes[lane], None
+        if ex is not None:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            lanes, self._lanes = self._lanes, [None] * self.workers
+            threads, self._threads = self._threads, None
+        for ex in lanes:
+            if ex is not None:
+                ex.shutdown(wait=False, cancel_futures=True)
+        if threads is not None:
+            threads.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = sum(1 for ex in self._lanes if ex is not None)
+        return {"mode": self.mode, "workers": self.workers, "started": started}
+
+
+_pool: Optional[ShardPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_shard_pool() -> ShardPool:
+    """KB_SHARD_EXECUTOR=process|thread, KB_SHARD_WORKERS (default: CPU count, max 8)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            mode = os.getenv("KB_SHARD_EXECUTOR", "process").strip().lower()
+            workers = int(os.getenv("KB_SHARD_WORKERS", str(min(os.cpu_count() or 1, 8))))
+            _pool = ShardPool(workers, mode="thread" if mode == "thread" else "process")
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+# ---------------------------------------------------------------------------
+# read handle returned by kb_store.load_kb for sharded KBs
+# ---------------------------------------------------------------------------
+
+class ShardedKB:
+    """
+    A KB split into shards under <kb_dir>/shards/. Searches run on every shard
+    in parallel (see ShardPool) and the per-shard top-k lists are merged by
+    distance, so results match a single index over the same vectors.
+    """
+
+    def __init__(self, kb_dir: str, layout: Dict[str, Any]):
+        self.kb_dir = kb_dir
+        self.layout = layout
+        self.num_shards = int(layout.get("num_shards", 1))
+
+    def shard_dirs(self) -> List[str]:
+        dirs = [shard_dir(self.kb_dir, i) for i in range(self.num_shards)]
+        return [d for d in dirs if os.path.exists(os.path.join(d, "index.faiss"))]
+
+    def search_with_scores(
+        self,
+        vector,
+        k: int,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Tuple[Document, float]]:
+        if k <= 0:
+            return []
+        q = np.asarray(vector, dtype="float32").reshape(-1)
+        pool = get_shard_pool()
+        base = zlib.crc32(self.kb_dir.encode("utf-8"))
+        t0 = time.perf_counter()
+
+        dirs = self.shard_dirs()
+        futures = [(d, *pool.submit(base + i, search_shard, d, self.kb_dir, q, k, filters)) for i, d in enumerate(dirs)]
+        hits: List[Tuple[float, int, int, Document]] = []
+        for i, (d, lane, fut) in enumerate(futures):
+            try:
+                part = fut.result()
+            except BrokenProcessPool:
+                # a worker died (OOM, signal): restart its lane, answer this shard in-process
+                incr("shard_search.worker_restart")
+                pool.reset(lane)
+                part = search_shard(d, self.kb_dir, q, k, filters)
+            hits.extend((dist, i, rank, doc) for rank, (dist, doc) in enumerate(part))
+
+        incr("shard_search.queries")
+        incr("shard_search.shards_searched", len(futures))
+        observe("shard_search.ms", (time.perf_counter() - t0) * 1000.0)
+        # ties: shard order, then rank within the shard
+        return [(doc, dist) for dist, _, _, doc in heapq.nsmallest(k, hits, key=lambda h: h[:3])]
+
+    def find_chunk_by_id(self, chunk_id: str) -> Optional[Document]:
+        """From the KB's chunk store; no shard needs to be loaded."""
+        try:
+            payload = load_chunk(kb_dir=self.kb_dir, chunk_id=chunk_id)
+        except FileNotFoundError:
+            return None
+        return Document(page_content=payload["page_content"], metadata=payload.get("metadata") or {})
+
+
+def open_sharded_kb(kb_dir: str) -> Optional[ShardedKB]:
+    layout = read_shard_layout(kb_dir)
+    return ShardedKB(kb_dir, layout) if layout is not None else None
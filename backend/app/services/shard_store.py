@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.embedding_store import (
+    EMBEDDINGS_META,
+    EMBEDDINGS_NPY,
+    add_vectors,
+    faiss_from_vectors,
+    load_kb_rows,
+    save_kb_embeddings,
+)
+from app.services.filter_index import FILTER_INDEX_NAME, build_filter_index, save_filter_index
+from app.services.index_io import write_vector_store
+from app.services.shard_search import (
+    SHARDS_META,
+    load_shard,
+    read_shard_layout,
+    shard_dir,
+    shard_of,
+    shards_root,
+)
+
+MAX_SHARDS = 64
+
+
+def get_kb_shards() -> int:
+    """KB_SHARDS: shard count for KBs created (overwrite) from now on; 1 = single index."""
+    try:
+        return min(MAX_SHARDS, max(1, int(os.getenv("KB_SHARDS", "1"))))
+    except ValueError:
+        return 1
+
+
+def _file_sha(doc: Document) -> str:
+    return (doc.metadata or {}).get("file_sha256", "") or ""
+
+
+SWAP_ASIDE_SUFFIX = ".old"
+
+
+def wait_for_shard_swap(kb_dir: str, timeout_s: float = 2.0) -> None:
+    """
+    Between the two renames of write_kb_shards a KB has neither shards/ nor a
+    single index (the old set is already aside); loaders wait that instant out.
+    """
+    root = shards_root(kb_dir)
+    deadline = time.monotonic() + timeout_s
+    while (
+        not os.path.isdir(root)
+        and os.path.isdir(root + SWAP_ASIDE_SUFFIX)
+        and not os.path.exists(os.path.join(kb_dir, "index.faiss"))
+        and time.monotonic() < deadline
+    ):
+        time.sleep(0.005)
+
+
+def drop_shards(kb_dir: str) -> None:
+    shutil.rmtree(shards_root(kb_dir), ignore_errors=True)
+
+
+def _drop_single_index(kb_dir: str) -> None:
+    for name in ("index.faiss", "index.pkl", EMBEDDINGS_NPY, EMBEDDINGS_META, FILTER_INDEX_NAME):
+        try:
+            os.remove(os.path.join(kb_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def _save_index(path: str, docs: Sequence[Document], vectors: np.ndarray, storage: str) -> None:
+    vs = faiss_from_vectors(docs, vectors, storage=storage)
+    write_vector_store(vs, path)
+    save_kb_embeddings(path, docs, vectors, index_storage=storage)
+
+
+def write_kb_shards(
+    kb_dir: str,
+    docs: Sequence[Document],
+    vectors: np.ndarray,
+    num_shards: int,
+    storage: str = "flat",
+) -> Dict[str, Any]:
+    """
+    Write all of a KB's vectors: a single index in kb_dir when num_shards == 1,
+    else one index per shard under kb_dir/shards/ (files assigned by sha256).
+    The new shard set is built next to the old one and swapped in with renames;
+    the old set is deleted only after the new one is in place.
+    """
+    os.makedirs(kb_dir, exist_ok=True)
+    if num_shards <= 1:
+        _save_index(kb_dir, docs, vectors, storage)
+        drop_shards(kb_dir)
+        return {"num_shards": 1, "shard_chunks": [len(docs)]}
+
+    groups: Dict[int, List[int]] = {}
+    for i, d in enumerate(docs):
+        groups.setdefault(shard_of(_file_sha(d), num_shards), []).append(i)
+
+    root = shards_root(kb_dir)
+    tmp = root + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    vectors = np.asarray(vectors, dtype="float32")
+    for s, rows in groups.items():
+        path = os.path.join(tmp, os.path.basename(shard_dir(kb_dir, s)))
+        _save_index(path, [docs[i] for i in rows], vectors[rows], storage)
+    with open(os.path.join(tmp, SHARDS_META), "w", encoding="utf-8") as f:
+        json.dump({
+            "num_shards": num_shards,
+            "assign": "file_sha256",
+            "index_storage": storage,
+            "created_at": time.time(),
+        }, f, indent=2)
+
+    # move the old set aside instead of deleting it first: readers always find either
+    # the old or the new shards/ (or the single index), never neither
+    old = root + SWAP_ASIDE_SUFFIX
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.isdir(root):
+        os.replace(root, old)
+    os.replace(tmp, root)
+    shutil.rmtree(old, ignore_errors=True)
+    _drop_single_index(kb_dir)
+    return {"num_shards": num_shards, "shard_chunks": [len(groups.get(s, [])) for s in range(num_shards)]}
+
+
+def append_to_shards(kb_dir: str, docs: Sequence[Document], vectors: np.ndarray) -> List[int]:
+    """Add new chunks to their files' shards; only those shards are rewritten."""
+    layout = read_shard_layout(kb_dir)
+    if layout is None:
+        raise FileNotFoundError(f"KB is not sharded: {kb_dir}")
+    n = int(layout["num_shards"])
+    storage = layout.get("index_storage", "flat")
+
+    groups: Dict[int, List[int]] = {}
+    for i, d in enumerate(docs):
+        groups.setdefault(shard_of(_file_sha(d), n), []).append(i)
+
+    vectors = np.asarray(vectors, dtype="float32")
+    for s, rows in groups.items():
+        path = shard_dir(kb_dir, s)
+        part, part_vecs = [docs[i] for i in rows], vectors[rows]
+        if os.path.exists(os.path.join(path, "index.faiss")):
+            vs = load_shard(path, cache=False)
+            add_vectors(vs, part, part_vecs)
+            write_vector_store(vs, path)
+            save_kb_embeddings(path, part, part_vecs, append=True)
+        else:
+            _save_index(path, part, part_vecs, storage)
+    return sorted(groups)
+
+
+def refresh_shard_filters(kb_dir: str, shard_nos: Optional[Iterable[int]] = None) -> None:
+    """Rebuild filter_index.json of the given shards (all by default) after an ingest."""
+    layout = read_shard_layout(kb_dir)
+    if layout is None:
+        return
+    for s in (range(int(layout["num_shards"])) if shard_nos is None else shard_nos):
+        path = shard_dir(kb_dir, s)
+        if os.path.exists(os.path.join(path, "index.faiss")):
+            vs = load_shard(path, cache=False)
+            save_filter_index(path, build_filter_index(vs, path, manifest_dir=kb_dir))
+
+
+def reshard_kb(
+    kb_dir: str,
+    base_dir: str,
+    num_shards: Optional[int] = None,
+    storage: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Re-partition a KB (single index <-> N shards, or N -> M) from the persisted
+    embeddings; no embedding model calls unless chunk text changed.
+    num_shards / storage default to the KB's current ones.
+    """
+    layout = read_shard_layout(kb_dir)
+    docs: List[Document] = []
+    parts: List[np.ndarray] = []
+    re_embedded = 0
+    if layout is not None:
+        current_shards = int(layout["num_shards"])
+        current_storage = layout.get("index_storage", "flat")
+        for s in range(current_shards):
+            path = shard_dir(kb_dir, s)
+            if not os.path.exists(os.path.join(path, EMBEDDINGS_META)):
+                continue
+            _, d, v, r = load_kb_rows(path, base_dir, chunk_store_dir=kb_dir)
+            docs.extend(d)
+            parts.append(v)
+            re_embedded += r
+    else:
+        current_shards = 1
+        meta, docs, v, re_embedded = load_kb_rows(kb_dir, base_dir)
+        current_storage = meta.get("index_storage", "flat")
+        parts.append(v)
+
+    parts = [p for p in parts if len(p)]
+    vectors = np.concatenate(parts) if parts else np.zeros((0, 0), dtype="float32")
+    storage = storage or current_storage
+    info = write_kb_shards(kb_dir, docs, vectors, num_shards or current_shards, storage=storage)
+    refresh_shard_filters(kb_dir)
+    return {
+        "num_chunks": len(docs),
+        "re_embedded": re_embedded,
+        "dim": int(vectors.shape[1]) if len(docs) else 0,
+        "index_storage": storage,
+        **info,
+    }
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+from app.services.metrics import incr
+
+T = TypeVar("T")
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case/whitespace-insensitive form used for request coalescing keys."""
+    return _WS.sub(" ", (query or "").strip().lower()).rstrip(" ?!.")
+
+
+def _consume_exception(task: "asyncio.Future[Any]") -> None:
+    # followers may all be gone; don't log "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls: the first caller for a key starts the
+    work, later callers with the same key await the same result instead of
+    running it again. The key is forgotten as soon as the work finishes, so
+    this never serves stale results.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Return (result, shared) where shared=True means we piggy-backed on a leader."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            task.add_done_callback(_consume_exception)
+            incr(f"singleflight.{self.name}.leader")
+        else:
+            incr(f"singleflight.{self.name}.coalesced")
+
+        # shield: a disconnecting client must not cancel work other callers wait on
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: "asyncio.Future[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+def get_stream_resume_ttl_s() -> float:
+    """STREAM_RESUME_TTL_S: how long a finished stream's events stay replayable (default 120, 0 = off)."""
+    try:
+        return max(0.0, float(os.getenv("STREAM_RESUME_TTL_S", "120")))
+    except ValueError:
+        return 120.0
+
+
+def get_stream_resume_grace_s() -> float:
+    """STREAM_RESUME_GRACE_S: generation keeps running this long after the last client hung up (default 10)."""
+    try:
+        return max(0.0, float(os.getenv("STREAM_RESUME_GRACE_S", "10")))
+    except ValueError:
+        return 10.0
+
+
+class StreamBroadcast:
+    """
+    Fan one producer's events out to any number of subscribers.
+    Events are buffered, so a subscriber that joins late replays from `start`.
+    """
+
+    def __init__(self, key: Hashable = None, grace_s: float = 0.0):
+        self.key = key
+        self.stream_id = uuid.uuid4().hex
+        self.grace_s = grace_s
+        self.events: List[Any] = []
+        self.done = False
+        # cancelled before the producer finished: the buffer has no terminal event
+        self.abandoned = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self.task: Optional["asyncio.Future[Any]"] = None
+        # set by the caller when the producer must be let in (admission) before anyone subscribes
+        self.ready: Optional["asyncio.Future[Any]"] = None
+        self._cond = asyncio.Condition()
+
+    async def publish(self, item: Any) -> None:
+        async with self._cond:
+            self.events.append(item)
+            self._cond.notify_all()
+
+    async def close(self) -> None:
+        async with self._cond:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._cond.notify_all()
+
+    async def subscribe(self, start: int = 0) -> AsyncIterator[Tuple[int, Any]]:
+        """Yield (index, event) from `start` until the producer has finished."""
+        i = start
+        self.subscribers += 1
+        try:
+            while True:
+                async with self._cond:
+                    while i >= len(self.events) and not self.done:
+                        await self._cond.wait()
+                    batch = self.events[i:]
+                    finished = self.done
+                for item in batch:
+                    yield i, item
+                    i += 1
+                if finished and i >= len(self.events):
+                    return
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self.task is not None:
+                # everybody hung up: stop generating, after a grace period for reconnects
+                if self.grace_s > 0:
+                    self.task.get_loop().call_later(self.grace_s, self._cancel_if_abandoned)
+                else:
+                    self.abandoned = True
+                    self.task.cancel()
+
+    def _cancel_if_abandoned(self) -> None:
+        if self.subscribers == 0 and not self.done and self.task is not None:
+            incr("stream_resume.abandoned")
+            self.abandoned = True
+            self.task.cancel()
+
+
+class StreamSingleFlight:
+    """
+    SingleFlight for streaming responses: the leader's producer publishes into
+    a StreamBroadcast and every identical concurrent request subscribes to it.
+    Broadcasts stay addressable by stream_id for STREAM_RESUME_TTL_S after they
+    finish, so a client that lost its connection can resume() instead of asking
+    again. An abandoned (cancelled) stream is dropped at once: its buffer ends
+    mid-answer, so a reconnect must miss and ask again.
+    """
+
+    def __init__(self, name: str, max_streams: int = 256):
+        self.name = name
+        self.max_streams = max_streams
+        self._inflight: Dict[Hashable, StreamBroadcast] = {}
+        self._streams: "OrderedDict[str, StreamBroadcast]" = OrderedDict()
+
+    def join(self, key: Hashable, producer: Callable[[], AsyncIterator[Any]]) -> Tuple[StreamBroadcast, bool]:
+        """Return (broadcast, shared). Must be called from the event loop."""
+        bc = self._inflight.get(key)
+        if bc is not None and not bc.done and not bc.abandoned:
+            incr(f"singleflight.{self.name}.coalesced")
+            return bc, True
+
+        ttl = get_stream_resume_ttl_s()
+        bc = StreamBroadcast(key, grace_s=get_stream_resume_grace_s() if ttl > 0 else 0.0)
+        self._inflight[key] = bc
+        if ttl > 0:
+            self._prune(ttl)
+            self._streams[bc.stream_id] = bc
+        incr(f"singleflight.{self.name}.leader")
+
+        async def run() -> None:
+            try:
+                async for item in producer():
+                    await bc.publish(item)
+            except asyncio.CancelledError:
+                bc.abandoned = True
+                raise
+            finally:
+                if self._inflight.get(key) is bc:
+                    del self._inflight[key]
+                if bc.abandoned and self._streams.get(bc.stream_id) is bc:
+                    del self._streams[bc.stream_id]
+                await bc.close()
+
+        bc.task = asyncio.ensure_future(run())
+        bc.task.add_done_callback(_consume_exception)
+        return bc, False
+
+    def resume(self, stream_id: str) -> Optional[StreamBroadcast]:
+        """The broadcast of a running or recently finished stream, or None once it expired or was abandoned."""
+        self._prune(get_stream_resume_ttl_s())
+        bc = self._streams.get(stream_id)
+        if bc is not None and bc.abandoned:
+            del self._streams[stream_id]
+            bc = None
+        incr(f"stream_resume.{'hit' if bc is not None else 'miss'}")
+        return bc
+
+    def _prune(self, ttl: float) -> None:
+        now = time.monotonic()
+        for sid, bc in list(self._streams.items()):
+            if bc.done and now - (bc.finished_at or now) >= ttl:
+                del self._streams[sid]
+        # oldest first; a running stream is only dropped from the registry, never cancelled
+        while len(self._streams) > self.max_streams:
+            self._streams.popitem(last=False)
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def resumable(self) -> int:
+        return len(self._streams)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.services.metrics import observe
+
+Event = Tuple[str, Dict[str, Any]]
+# (buffer index, event); a merged frame carries the index of its last delta
+Indexed = Tuple[int, Event]
+
+# token: one frame per model delta (previous behaviour); frame: deltas merged per window
+GRANULARITIES = ("token", "frame")
+MAX_FLUSH_MS = 1000
+
+_END = object()
+
+
+def get_stream_flush_ms() -> int:
+    """STREAM_FLUSH_MS: how long token deltas are merged into one SSE frame (default 30, 0 = no wait)."""
+    try:
+        return min(MAX_FLUSH_MS, max(0, int(os.getenv("STREAM_FLUSH_MS", "30"))))
+    except ValueError:
+        return 30
+
+
+def get_stream_flush_chars() -> int:
+    """STREAM_FLUSH_CHARS: a merged frame is sent early once it holds this many characters (default 512)."""
+    try:
+        return max(1, int(os.getenv("STREAM_FLUSH_CHARS", "512")))
+    except ValueError:
+        return 512
+
+
+class FrameStats:
+    """Per-subscriber framing counters, reported in the `done` frame and as metrics."""
+
+    __slots__ = ("started", "frames", "token_frames", "deltas", "cpu_s")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.frames = 0
+        self.token_frames = 0
+        self.deltas = 0
+        self.cpu_s = 0.0
+
+    def count(self, event: str, data: Dict[str, Any], cpu_s: float) -> None:
+        self.frames += 1
+        self.cpu_s += cpu_s
+        if event == "token":
+            self.token_frames += 1
+            self.deltas += data.get("n", 1)
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "frames": self.frames,
+            "token_frames": self.token_frames,
+            "deltas": self.deltas,
+            "frames_per_s": round(self.frames / elapsed, 2) if elapsed > 0 else None,
+            "framing_cpu_ms": round(self.cpu_s * 1000.0, 3),
+            "elapsed_ms": round(elapsed * 1000.0, 1),
+        }
+
+    def emit(self, name: str) -> None:
+        r = self.report()
+        observe(f"{name}.frames", self.frames)
+        observe(f"{name}.deltas_per_frame", self.deltas / self.token_frames if self.token_frames else 0.0)
+        observe(f"{name}.framing_cpu_ms", r["framing_cpu_ms"])
+        if r["frames_per_s"] is not None:
+            observe(f"{name}.frames_per_s", r["frames_per_s"])
+
+
+def _token_frame(last: int, deltas: List[str]) -> Indexed:
+    return last, ("token", {"type": "token", "delta": "".join(deltas), "n": len(deltas)})
+
+
+async def coalesce_tokens(
+    events: AsyncIterator[Indexed],
+    flush_ms: Optional[int] = None,
+    max_chars: Optional[int] = None,
+) -> AsyncIterator[Indexed]:
+    """
+    Merge consecutive `token` events into one frame per flush window: a frame
+    is sent flush_ms after its first delta, once it holds max_chars, or right
+    before any other event (so citations / done keep their order). A model
+    that stalls never holds text back for longer than the window.
+    """
+    window = (get_stream_flush_ms() if flush_ms is None else flush_ms) / 1000.0
+    limit = get_stream_flush_chars() if max_chars is None else max_chars
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Any]" = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            async for item in events:
+                queue.put_nowait(item)
+        finally:
+            queue.put_nowait(_END)
+
+    task = asyncio.ensure_future(pump())
+    pending: List[str] = []
+    last = -1
+    size = 0
+    flush_at = 0.0
+    try:
+        while True:
+            if not pending:
+                item = await queue.get()
+            elif queue.empty() and window > 0:
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(0.0, flush_at - loop.time()))
+                except asyncio.TimeoutError:
+                    yield _token_frame(last, pending)
+                    pending, size = [], 0
+                    continue
+            else:
+                item = queue.get_nowait()
+
+            if item is _END:
+                break
+            i, (event, data) = item
+            if event == "token":
+                if not pending:
+                    flush_at = loop.time() + window
+                last = i
+                pending.append(data.get("delta", ""))
+                size += len(pending[-1])
+                if size >= limit or (window == 0 and queue.empty()):
+                    yield _token_frame(last, pending)
+                    pending, size = [], 0
+                continue
+            if pending:
+                yield _token_frame(last, pending)
+                pending, size = [], 0
+            yield item
+        if pending:
+            yield _token_frame(last, pending)
+        await task                              # re-raise a producer error
+    finally:
+        task.cancel()
@@ -1,21 +1,81 @@
 from __future__ import annotations
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
 
 from langchain_core.documents import Document
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+from app.services.compact_docstore import compact_vector_store
+from app.services.compact_index import attach_full_vectors, build_compact_index, is_compact, rescore_search
+from app.services.deadline import Deadline
+from app.services.filter_index import filtered_search
+from app.services.remote_kb import RemoteKB
+from app.services.shard_search import ShardedKB
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
 
-def build_faiss_index(chunks: List[Document]) -> FAISS:
+def build_faiss_index(chunks: List[Document], storage: str = "flat") -> FAISS:
     """
     Build an in-memory FAISS index using local HuggingFace embeddings (no API key).
+    Reuses the module-level model instead of loading it again per call.
+    storage != "flat" keeps compact codes in the index (full vectors stay in RAM for re-scoring).
     """
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    return FAISS.from_documents(chunks, embeddings) #  Converts each chunk into a vector and Stores them into FAISS index
+    vs = FAISS.from_documents(chunks, embeddings) #  Converts each chunk into a vector and Stores them into FAISS index
+    if storage != "flat" and vs.index.ntotal:
+        vectors = vs.index.reconstruct_n(0, vs.index.ntotal)
+        vs.index = build_compact_index(vectors, storage)
+        attach_full_vectors(vs, vectors)
+    return compact_vector_store(vs)
 
 
-def search_top_k(vector_store: FAISS, query: str, k: int = 5) -> List[Document]:
+def search_top_k(vector_store: Union[FAISS, ShardedKB, RemoteKB], query: str, k: int = 5) -> List[Document]:
+    if isinstance(vector_store, (ShardedKB, RemoteKB)):
+        return [d for d, _ in vector_store.search_with_scores(embeddings.embed_query(query), k)]
+    if is_compact(vector_store.index):
+        return [d for d, _ in rescore_search(vector_store, embeddings.embed_query(query), k)]
     return vector_store.similarity_search(query, k=k) # Performs semantic search using vector similarity
 
 
+def search_top_k_with_scores(
+    vector_store: Union[FAISS, ShardedKB, RemoteKB],
+    query: str,
+    k: int = 5,
+    embedding: Optional[List[float]] = None,
+    deadline: Optional[Deadline] = None,
+    min_k: int = 1,
+    id_filter: Optional[Union[np.ndarray, Dict[str, Any]]] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Like search_top_k, but keep the raw FAISS distance (squared L2, lower is closer).
+    Pass `embedding` when the query was already embedded (e.g. for the semantic cache).
+    With a `deadline`, k may shrink (never below min_k) to leave time for later stages.
+    `id_filter` (bool per FAISS row, see filter_index) restricts the search to matching rows;
+    for a ShardedKB / RemoteKB it is the filters dict, evaluated by each shard / node.
+    """
+    if deadline is not None:
+        k = deadline.plan_fetch_k(k, min_k=min_k)
+    if isinstance(vector_store, RemoteKB):
+        if embedding is None:
+            embedding = embeddings.embed_query(query)
+        return vector_store.search_with_scores(embedding, k, filters=id_filter, deadline=deadline)
+    if isinstance(vector_store, ShardedKB):
+        if embedding is None:
+            embedding = embeddings.embed_query(query)
+        return vector_store.search_with_scores(embedding, k, filters=id_filter)
+    if id_filter is not None:
+        if embedding is None:
+            embedding = embeddings.embed_query(query)
+        return filtered_search(vector_store, embedding, k, id_filter)
+    if is_compact(vector_store.index):
+        # two-phase: oversampled candidates from compact codes, exact re-score
+        if embedding is None:
+            embedding = embeddings.embed_query(query)
+        return rescore_search(vector_store, embedding, k)
+    if embedding is None:
+        pairs = vector_store.similarity_search_with_score(query, k=k)
+    else:
+        pairs = vector_store.similarity_search_with_score_by_vector(embedding, k=k)
+    return [(d, float(s)) for d, s in pairs]
@@ -0,0 +1,119 @@
+"""Cancelling a running /ask-kb-stream generation (no model or KB needed)."""
+import asyncio
+import threading
+import time
+from contextlib import aclosing
+
+from app.services.llm_backend import aiter_deltas
+from app.services.singleflight import StreamSingleFlight
+
+
+def slow_model(state, n=50, delay_s=0.05):
+    """Blocking delta generator like the model SDKs: sleeps inside next()."""
+    try:
+        for i in range(n):
+            state["started"].set()
+            time.sleep(delay_s)
+            state["deltas"] += 1
+            yield f"w{i} "
+    finally:
+        state["closed"].set()
+
+
+def new_state():
+    return {"deltas": 0, "started": threading.Event(), "closed": threading.Event()}
+
+
+async def producer(state, errors):
+    # the shape of _ask_kb_stream_events: generic errors become events, cancellation must not
+    try:
+        async with aclosing(aiter_deltas(slow_model(state))) as deltas:
+            async for delta in deltas:
+                yield "token", {"delta": delta}
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        errors.append(e)
+        yield "error", {"message": repr(e)}
+    yield "done", {}
+
+
+def test_cancel_while_next_runs_in_worker_thread():
+    state, errors = new_state(), []
+
+    async def main():
+        events = []
+
+        async def consume():
+            async for item in producer(state, errors):
+                events.append(item)
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.12)                   # cancelled mid-next(), inside to_thread
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return task, events
+
+    task, events = asyncio.run(main())
+    assert task.cancelled()
+    assert errors == []
+    assert [e for e, _ in events] == ["token"] * len(events)
+    # the worker closes the upstream once its next() returns; nothing is generated after that
+    assert state["closed"].wait(2.0)
+    produced = state["deltas"]
+    time.sleep(0.2)
+    assert state["deltas"] == produced < 50
+
+
+def test_last_subscriber_leaving_cancels_the_stream(monkeypatch):
+    monkeypatch.setenv("STREAM_RESUME_TTL_S", "0")  # no reconnect grace: cancel right away
+    state, errors = new_state(), []
+
+    async def main():
+        flight = StreamSingleFlight("test")
+        bc, shared = flight.join("k", lambda: producer(state, errors))
+        assert not shared
+        async for _, (event, _) in bc.subscribe():
+            if event == "token":
+                break                               # client hangs up after the first token
+        await asyncio.sleep(0)
+        try:
+            await bc.task
+        except asyncio.CancelledError:
+            pass
+        return bc
+
+    bc = asyncio.run(main())
+    assert bc.task.cancelled() and bc.done
+    assert errors == []
+    # no bogus error / done pair buffered for resuming clients
+    assert [e for e, _ in bc.events] == ["token"] * len(bc.events)
+    assert state["closed"].wait(2.0)
+
+
+def test_abandoned_stream_is_not_resumable(monkeypatch):
+    monkeypatch.setenv("STREAM_RESUME_TTL_S", "60")
+    monkeypatch.setenv("STREAM_RESUME_GRACE_S", "0.05")
+    state, errors = new_state(), []
+
+    async def main():
+        flight = StreamSingleFlight("test")
+        bc, _ = flight.join("k", lambda: producer(state, errors))
+        assert flight.resume(bc.stream_id) is bc    # running: resumable
+        async for _, (event, _) in bc.subscribe():
+            if event == "token":
+                break                               # client hangs up, never reconnects in time
+        try:
+            await bc.task
+        except asyncio.CancelledError:
+            pass
+        return flight, bc, flight.resume(bc.stream_id)
+
+    flight, bc, resumed = asyncio.run(main())
+    assert bc.abandoned and bc.done
+    # the buffer ends on a token: a reconnect must miss (and re-run), not replay a truncated answer
+    assert resumed is None
+    assert flight.resumable() == 0
@@ -1,9 +1,15 @@
+import json
+import os
 import re
 import requests
 import streamlit as st
-from typing import Dict, Any, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 
-BACKEND = "http://127.0.0.1:8000"
+BACKEND = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
+# evidence chunks fetched at once (top_k is 3 by default)
+PREFETCH_WORKERS = 4
 
 # -------------------------
 # 1) Utilities
@@ -28,6 +34,24 @@ def parse_citations(answer: str) -> List[str]:
     return out
 
 
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    One keep-alive session for the whole app (shared across reruns), so
+    requests reuse pooled connections instead of opening a new one each time.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=PREFETCH_WORKERS + 2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource
+def get_prefetch_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="evidence")
+
+
 def ask_kb(kb_id: str, query: str, fetch_k: int = 12, top_k: int = 3) -> Dict[str, Any]:
     """
     Call backend /ask-kb (JSON body) and return JSON payload.
@@ -39,16 +63,97 @@ def ask_kb(kb_id: str, query: str, fetch_k: int = 12, top_k: int = 3) -> Dict[st
         "fetch_k": fetch_k,
         "top_k": top_k,
     }
-    resp = requests.post(url, json=payload, timeout=60)
+    resp = get_session().post(url, json=payload, timeout=60)
     resp.raise_for_status()
     return resp.json()
 
+
+def iter_sse(resp: requests.Response) -> Iterator[Tuple[str, Optional[str], Dict[str, Any]]]:
+    """
+    Parse a text/event-stream response into (event, id, data) tuples.
+    """
+    event, event_id, data = "message", None, []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            # a blank line ends the event (stray ones between fields are ignored)
+            if data:
+                yield event, event_id, json.loads("\n".join(data))
+                event, data = "message", []
+            continue
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+        elif field == "id":
+            event_id = value
+
+
+def stream_kb(
+    kb_id: str,
+    query: str,
+    on_token: Callable[[str], None],
+    on_meta: Optional[Callable[[Dict[str, Any]], None]] = None,
+    retries: int = 2,
+) -> Dict[str, Any]:
+    """
+    Call backend /ask-kb-stream and return a result shaped like /ask-kb's.
+    on_token gets the answer text so far; on_meta gets the sources as soon as
+    retrieval is done. A dropped connection is resumed with Last-Event-ID,
+    so the question is not asked twice.
+    """
+    url = f"{BACKEND}/ask-kb-stream"
+    result: Dict[str, Any] = {"kb_id": kb_id, "query": query, "answer": "", "sources": [], "source_map": {}}
+    text = ""
+    last_id: Optional[str] = None
+    for attempt in range(retries + 1):
+        headers = {"Last-Event-ID": last_id} if last_id else {}
+        try:
+            with get_session().post(
+                url, params={"kb_id": kb_id, "query": query}, headers=headers, stream=True, timeout=(5, 60),
+            ) as resp:
+                resp.raise_for_status()
+                for event, event_id, data in iter_sse(resp):
+                    last_id = event_id or last_id
+                    if event == "debug" and data.get("step") == "resume_miss":
+                        # the server can't resume (expired, other worker): it answers again from event 0
+                        text = ""
+                        result.pop("error", None)
+                        on_token(text)
+                    elif event == "meta":
+                        result["sources"] = data.get("sources", [])
+                        result["source_map"] = data.get("source_map", {})
+                        if on_meta:
+                            on_meta(result)
+                    elif event == "token":
+                        text += data.get("delta", "")
+                        on_token(text)
+                    elif event == "error":
+                        # the backend still sends `done` with a grounded fallback answer
+                        result["error"] = data.get("message")
+                    elif event == "done":
+                        result.update({
+                            "answer": data.get("final_answer") or text,
+                            "quality_gate": data.get("quality_gate"),
+                            "fallback_used": data.get("fallback_used"),
+                            "aborted": data.get("aborted"),
+                        })
+                        return result
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            if attempt == retries or not last_id:
+                raise
+    raise requests.ConnectionError("stream ended before the answer was complete")
+
+
 def fetch_chunk(kb_id: str, chunk_id: str) -> Dict[str, Any]:
     """
     Fetch a chunk evidence payload by chunk_id using query endpoint (recommended).
     """
     url = f"{BACKEND}/kb/chunk"
-    resp = requests.get(
+    resp = get_session().get(
         url,
         params={"kb_id": kb_id, "chunk_id": chunk_id, "include_content": True},
         timeout=30,
@@ -73,6 +178,27 @@ def source_label(sources: List[Dict[str, Any]], sid: str) -> str:
     return sid
 
 
+def prefetch_chunks(kb_id: str, source_map: Dict[str, str], cache: Dict[str, Any]) -> Dict[str, Future]:
+    """
+    Start fetching every source's chunk concurrently (skipping cached ones);
+    collect_chunks() stores them once the answer is done.
+    """
+    pool = get_prefetch_pool()
+    return {
+        chunk_id: pool.submit(fetch_chunk, kb_id, chunk_id)
+        for chunk_id in dict.fromkeys(source_map.values())
+        if chunk_id and chunk_id not in cache
+    }
+
+
+def collect_chunks(futures: Dict[str, Future], cache: Dict[str, Any]) -> None:
+    for chunk_id, future in futures.items():
+        try:
+            cache[chunk_id] = future.result(timeout=30)
+        except Exception:
+            pass  # loaded on click instead, which reports the error
+
+
 # -------------------------
 # 2) UI
 # -------------------------
@@ -98,15 +224,31 @@ with col_left:
     st.subheader("Ask")
     kb_id = st.text_input("KB ID", value=st.session_state["kb_id"])
     query = st.text_input("Query", value=st.session_state["query"])
+    streaming = st.checkbox("Stream answer", value=True)
     if st.button("Ask KB"):
         try:
             st.session_state["kb_id"] = kb_id
             st.session_state["query"] = query
+            st.session_state["last_result"] = None
+            st.session_state["selected_source"] = None
 
-            result = ask_kb(kb_id=kb_id, query=query)
+            if streaming:
+                # render tokens as they arrive; evidence is fetched while the model writes
+                cache: Dict[str, Any] = st.session_state["chunk_cache"]
+                pending: Dict[str, Future] = {}
+                placeholder = st.empty()
+                result = stream_kb(
+                    kb_id=kb_id,
+                    query=query,
+                    on_token=lambda text: placeholder.markdown("### Answer\n\n" + text + "▌"),
+                    on_meta=lambda r: pending.update(prefetch_chunks(kb_id, r["source_map"], cache)),
+                )
+                placeholder.empty()
+                collect_chunks(pending, cache)
+            else:
+                result = ask_kb(kb_id=kb_id, query=query)
             st.session_state["last_result"] = result
-            st.session_state["selected_source"] = None
- 
+
         except requests.HTTPError as e:
             st.error(f"Backend error: {e}")
         except requests.RequestException as e:
@@ -120,6 +262,8 @@ with col_left:
         citations = parse_citations(answer)
 
         st.markdown("### Answer")
+        if result.get("error"):
+            st.error(f"Backend error: {result['error']}")
         st.markdown(answer)
 
         st.markdown("### Citations")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Docstore memory per chunk: langchain's InMemoryDocstore (one Document + full
+metadata dict per chunk) vs. CompactDocstore (slotted records, per-file
+metadata stored once). Measured with tracemalloc after building each store,
+plus the pickled size (index.pkl).
+
+    PYTHONPATH=backend python scripts/bench_docstore_memory.py                 # synthetic PyPDF-like chunks
+    PYTHONPATH=backend python scripts/bench_docstore_memory.py --kb demo       # a KB's index.pkl
+    PYTHONPATH=backend python scripts/bench_docstore_memory.py -n 200000 --files 400
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import hashlib
+import json
+import os
+import pickle
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+from app.services.compact_docstore import CompactDocstore
+from app.services.ingestion import make_chunk_id
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OUT_PATH = PROJECT_ROOT / "storage" / "eval_results" / "docstore_memory_bench.json"
+
+
+def synthetic_docs(n: int, n_files: int, chars: int) -> Dict[str, Document]:
+    """Chunks with the metadata load_and_chunk_pdf produces (PyPDF info + citation fields)."""
+    per_file = max(1, n // n_files)
+    text = ("lorem ipsum dolor sit amet " * (chars // 27 + 1))[:chars]
+    docs: Dict[str, Document] = {}
+    for i in range(n):
+        f, ci = divmod(i, per_file)
+        sha = hashlib.sha256(f"file-{f}".encode()).hexdigest()
+        page = ci // 3
+        md = {
+            "producer": "Microsoft® Word for Microsoft 365",
+            "creator": "Microsoft® Word for Microsoft 365",
+            "creationdate": "2024-03-01T10:12:00+00:00",
+            "author": "Author Name",
+            "moddate": "2024-03-01T10:12:00+00:00",
+            "title": f"Document {f}",
+            "source": f"/tmp/tmpabc{f:05d}.pdf",
+            "total_pages": per_file // 3 + 1,
+            "page": page,
+            "page_label": str(page + 1),
+            "kb_id": "bench",
+            "filename": f"document_{f}.pdf",
+            "file_sha256": sha,
+            "chunk_index": ci,
+            "chunk_id": make_chunk_id("bench", sha, page, ci),
+        }
+        docs[f"id-{i}"] = Document(page_content=f"{i} {text}", metadata=md)
+    return docs
+
+
+def kb_docs(storage_dir: str, kb: str) -> Dict[str, Document]:
+    with open(os.path.join(storage_dir, "kb", kb, "index.pkl"), "rb") as f:
+        docstore, _ = pickle.load(f)
+    ids = list(docstore._dict)
+    return {i: docstore.search(i) for i in ids}
+
+
+def measure(build: Callable[[], Any]) -> Dict[str, Any]:
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    store = build()
+    build_s = time.perf_counter() - t0
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"store": store, "bytes": current, "build_s": build_s}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--kb", help="benchmark storage/kb/<kb>/index.pkl instead of synthetic chunks")
+    ap.add_argument("--storage-dir", default=os.getenv("KB_STORAGE_DIR", str(PROJECT_ROOT / "storage")))
+    ap.add_argument("-n", type=int, default=50000, help="synthetic chunk count")
+    ap.add_argument("--files", type=int, default=100, help="synthetic file count")
+    ap.add_argument("--chars", type=int, default=1000, help="synthetic chunk length (splitter chunk_size)")
+    ap.add_argument("--out", type=Path, default=OUT_PATH)
+    args = ap.parse_args()
+
+    if args.kb:
+        source = f"kb:{args.kb}"
+        make: Callable[[], Dict[str, Document]] = lambda: kb_docs(args.storage_dir, args.kb)
+    else:
+        source = f"synthetic:{args.n}x{args.chars}c/{args.files}files"
+        make = lambda: synthetic_docs(args.n, args.files, args.chars)
+
+    # texts are the same in both stores; measure them once and subtract
+    texts = measure(lambda: [d.page_content for d in make().values()])
+    n = len(texts["store"])
+    text_bytes = texts["bytes"]
+    del texts
+
+    rows: List[Dict[str, Any]] = []
+    for name, build in (
+        ("in_memory", lambda: InMemoryDocstore(make())),
+        ("compact", lambda: CompactDocstore.from_documents(make())),
+    ):
+        r = measure(build)
+        rows.append({
+            "docstore": name,
+            "chunks": n,
+            "bytes": r["bytes"],
+            "bytes_per_chunk": round(r["bytes"] / max(n, 1), 1),
+            "metadata_bytes_per_chunk": round((r["bytes"] - text_bytes) / max(n, 1), 1),
+            "pickle_bytes": len(pickle.dumps(r["store"])),
+            "build_s": round(r["build_s"], 3),
+        })
+        del r
+
+    print(f"== docstore memory ({source}, {n} chunks) ==")
+    print(f"{'docstore':10s} {'B/chunk':>9s} {'meta B/chunk':>13s} {'total MB':>9s} {'pickle MB':>10s}")
+    for r in rows:
+        print(f"{r['docstore']:10s} {r['bytes_per_chunk']:>9.1f} {r['metadata_bytes_per_chunk']:>13.1f} "
+              f"{r['bytes'] / 2**20:>9.2f} {r['pickle_bytes'] / 2**20:>10.2f}")
+    print("(meta B/chunk = total minus the chunk texts, which both stores keep as-is)")
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps({"source": source, "results": rows}, indent=2), encoding="utf-8")
+    print(f"[OK] Wrote benchmark: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
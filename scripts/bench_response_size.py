@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+/ask-kb response size per verbosity, and serialization time of the same
+payloads with stdlib json (what JSONResponse does) against app.services.json_codec.
+Each query is asked once in full and once in compact form on a running server.
+
+    PYTHONPATH=backend python scripts/bench_response_size.py --kb-id demo
+    PYTHONPATH=backend python scripts/bench_response_size.py --kb-id demo --fields quality_gate,metrics
+    PYTHONPATH=backend python scripts/bench_response_size.py --url http://127.0.0.1:8000 --repeat 2000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import requests
+
+from app.services.json_codec import dumps, get_json_codec
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OUT_PATH = PROJECT_ROOT / "storage" / "eval_results" / "response_size.json"
+
+QUERIES = [
+    "What is the plan for?",
+    "What is the focus of week 2?",
+    "How are errors handled?",
+]
+
+
+def stdlib_dumps(obj: Any) -> bytes:
+    # starlette.responses.JSONResponse.render
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def time_us(fn: Callable[[Any], bytes], obj: Any, repeat: int) -> float:
+    fn(obj)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(obj)
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--kb-id", default="demo")
+    ap.add_argument("--fields", default="", help="comma-separated blocks to add back in compact mode")
+    ap.add_argument("--repeat", type=int, default=1000, help="serializations per payload")
+    ap.add_argument("--out", type=Path, default=OUT_PATH)
+    args = ap.parse_args()
+    fields = [f for f in args.fields.split(",") if f]
+
+    rows: List[Dict[str, Any]] = []
+    for q in QUERIES:
+        row: Dict[str, Any] = {"query": q}
+        for verbosity in ("full", "compact"):
+            body = {"kb_id": args.kb_id, "query": q, "verbosity": verbosity}
+            if verbosity == "compact" and fields:
+                body["fields"] = fields
+            r = requests.post(f"{args.url.rstrip('/')}/ask-kb", json=body, timeout=120)
+            r.raise_for_status()
+            payload = r.json()
+            row[verbosity] = {
+                "bytes": len(r.content),
+                "json_us": round(time_us(stdlib_dumps, payload, args.repeat), 1),
+                "codec_us": round(time_us(dumps, payload, args.repeat), 1),
+            }
+        rows.append(row)
+
+    def med(verbosity: str, key: str) -> float:
+        return statistics.median(r[verbosity][key] for r in rows)
+
+    summary = {
+        v: {k: med(v, k) for k in ("bytes", "json_us", "codec_us")} for v in ("full", "compact")
+    }
+    print(f"== /ask-kb response size, kb={args.kb_id}, codec={get_json_codec()} (median of {len(rows)}) ==")
+    print(f"{'verbosity':10s} {'bytes':>8s} {'json us':>9s} {'codec us':>9s}")
+    for v, s in summary.items():
+        print(f"{v:10s} {s['bytes']:>8.0f} {s['json_us']:>9.1f} {s['codec_us']:>9.1f}")
+    full, compact = summary["full"], summary["compact"]
+    print(f"compact/full bytes {compact['bytes'] / full['bytes']:.2f}  "
+          f"full json/codec time {full['json_us'] / max(full['codec_us'], 1e-9):.1f}x")
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps({"kb_id": args.kb_id, "codec": get_json_codec(), "fields": fields,
+                                    "summary": summary, "queries": rows}, indent=2), encoding="utf-8")
+    print(f"[OK] Wrote report: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Search latency of sharded KBs (1/2/4/8 shards searched by the shard worker
+processes, top-k merged) against one in-process flat index, plus how much of
+the KB an append of one file rewrites. Synthetic 384-d vectors; the embedding
+model is not loaded.
+
+    PYTHONPATH=backend python scripts/bench_shards.py
+    PYTHONPATH=backend python scripts/bench_shards.py -n 500000 --shards 1,2,4,8,16 --executor thread
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from app.services.compact_docstore import CompactDocstore
+from app.services.ingestion import make_chunk_id
+from app.services.shard_search import (
+    SHARDS_META, ShardedKB, VectorOnlyEmbeddings, get_shard_pool, shard_dir, shard_of, shards_root,
+)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OUT_PATH = PROJECT_ROOT / "storage" / "eval_results" / "shard_bench.json"
+
+
+def synthetic(n: int, d: int, n_files: int, seed: int):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n, d)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    shas = [hashlib.sha256(f"file-{f}".encode()).hexdigest() for f in range(n_files)]
+    per_file = max(1, n // n_files)
+    docs = []
+    for i in range(n):
+        sha = shas[min(i // per_file, n_files - 1)]
+        ci = i % per_file
+        docs.append(Document(page_content=f"chunk {i}", metadata={
+            "kb_id": "bench", "filename": f"{sha[:8]}.pdf", "file_sha256": sha, "total_pages": 10,
+            "page": ci // 5, "page_label": str(ci // 5 + 1), "chunk_index": ci,
+            "chunk_id": make_chunk_id("bench", sha, ci // 5, ci),
+        }))
+    return x, docs
+
+
+def write_index(path: str, docs: List[Document], x: np.ndarray) -> int:
+    index = faiss.IndexFlatL2(x.shape[1])
+    index.add(x)
+    ids = [str(i) for i in range(len(docs))]
+    store = CompactDocstore.from_documents(dict(zip(ids, docs)))
+    FAISS(VectorOnlyEmbeddings(), index, store, dict(enumerate(ids))).save_local(path)
+    return sum(os.path.getsize(os.path.join(path, f)) for f in ("index.faiss", "index.pkl"))
+
+
+def write_sharded(kb_dir: str, docs: List[Document], x: np.ndarray, n_shards: int) -> List[int]:
+    groups: Dict[int, List[int]] = {}
+    for i, d in enumerate(docs):
+        groups.setdefault(shard_of(d.metadata["file_sha256"], n_shards), []).append(i)
+    sizes = [0] * n_shards
+    for s, rows in groups.items():
+        sizes[s] = write_index(shard_dir(kb_dir, s), [docs[i] for i in rows], x[rows])
+    with open(os.path.join(shards_root(kb_dir), SHARDS_META), "w", encoding="utf-8") as f:
+        json.dump({"num_shards": n_shards, "assign": "file_sha256", "index_storage": "flat"}, f)
+    return sizes
+
+
+def pct(values: List[float], p: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-n", type=int, default=200000, help="chunks")
+    ap.add_argument("-d", type=int, default=384)
+    ap.add_argument("--files", type=int, default=400)
+    ap.add_argument("--shards", default="1,2,4,8")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("-k", type=int, default=12, help="fetch_k used by /ask-kb")
+    ap.add_argument("--executor", choices=("process", "thread"), default="process")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, default=OUT_PATH)
+    args = ap.parse_args()
+
+    shard_counts = [int(v) for v in args.shards.split(",") if v.strip()]
+    os.environ["KB_SHARD_EXECUTOR"] = args.executor
+    os.environ.setdefault("KB_SHARD_WORKERS", str(max(shard_counts)))
+
+    x, docs = synthetic(args.n, args.d, args.files, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = x[rng.integers(0, len(x), size=args.queries)] + 0.1 * rng.normal(size=(args.queries, args.d)).astype("float32")
+    k = args.k
+
+    flat = faiss.IndexFlatL2(args.d)
+    flat.add(x)
+    truth = []
+    lat: List[float] = []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, idx = flat.search(q.reshape(1, -1), k)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+        truth.append({docs[i].metadata["chunk_id"] for i in idx[0]})
+
+    rows: List[Dict[str, Any]] = [{
+        "shards": 0, "mode": "single index, in-process",
+        "p50_ms": round(statistics.median(lat), 3), "p95_ms": round(pct(lat, 95), 3),
+        "recall": 1.0, "append_rewrite_fraction": 1.0,
+    }]
+
+    tmp = tempfile.mkdtemp(prefix="shard_bench_")
+    try:
+        for n_shards in shard_counts:
+            kb_dir = os.path.join(tmp, f"kb_{n_shards}")
+            sizes = write_sharded(kb_dir, docs, x, n_shards)
+            kb = ShardedKB(kb_dir, {"num_shards": n_shards})
+            for q in queries[:5]:
+                kb.search_with_scores(q, k)           # warm-up: workers load their shards
+
+            lat, hits = [], []
+            for q, t in zip(queries, truth):
+                t0 = time.perf_counter()
+                found = kb.search_with_scores(q, k)
+                lat.append((time.perf_counter() - t0) * 1000.0)
+                hits.append(len(t & {d.metadata["chunk_id"] for d, _ in found}) / k)
+            rows.append({
+                "shards": n_shards, "mode": args.executor,
+                "p50_ms": round(statistics.median(lat), 3), "p95_ms": round(pct(lat, 95), 3),
+                "recall": round(float(np.mean(hits)), 4),
+                # an append rewrites the one shard its file hashes to (average over shards)
+                "append_rewrite_fraction": round(float(np.mean([s / sum(sizes) for s in sizes if s])), 3),
+            })
+    finally:
+        get_shard_pool().shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"== shard benchmark ({args.n} x {args.d}, {args.files} files, {args.queries} queries, k={k}, "
+          f"{os.cpu_count()} CPUs) ==")
+    print(f"{'shards':>6s} {'mode':26s} {'p50 ms':>8s} {'p95 ms':>8s} {'recall':>7s} {'append rewrites':>16s}")
+    for r in rows:
+        print(f"{r['shards'] or '-':>6} {r['mode']:26s} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} "
+              f"{r['recall']:>7.4f} {r['append_rewrite_fraction']:>15.1%}")
+    print("(shard latency includes the IPC round trip and the top-k merge)")
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps({"n": args.n, "d": args.d, "k": k, "cpus": os.cpu_count(), "results": rows}, indent=2),
+                        encoding="utf-8")
+    print(f"[OK] Wrote benchmark: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Memory vs. recall of the compact vector storages (fp16 / sq8 / binary) with
+two-phase search: oversampled candidates from the compact index, exact
+re-scoring from the full-precision vectors. Ground truth is the flat index.
+
+    PYTHONPATH=backend python scripts/bench_vector_storage.py                 # synthetic 384-d corpus
+    PYTHONPATH=backend python scripts/bench_vector_storage.py --kb demo       # a KB's embeddings.npy
+    PYTHONPATH=backend python scripts/bench_vector_storage.py -n 200000 --oversample 1,2,4,8,16
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+
+from app.services.compact_index import STORAGE_MODES, build_compact_index
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OUT_PATH = PROJECT_ROOT / "storage" / "eval_results" / "vector_storage_bench.json"
+
+
+def synthetic_corpus(n: int, d: int, seed: int) -> np.ndarray:
+    """Clustered, L2-normalized vectors: closer to sentence embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n // 50, 1), d)).astype("float32")
+    x = centers[rng.integers(0, len(centers), size=n)] + 0.35 * rng.normal(size=(n, d)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def make_queries(x: np.ndarray, nq: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    q = x[rng.integers(0, len(x), size=nq)] + 0.2 * rng.normal(size=(nq, x.shape[1])).astype("float32")
+    return (q / np.linalg.norm(q, axis=1, keepdims=True)).astype("float32")
+
+
+def two_phase(index: faiss.Index, full: np.ndarray, q: np.ndarray, k: int, oversample: int) -> np.ndarray:
+    _, cand = index.search(q, min(len(full), k * oversample))
+    out = np.empty((len(q), k), dtype="int64")
+    for i, rows in enumerate(cand):
+        rows = rows[rows >= 0]
+        d = ((full[rows] - q[i]) ** 2).sum(axis=1)
+        out[i] = rows[np.argsort(d, kind="stable")[:k]]
+    return out
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--kb", help="benchmark storage/kb/<kb>/embeddings.npy instead of a synthetic corpus")
+    ap.add_argument("--storage-dir", default=os.getenv("KB_STORAGE_DIR", str(PROJECT_ROOT / "storage")))
+    ap.add_argument("-n", type=int, default=50000, help="synthetic corpus size")
+    ap.add_argument("-d", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("-k", type=int, default=12, help="fetch_k used by /ask-kb")
+    ap.add_argument("--oversample", default="1,2,4,8")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, default=OUT_PATH)
+    args = ap.parse_args()
+
+    if args.kb:
+        x = np.load(os.path.join(args.storage_dir, "kb", args.kb, "embeddings.npy")).astype("float32")
+        source = f"kb:{args.kb}"
+    else:
+        x = synthetic_corpus(args.n, args.d, args.seed)
+        source = f"synthetic:{args.n}x{args.d}"
+    q = make_queries(x, args.queries, args.seed)
+    k = min(args.k, len(x))
+    oversamples = [int(v) for v in args.oversample.split(",") if v.strip()]
+
+    flat = faiss.IndexFlatL2(x.shape[1])
+    flat.add(x)
+    _, truth = flat.search(q, k)
+
+    rows: List[Dict[str, Any]] = []
+    for storage in STORAGE_MODES:
+        t0 = time.perf_counter()
+        index = build_compact_index(x, storage)
+        build_s = time.perf_counter() - t0
+        size = len(faiss.serialize_index(index))
+
+        for os_ in ([1] if storage == "flat" else oversamples):
+            t0 = time.perf_counter()
+            found = two_phase(index, x, q, k, os_)
+            ms = (time.perf_counter() - t0) * 1000.0 / len(q)
+            rows.append({
+                "storage": storage,
+                "oversample": os_,
+                "index_bytes": size,
+                "bytes_per_vector": round(size / len(x), 1),
+                "build_s": round(build_s, 3),
+                f"recall@{k}": round(recall(found, truth), 4),
+                "ms_per_query": round(ms, 3),
+            })
+
+    print(f"== vector storage benchmark ({source}, {len(q)} queries, k={k}) ==")
+    print(f"{'storage':8s} {'os':>3s} {'B/vec':>8s} {'index MB':>9s} {'recall':>7s} {'ms/q':>7s}")
+    for r in rows:
+        print(f"{r['storage']:8s} {r['oversample']:>3d} {r['bytes_per_vector']:>8.1f} "
+              f"{r['index_bytes'] / 2**20:>9.2f} {r[f'recall@{k}']:>7.4f} {r['ms_per_query']:>7.3f}")
+    print("(exact re-scoring reads k*oversample float32 rows per query from the memory-mapped embeddings.npy)")
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps({"source": source, "k": k, "results": rows}, indent=2), encoding="utf-8")
+    print(f"[OK] Wrote benchmark: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Bulk-ingest a directory of PDFs (recursive), a .zip archive or single PDFs
+into a KB with one index update (see POST /ingest/bulk). Files already in the
+KB are skipped, so re-running after adding files only ingests the new ones.
+
+In-process, straight into KB_STORAGE_DIR (running servers pick the new
+generation up in the background):
+    PYTHONPATH=backend python scripts/bulk_ingest.py corpus/ --kb-id docs
+    PYTHONPATH=backend python scripts/bulk_ingest.py corpus.zip --kb-id docs --mode overwrite --workers 8
+
+Or upload to a running server:
+    python scripts/bulk_ingest.py corpus/ --kb-id docs --url http://127.0.0.1:8000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import List
+
+# app imports stay inside the functions: the parse workers are spawned and
+# re-import this file, and must not load the embedding model
+
+
+def upload(url: str, paths: List[str], kb_id: str, mode: str) -> dict:
+    import requests
+
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, names in os.walk(p):
+                files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith((".pdf", ".zip")))
+        else:
+            files.append(p)
+    handles = [open(f, "rb") for f in files]
+    try:
+        r = requests.post(
+            f"{url.rstrip('/')}/ingest/bulk",
+            params={"kb_id": kb_id, "mode": mode},
+            files=[("files", (os.path.basename(f), h)) for f, h in zip(files, handles)],
+            timeout=3600,
+        )
+    finally:
+        for h in handles:
+            h.close()
+    r.raise_for_status()
+    return r.json()
+
+
+def ingest_local(paths: List[str], kb_id: str, mode: str, workers: int) -> dict:
+    from app.main import get_base_dir
+    from app.services.bulk_ingest import bulk_ingest, collect_sources
+
+    tmp = tempfile.mkdtemp(prefix="bulk_ingest_")
+    try:
+        sources = []
+        for p in paths:
+            sources.extend(collect_sources(p, tmp))
+        return bulk_ingest(kb_id, get_base_dir(), sources, mode=mode, workers=workers or None)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="+", help="directories, .zip archives or PDFs")
+    ap.add_argument("--kb-id", default="default")
+    ap.add_argument("--mode", choices=("append", "overwrite"), default="append")
+    ap.add_argument("--workers", type=int, default=0, help="parse processes (default: BULK_PARSE_WORKERS / CPUs)")
+    ap.add_argument("--url", help="upload to this server instead of writing the storage dir directly")
+    ap.add_argument("--json", action="store_true", help="also print the full report as JSON")
+    args = ap.parse_args()
+
+    if args.url:
+        report = upload(args.url, args.paths, args.kb_id, args.mode)
+    else:
+        report = ingest_local(args.paths, args.kb_id, args.mode, args.workers)
+
+    t = report.get("timings_s", {})
+    print(f"== bulk ingest kb={report['kb_id']} mode={report['mode']} ==")
+    print(f"files {report['files']}  ingested {report['ingested']}  skipped {len(report['skipped'])}  "
+          f"failed {len(report['failed'])}  chunks {report['num_chunks']}")
+    print(f"hash {t.get('hash')}s  parse {t.get('parse')}s ({report['parse_workers']} workers)  "
+          f"embed {t.get('embed')}s  write {t.get('write')}s  total {t.get('total')}s")
+    print(f"{report['docs_per_s']} docs/s  {report['chunks_per_s']} chunks/s")
+    for f in report["failed"]:
+        print(f"[FAIL] {f['filename']}: {f['error']}", file=sys.stderr)
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
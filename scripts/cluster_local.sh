@@ -0,0 +1,69 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Local multi-process cluster: NODES retrieval nodes (each with its own storage dir)
+# plus one coordinator that fans /ask-kb out to them. PDFs given as arguments are
+# ingested round-robin into KB "$KB_ID", so the KB is split across the nodes:
+#   scripts/cluster_local.sh docs/a.pdf docs/b.pdf docs/c.pdf
+#   NODES=3 LLM_BACKEND=gemini scripts/cluster_local.sh
+# Ctrl-C stops every process.
+
+export PYTHONPATH="$(pwd)/backend"
+export LLM_BACKEND="${LLM_BACKEND:-fake}"
+
+NODES="${NODES:-2}"
+KB_ID="${KB_ID:-cluster}"
+COORD_PORT="${COORD_PORT:-8100}"
+NODE_BASE_PORT="${NODE_BASE_PORT:-8101}"
+CLUSTER_DIR="${CLUSTER_DIR:-$(pwd)/storage/cluster}"
+
+if [ -d "venv" ]; then
+    source venv/bin/activate
+fi
+
+PIDS=()
+trap 'kill "${PIDS[@]}" 2>/dev/null || true' EXIT
+
+wait_healthy() {
+  for i in {1..60}; do
+    if curl -s "$1/health" | grep -q "ok"; then
+      return 0
+    fi
+    sleep 1
+  done
+  echo "Server at $1 failed to start in 60s"
+  exit 1
+}
+
+NODE_URLS=()
+for ((n = 0; n < NODES; n++)); do
+  port=$((NODE_BASE_PORT + n))
+  mkdir -p "$CLUSTER_DIR/node$n"
+  KB_STORAGE_DIR="$CLUSTER_DIR/node$n" RETRIEVAL_NODE=1 RETRIEVAL_NODES= \
+    python -m uvicorn app.main:app --host 127.0.0.1 --port "$port" > "/tmp/rag_node$n.log" 2>&1 &
+  PIDS+=($!)
+  NODE_URLS+=("http://127.0.0.1:$port")
+done
+
+mkdir -p "$CLUSTER_DIR/coordinator"
+KB_STORAGE_DIR="$CLUSTER_DIR/coordinator" RETRIEVAL_NODES="$(IFS=,; echo "${NODE_URLS[*]}")" \
+  python -m uvicorn app.main:app --host 127.0.0.1 --port "$COORD_PORT" > /tmp/rag_coordinator.log 2>&1 &
+PIDS+=($!)
+
+for url in "${NODE_URLS[@]}" "http://127.0.0.1:$COORD_PORT"; do
+  wait_healthy "$url"
+done
+
+i=0
+for pdf in "$@"; do
+  node="${NODE_URLS[$((i % NODES))]}"
+  echo "Ingesting $pdf -> $node (kb_id=$KB_ID)"
+  curl -s -X POST "$node/ingest?kb_id=$KB_ID&mode=append" -F "file=@$pdf" > /dev/null
+  i=$((i + 1))
+done
+
+echo "Nodes:       ${NODE_URLS[*]}"
+echo "Coordinator: http://127.0.0.1:$COORD_PORT"
+echo "Try: curl -s -X POST http://127.0.0.1:$COORD_PORT/ask-kb -H 'Content-Type: application/json' \\"
+echo "       -d '{\"kb_id\": \"$KB_ID\", \"query\": \"What is this about?\"}'"
+wait
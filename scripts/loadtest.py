@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+HTTP load / soak test for the running service.
+
+Drives /ask-kb, /ask-kb-stream, /kb/chunk and /ingest with N concurrent
+workers for a fixed duration, then reports per-endpoint latency percentiles,
+time-to-first-SSE-token, error rates, throughput and server RSS over time.
+Compares the run against a stored baseline and exits 1 on regressions.
+
+Example (server started with LLM_BACKEND=fake, see scripts/loadtest.sh):
+    python scripts/loadtest.py --concurrency 8 --duration 60 --mix ask=6,stream=3,chunk=1
+    python scripts/loadtest.py --duration 3600 --pid "$(cat /tmp/rag_server.pid)"   # soak
+    python scripts/loadtest.py --save-baseline
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OUT_DIR = PROJECT_ROOT / "storage" / "loadtest"
+DEFAULT_BASELINE = OUT_DIR / "baseline.json"
+
+DEFAULT_QUERIES = [
+    "What is the plan for?",
+    "What is the focus of week 2?",
+    "How are errors handled?",
+    "What does Day 4 cover?",
+    "What is the CEO of Apple favorite food?",   # off-topic: exercises the fallback path
+]
+
+ENDPOINTS = ("ask", "stream", "chunk", "ingest")
+
+
+# ---------------------------------------------------------------------------
+# stats
+# ---------------------------------------------------------------------------
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def summarize_ms(values: List[float]) -> Dict[str, Any]:
+    r = lambda v: None if v is None else round(v, 1)
+    return {
+        "count": len(values),
+        "p50": r(percentile(values, 50)),
+        "p90": r(percentile(values, 90)),
+        "p95": r(percentile(values, 95)),
+        "p99": r(percentile(values, 99)),
+        "max": r(max(values) if values else None),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: Dict[str, List[float]] = {e: [] for e in ENDPOINTS}
+        self.ttft: List[float] = []
+        self.ok: Dict[str, int] = {e: 0 for e in ENDPOINTS}
+        self.errors: Dict[str, Dict[str, int]] = {e: {} for e in ENDPOINTS}
+
+    def record(self, endpoint: str, ms: float, error: Optional[str] = None, ttft_ms: Optional[float] = None) -> None:
+        with self.lock:
+            self.latency[endpoint].append(ms)
+            if ttft_ms is not None:
+                self.ttft.append(ttft_ms)
+            if error is None:
+                self.ok[endpoint] += 1
+            else:
+                self.errors[endpoint][error] = self.errors[endpoint].get(error, 0) + 1
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid: int, interval_s: float):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval_s = interval_s
+        self.samples: List[List[float]] = []     # [elapsed_s, rss_mb]
+        self._halt = threading.Event()
+        self._t0 = time.monotonic()
+
+    def run(self) -> None:
+        while not self._halt.is_set():
+            rss = read_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append([round(time.monotonic() - self._t0, 1), round(rss, 1)])
+            self._halt.wait(self.interval_s)
+
+    def stop(self) -> None:
+        self._halt.set()
+        self.join()
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.samples:
+            return {"pid": self.pid, "samples": []}
+        xs = [s[0] for s in self.samples]
+        ys = [s[1] for s in self.samples]
+        # least-squares slope: a steady climb over a soak run is a leak
+        n = len(xs)
+        mx, my = sum(xs) / n, sum(ys) / n
+        var = sum((x - mx) ** 2 for x in xs)
+        slope = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var > 0 else 0.0
+        return {
+            "pid": self.pid,
+            "start_mb": ys[0],
+            "end_mb": ys[-1],
+            "max_mb": max(ys),
+            "growth_mb": round(ys[-1] - ys[0], 1),
+            "slope_mb_per_hour": round(slope * 3600.0, 1),
+            "samples": self.samples,
+        }
+
+
+# ---------------------------------------------------------------------------
+# requests
+# ---------------------------------------------------------------------------
+
+class Driver:
+    def __init__(self, args: argparse.Namespace, rec: Recorder):
+        self.args = args
+        self.rec = rec
+        self.base = args.base.rstrip("/")
+        self.local = threading.local()
+        self.chunk_ids: List[str] = []
+
+    def session(self) -> requests.Session:
+        s = getattr(self.local, "session", None)
+        if s is None:
+            s = self.local.session = requests.Session()
+            if self.args.api_key:
+                s.headers["X-API-Key"] = self.args.api_key
+        return s
+
+    def _timed(self, endpoint: str, fn) -> None:
+        t0 = time.perf_counter()
+        error, ttft = None, None
+        try:
+            error, ttft = fn(t0)
+        except requests.RequestException as e:
+            error = type(e).__name__
+        self.rec.record(endpoint, (time.perf_counter() - t0) * 1000.0, error, ttft)
+
+    def ask(self, query: str) -> None:
+        def call(t0):
+            r = self.session().post(
+                f"{self.base}/ask-kb",
+                json={"kb_id": self.args.kb_id, "query": query},
+                timeout=self.args.timeout,
+            )
+            if r.status_code != 200:
+                return f"http_{r.status_code}", None
+            for cid in (r.json().get("source_map") or {}).values():
+                if len(self.chunk_ids) < 200 and cid not in self.chunk_ids:
+                    self.chunk_ids.append(cid)
+            return None, None
+        self._timed("ask", call)
+
+    def stream(self, query: str) -> None:
+        def call(t0):
+            ttft = None
+            event = None
+            with self.session().post(
+                f"{self.base}/ask-kb-stream",
+                params={"kb_id": self.args.kb_id, "query": query},
+                stream=True,
+                timeout=self.args.timeout,
+            ) as r:
+                if r.status_code != 200:
+                    return f"http_{r.status_code}", None
+                for line in r.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("event:"):
+                        continue
+                    event = line.split(":", 1)[1].strip()
+                    if event == "token" and ttft is None:
+                        ttft = (time.perf_counter() - t0) * 1000.0
+                    elif event == "error":
+                        return "sse_error", ttft
+            return (None if event == "done" else "sse_incomplete"), ttft
+        self._timed("stream", call)
+
+    def chunk(self, rng: random.Random) -> None:
+        if not self.chunk_ids:
+            return self.ask(rng.choice(self.args.queries))
+
+        def call(t0):
+            r = self.session().get(
+                f"{self.base}/kb/chunk",
+                params={"kb_id": self.args.kb_id, "chunk_id": rng.choice(self.chunk_ids), "include_content": "true"},
+                timeout=self.args.timeout,
+            )
+            return (None if r.status_code == 200 else f"http_{r.status_code}"), None
+        self._timed("chunk", call)
+
+    def ingest(self) -> None:
+        def call(t0):
+            with open(self.args.pdf, "rb") as f:
+                r = self.session().post(
+                    f"{self.base}/ingest",
+                    params={"kb_id": self.args.ingest_kb_id, "mode": "overwrite"},
+                    files={"file": (os.path.basename(self.args.pdf), f, "application/pdf")},
+                    timeout=self.args.timeout,
+                )
+            return (None if r.status_code == 200 else f"http_{r.status_code}"), None
+        self._timed("ingest", call)
+
+    def one(self, endpoint: str, rng: random.Random) -> None:
+        if endpoint == "ask":
+            self.ask(rng.choice(self.args.queries))
+        elif endpoint == "stream":
+            self.stream(rng.choice(self.args.queries))
+        elif endpoint == "chunk":
+            self.chunk(rng)
+        elif endpoint == "ingest":
+            self.ingest()
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"unknown endpoint in --mix: {name!r} (expected one of {ENDPOINTS})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise SystemExit("--mix must give at least one positive weight")
+    return mix
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    driver = Driver(args, Recorder())
+    names = list(args.mix)
+    weights = [args.mix[n] for n in names]
+
+    # warm up (and collect chunk_ids for /kb/chunk), then measure from scratch
+    for q in args.queries[: args.warmup]:
+        driver.ask(q)
+    rec = driver.rec = Recorder()
+
+    sampler = RssSampler(args.pid, args.rss_interval) if args.pid else None
+    if sampler:
+        sampler.start()
+
+    deadline = time.monotonic() + args.duration
+    def worker(index: int) -> None:
+        # one generator per worker: with --seed each worker replays the same picks
+        # (endpoint, query, chunk) whatever the thread scheduling
+        rng = random.Random(None if args.seed is None else args.seed + index)
+        while time.monotonic() < deadline:
+            driver.one(rng.choices(names, weights)[0], rng)
+
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for f in [pool.submit(worker, i) for i in range(args.concurrency)]:
+            f.result()
+    wall_s = time.monotonic() - t0
+
+    if sampler:
+        sampler.stop()
+
+    endpoints = {}
+    total = total_err = 0
+    for e in names:
+        n_err = sum(rec.errors[e].values())
+        n = rec.ok[e] + n_err
+        total += n
+        total_err += n_err
+        endpoints[e] = {
+            "requests": n,
+            "rps": round(n / wall_s, 2),
+            "error_rate": round(n_err / n, 4) if n else 0.0,
+            "errors": rec.errors[e],
+            "latency_ms": summarize_ms(rec.latency[e]),
+        }
+
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "base": args.base,
+            "kb_id": args.kb_id,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "mix": args.mix,
+        },
+        "wall_s": round(wall_s, 1),
+        "total_requests": total,
+        "rps": round(total / wall_s, 2),
+        "error_rate": round(total_err / total, 4) if total else 0.0,
+        "endpoints": endpoints,
+        "stream_ttft_ms": summarize_ms(rec.ttft),
+        "rss": sampler.summary() if sampler else None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# baseline comparison
+# ---------------------------------------------------------------------------
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    failures = []
+
+    def slower(name: str, cur: Optional[float], base: Optional[float]) -> None:
+        if cur is None or not base:
+            return
+        if cur > base * (1.0 + args.max_latency_regression):
+            failures.append(f"{name}: {cur:.1f} ms vs baseline {base:.1f} ms (> +{args.max_latency_regression:.0%})")
+
+    for e, cur in report["endpoints"].items():
+        base = (baseline.get("endpoints") or {}).get(e)
+        if not base:
+            continue
+        for p in ("p50", "p95", "p99"):
+            slower(f"{e} {p}", cur["latency_ms"][p], base["latency_ms"].get(p))
+        if cur["error_rate"] > base.get("error_rate", 0.0) + args.max_error_rate_increase:
+            failures.append(f"{e} error_rate: {cur['error_rate']:.2%} vs baseline {base.get('error_rate', 0.0):.2%}")
+
+    for p in ("p50", "p95"):
+        slower(f"stream ttft {p}", report["stream_ttft_ms"][p], (baseline.get("stream_ttft_ms") or {}).get(p))
+
+    base_rps = baseline.get("rps")
+    if base_rps and report["rps"] < base_rps * (1.0 - args.max_rps_drop):
+        failures.append(f"throughput: {report['rps']} rps vs baseline {base_rps} rps (> -{args.max_rps_drop:.0%})")
+
+    rss = report.get("rss") or {}
+    if args.max_rss_growth_mb is not None and rss.get("growth_mb") is not None and rss["growth_mb"] > args.max_rss_growth_mb:
+        failures.append(f"rss growth: {rss['growth_mb']} MB > {args.max_rss_growth_mb} MB")
+    return failures
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--base", default=os.getenv("BASE", "http://127.0.0.1:8000"))
+    ap.add_argument("--kb-id", default=os.getenv("KB_ID", "demo"))
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds")
+    ap.add_argument("--mix", type=parse_mix, default=parse_mix("ask=6,stream=3,chunk=1"),
+                    help="endpoint weights, e.g. ask=6,stream=3,chunk=1,ingest=0")
+    ap.add_argument("--queries", type=Path, help="JSON list of queries (default: built-in mix)")
+    ap.add_argument("--pdf", help="PDF uploaded by the ingest workload")
+    ap.add_argument("--ingest-kb-id", default="loadtest_ingest", help="KB the ingest workload overwrites")
+    ap.add_argument("--api-key", help="sent as X-API-Key (admission tenant)")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=None, help="seeds endpoint, query and chunk choices (worker i uses seed + i)")
+    ap.add_argument("--pid", type=int, help="server PID to sample RSS from (/proc/<pid>/status)")
+    ap.add_argument("--pid-file", default="/tmp/rag_server.pid")
+    ap.add_argument("--rss-interval", type=float, default=5.0, help="seconds between RSS samples")
+    ap.add_argument("--out", type=Path, help="report path (default: storage/loadtest/run_<ts>.json)")
+    ap.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    ap.add_argument("--max-latency-regression", type=float, default=0.25, help="allowed p50/p95/p99 increase (fraction)")
+    ap.add_argument("--max-error-rate-increase", type=float, default=0.01)
+    ap.add_argument("--max-rps-drop", type=float, default=0.2)
+    ap.add_argument("--max-rss-growth-mb", type=float, default=None)
+    args = ap.parse_args()
+
+    args.queries = json.loads(args.queries.read_text(encoding="utf-8")) if args.queries else DEFAULT_QUERIES
+    if args.mix.get("ingest") and not args.pdf:
+        ap.error("--pdf is required when the mix includes ingest")
+    if args.pid is None and os.path.exists(args.pid_file):
+        try:
+            args.pid = int(Path(args.pid_file).read_text().strip())
+        except ValueError:
+            pass
+
+    report = run(args)
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out = args.out or OUT_DIR / f"run_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"== load test: {report['total_requests']} requests in {report['wall_s']}s "
+          f"({report['rps']} rps, errors {report['error_rate']:.2%}) ==")
+    for e, s in report["endpoints"].items():
+        lat = s["latency_ms"]
+        print(f"  {e:7s} n={s['requests']:<6d} rps={s['rps']:<7} err={s['error_rate']:.2%} "
+              f"p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} ms")
+    if report["stream_ttft_ms"]["count"]:
+        t = report["stream_ttft_ms"]
+        print(f"  ttft    p50={t['p50']} p95={t['p95']} ms")
+    if report["rss"] and report["rss"].get("samples"):
+        r = report["rss"]
+        print(f"  rss     {r['start_mb']} -> {r['end_mb']} MB (max {r['max_mb']}, {r['slope_mb_per_hour']} MB/h)")
+    print(f"[OK] Wrote report: {out}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[OK] Saved baseline: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"[WARN] No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    failures = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args)
+    if failures:
+        print("== regressions vs baseline ❌ ==")
+        for f in failures:
+            print(f"  - {f}")
+        return 1
+    print("== no regressions vs baseline ✅ ==")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Start a local server with the offline LLM backend, run the load test against it,
+# then stop the server. Extra args go to scripts/loadtest.py, e.g.:
+#   scripts/loadtest.sh --duration 60 --concurrency 16
+#   scripts/loadtest.sh --save-baseline
+#   DURATION=3600 scripts/loadtest.sh --max-rss-growth-mb 100     # soak
+
+export KB_STORAGE_DIR="${KB_STORAGE_DIR:-$(pwd)/storage}"
+export PYTHONPATH="$(pwd)/backend"
+export LLM_BACKEND="${LLM_BACKEND:-fake}"
+export FAKE_LLM_SEED="${FAKE_LLM_SEED:-7}"
+
+PORT="${PORT:-8010}"
+BASE="http://127.0.0.1:$PORT"
+DURATION="${DURATION:-30}"
+
+if [ -d "venv" ]; then
+    source venv/bin/activate
+fi
+
+python -m uvicorn app.main:app --host 127.0.0.1 --port "$PORT" > /tmp/rag_loadtest_server.log 2>&1 &
+SERVER_PID=$!
+trap 'kill $SERVER_PID 2>/dev/null || true' EXIT
+
+echo "Starting server with PID: $SERVER_PID (LLM_BACKEND=$LLM_BACKEND)"
+for i in {1..60}; do
+  if curl -s "$BASE/health" | grep -q "ok"; then
+    break
+  fi
+  if [ "$i" -eq 60 ]; then
+    echo "Server failed to start in 60s (see /tmp/rag_loadtest_server.log)"
+    exit 1
+  fi
+  sleep 1
+done
+
+python scripts/loadtest.py --base "$BASE" --pid "$SERVER_PID" --duration "$DURATION" "$@"
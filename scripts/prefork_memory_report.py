@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory of `uvicorn --workers N` against `python -m app.prefork`
+(models and KBs loaded once, then forked). Each server is started, warmed
+with /ask-kb requests (LLM_BACKEND=fake), and then every worker's
+/proc/<pid>/smaps_rollup is read:
+  USS  private pages, i.e. the real cost of one more worker
+  PSS  shared pages split evenly among the processes that map them
+  RSS  all mapped pages (counts shared pages once per worker)
+
+    PYTHONPATH=backend python scripts/prefork_memory_report.py --workers 4 --kb-id demo
+    KB_INDEX_MMAP=1 PYTHONPATH=backend python scripts/prefork_memory_report.py --pdf docs/plan.pdf
+"""
+from __future__ import annotations
+
+import argparse
+import inspect
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import requests
+import uvicorn
+
+from app.services.proc_memory import process_memory
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+OUT_PATH = PROJECT_ROOT / "storage" / "eval_results" / "prefork_memory.json"
+
+QUERIES = [
+    "What is the plan for?",
+    "What is the focus of week 2?",
+    "How are errors handled?",
+]
+
+
+def children_of(pid: int) -> List[int]:
+    out: List[int] = []
+    task_dir = f"/proc/{pid}/task"
+    for tid in os.listdir(task_dir):
+        try:
+            with open(f"{task_dir}/{tid}/children", encoding="utf-8") as f:
+                out.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return out
+
+
+def is_helper(pid: int) -> bool:
+    # multiprocessing's resource_tracker is a child of uvicorn's supervisor but serves no requests
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return b"resource_tracker" in f.read()
+    except OSError:
+        return True
+
+
+def wait_healthy(base: str, timeout_s: float = 180.0) -> None:
+    t0 = time.time()
+    while time.time() - t0 < timeout_s:
+        try:
+            if requests.get(f"{base}/health", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"server at {base} did not start in {timeout_s:.0f}s")
+
+
+def measure(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    base = f"http://127.0.0.1:{args.port}"
+    pythonpath = os.pathsep.join(p for p in (str(PROJECT_ROOT / "backend"), os.getenv("PYTHONPATH", "")) if p)
+    env = {**os.environ, "LLM_BACKEND": "fake", "PYTHONPATH": pythonpath}
+    if mode == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--workers", str(args.workers)]
+        if "timeout_worker_healthcheck" in inspect.signature(uvicorn.Config).parameters:
+            # newer supervisors kill workers that are still importing the models after 5s
+            cmd += ["--timeout-worker-healthcheck", "300"]
+    else:
+        cmd = [sys.executable, "-m", "app.prefork", "--port", str(args.port), "--workers", str(args.workers),
+               "--preload", args.kb_id]
+    proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT / "backend", env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        wait_healthy(base)
+        if args.pdf:
+            with open(args.pdf, "rb") as f:
+                requests.post(f"{base}/ingest", params={"kb_id": args.kb_id, "mode": "overwrite"},
+                              files={"file": (os.path.basename(args.pdf), f, "application/pdf")}, timeout=600)
+        ok = 0
+        for i in range(args.requests):
+            r = requests.post(f"{base}/ask-kb", json={"kb_id": args.kb_id, "query": QUERIES[i % len(QUERIES)]},
+                              timeout=120)
+            ok += int(r.status_code == 200)
+        time.sleep(1.0)
+
+        workers = [w for w in children_of(proc.pid) if not is_helper(w)]
+        per_worker = [{"pid": w, **process_memory(w)} for w in workers]
+        parent = process_memory(proc.pid)
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+
+    def total(key: str) -> float:
+        return round(sum(w.get(key, 0.0) for w in per_worker), 1)
+
+    return {
+        "mode": mode,
+        "workers": per_worker,
+        "parent": parent,
+        "requests_ok": ok,
+        "uss_total_mb": total("uss_mb"),
+        "pss_total_mb": round(total("pss_mb") + parent.get("pss_mb", 0.0), 1),
+        "rss_total_mb": total("rss_mb"),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--port", type=int, default=8077)
+    ap.add_argument("--kb-id", default="demo")
+    ap.add_argument("--pdf", help="ingest this PDF into --kb-id first (overwrite)")
+    ap.add_argument("--requests", type=int, default=20, help="warm-up /ask-kb requests per server")
+    ap.add_argument("--out", type=Path, default=OUT_PATH)
+    args = ap.parse_args()
+
+    runs = [measure(mode, args) for mode in ("uvicorn", "prefork")]
+
+    print(f"== per-worker memory, {args.workers} workers (MB) ==")
+    print(f"{'mode':8s} {'pid':>7s} {'USS':>8s} {'PSS':>8s} {'RSS':>8s} {'shared':>8s}")
+    for run in runs:
+        for w in run["workers"]:
+            print(f"{run['mode']:8s} {w['pid']:>7d} {w.get('uss_mb', 0):>8.1f} {w.get('pss_mb', 0):>8.1f} "
+                  f"{w.get('rss_mb', 0):>8.1f} {w.get('shared_mb', 0):>8.1f}")
+    print()
+    for run in runs:
+        print(f"{run['mode']:8s} USS total {run['uss_total_mb']:>8.1f}  PSS total (incl. parent) "
+              f"{run['pss_total_mb']:>8.1f}  ok={run['requests_ok']}/{args.requests}")
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps({"workers": args.workers, "kb_id": args.kb_id, "runs": runs}, indent=2),
+                        encoding="utf-8")
+    print(f"[OK] Wrote report: {args.out}")
+
+
+if __name__ == "__main__":
+    main()